@@ -7,6 +7,12 @@ load_dotenv(find_dotenv())
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
 
 from llm_application.azure_information_assistant_accelerator.wrapper import RAG_from_scratch
+from llm_application.ledger import RequestLedger
+from llm_application.transport import Transport
+from util.checkpoint import Checkpoint
+from util.export import export_results
+from util.runner import EvaluationRunner
+from util.report import write_report
 from kjr_llm.targets import CustomTarget
 from kjr_llm.app import App
 from kjr_llm.tests import TestSet
@@ -34,11 +40,22 @@ full_path = os.path.join(current_file_dir, 'config-4b.json')
 with open(full_path, 'r') as file:
     config_b = json.load(file)
 
-rag_chain_a = RAG_from_scratch(config_data=config_a)
-rag_chain_b = RAG_from_scratch(config_data=config_b)
+# Run with --resume to continue an interrupted run from its checkpoints
+resume = "--resume" in sys.argv
+checkpoint_a = Checkpoint(os.path.join(current_file_dir, 'checkpoints', 'Exercise4a'))
+checkpoint_b = Checkpoint(os.path.join(current_file_dir, 'checkpoints', 'Exercise4b'))
 
-# Set up the test application
-app = App(app_name="RAG_Application", reset_database=True)
+# Endpoint responses are journaled so they are replayed instead of re-requested on resume
+rag_chain_a = RAG_from_scratch(config_data=config_a, transport=Transport(journal=checkpoint_a.journal()))
+rag_chain_b = RAG_from_scratch(config_data=config_b, transport=Transport(journal=checkpoint_b.journal()))
+
+# Request and response bytes of both endpoints, per TestSet and prompt, for accounting.json
+ledger = RequestLedger()
+rag_chain_a.ledger = ledger
+rag_chain_b.ledger = ledger
+
+# Set up the test application, keeping the results of the interrupted run when resuming
+app = App(app_name="RAG_Application", reset_database=not resume)
 #app_b = App(app_name="RAG_Application B", reset_database=True)
 
 # Define the target of our tests
@@ -46,11 +63,8 @@ target_a: Target = CustomTarget(rag_chain_a)
 target_b: Target = CustomTarget(rag_chain_b)
 
 # Load our custom inputs - change the name of this file if you have prepared another prompts.
-full_path = os.path.join(current_file_dir, 'relevance-4a.json')
-prompts_a = PromptSet.from_json_file(full_path)
-
-full_path = os.path.join(current_file_dir, 'relevance-4b.json')
-prompts_b = PromptSet.from_json_file(full_path)
+prompts_file_a = os.path.join(current_file_dir, 'relevance-4a.json')
+prompts_file_b = os.path.join(current_file_dir, 'relevance-4b.json')
 
 # Import and instantiate feedback metrics
 query_path = Select.Record.app.query.args.query
@@ -58,30 +72,40 @@ context_path = Select.Record.app.retrieve.rets[:]
 
 # Using custom TestSet
 # comment and uncomment the feedback you wish to evaluate
-feedbacks_a = [
-    Groundedness(context_path),
-    ContextRelevance(query_path, context_path),
-    AnswerRelevance(),
-    GroundTruthAgreement(prompts_a)
-]
-
-feedbacks_b = [
-    Groundedness(context_path),
-    ContextRelevance(query_path, context_path),
-    AnswerRelevance(),
-    GroundTruthAgreement(prompts_b)
-]
-
-# Define our test set
-custom_test_a = TestSet(prompts_a, feedbacks_a, name="Exercise4a-openai", default_provider=OpenAIProvider(model_name="gpt-3.5-turbo"))
-custom_test_b = TestSet(prompts_b, feedbacks_b, name="Exercise4b-openai", default_provider=OpenAIProvider(model_name="gpt-3.5-turbo"))
-
-# Evaluate our test set
-result_a = custom_test_a.evaluate(target_a, "Exercise4a")
-result_b = custom_test_b.evaluate(target_b, "Exercise4b")
-
-# Run the test dashboard to evaluate results
-app.run_dashboard()
-
+def feedbacks(prompts):
+    return [
+        Groundedness(context_path),
+        ContextRelevance(query_path, context_path),
+        AnswerRelevance(),
+        GroundTruthAgreement(prompts)
+    ]
+
+# Define our test sets, built for each checkpointed chunk of prompts
+def custom_test_a(prompts):
+    return TestSet(prompts, feedbacks(prompts), name="Exercise4a-openai", default_provider=OpenAIProvider(model_name="gpt-3.5-turbo"))
+
+def custom_test_b(prompts):
+    return TestSet(prompts, feedbacks(prompts), name="Exercise4b-openai", default_provider=OpenAIProvider(model_name="gpt-3.5-turbo"))
+
+# Evaluate our test sets, progress is checkpointed every chunk_size prompts
+runner_a = EvaluationRunner(target_a, custom_test_a, "Exercise4a", chunk_size=10, checkpoint=checkpoint_a, resume=resume)
+runner_b = EvaluationRunner(target_b, custom_test_b, "Exercise4b", chunk_size=10, checkpoint=checkpoint_b, resume=resume)
+with ledger.suite("Exercise4a"):
+    result_a = runner_a.run(prompts_file_a)
+with ledger.suite("Exercise4b"):
+    result_b = runner_b.run(prompts_file_b)
+
+# For large suites, pass context_database="default.sqlite" to the runners to store each
+# retrieved context once, the export still gets the full text. Open the dashboard with
+# the full text, instead of --dashboard, with:
+# python -m util.context_dedup dashboard default.sqlite
+
+# Export the results with their token, byte and cost accounting (accounting.json),
+# and write a static report to report/report.html
+export_results(app, result_a + result_b, ledger=ledger)
+print(f"Report written to {write_report()}")
+
+# Run the test dashboard to evaluate results, with: python <this script> --dashboard
 # To stop the dashboard you can use close the terminal or ctrl + c to interrupt the terminal.
-app.export_result_to_file([result_a]+[result_b])
+if "--dashboard" in sys.argv:
+    app.run_dashboard()
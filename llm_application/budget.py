@@ -0,0 +1,152 @@
+import threading
+import time
+import types
+
+# Run-level budgets: wall clock, endpoint requests, judge calls and judge cost.
+# One RunBudget is shared by the wrapper's Transport, the judge provider and the
+# EvaluationRunner. Once a budget is spent it cancels the run: new endpoint
+# requests and judge calls raise BudgetExceeded, streamed responses stop
+# reading, request timeouts never extend past the deadline, and the runner
+# starts no new chunks and reports the run as partial. Endpoint requests in
+# flight when the budget is spent are aborted by the Transport (see on_cancel).
+#
+# trulens records a refused judge call as a failed feedback result instead of
+# raising it. A chunk that completes is kept and checkpointed either way, the
+# runner only cancels the chunks that had not completed.
+#
+# How to use
+# budget = RunBudget(wall_clock=30 * 60, cost=20.0)
+# rag_chain = RAG_from_scratch(config_data=config, transport=Transport(budget=budget))
+# provider = budget_provider(OpenAIProvider(model_name="gpt-3.5-turbo"), budget)
+# runner = EvaluationRunner(target, make_test, "Exercise4a", budget=budget)
+# results = runner.run(prompts_file)
+# print(runner.report)
+
+
+class BudgetExceeded(Exception):
+    def __str__(self):
+        # "quota" keeps trulens from retrying judge calls refused by the budget (its _RE_NO_RETRY)
+        return f"run budget quota spent: {super().__str__()}"
+
+
+class RunBudget:
+    def __init__(self, wall_clock=None, requests=None, judge_calls=None, cost=None):
+        self.wall_clock = wall_clock # seconds
+        self.max_requests = requests # endpoint requests
+        self.max_judge_calls = judge_calls
+        self.max_cost = cost # judge cost in USD, as recorded by trulens
+        self._lock = threading.Lock()
+        self._cancelled = threading.Event()
+        self._callbacks = []
+        self._timer = None
+        self.reason = None
+        self.deadline = None
+        self.requests = 0
+        self.judge_calls = 0
+        self.cost = 0.0
+
+    def start(self):
+        if self.wall_clock is not None and self.deadline is None:
+            self.deadline = time.monotonic() + self.wall_clock
+            # Cancel at the deadline even when nothing checks the budget, so requests in flight are aborted
+            self._timer = threading.Timer(self.wall_clock, self._expire)
+            self._timer.daemon = True
+            self._timer.start()
+        return self
+
+    def _expire(self):
+        self.cancel(f"wall clock budget of {self.wall_clock}s spent")
+
+    def on_cancel(self, callback):
+        # callback(reason) is called once when the budget is spent, right away if it already is
+        with self._lock:
+            if self.reason is None:
+                self._callbacks.append(callback)
+                return
+            reason = self.reason
+        callback(reason)
+
+    @property
+    def cancelled(self):
+        if not self._cancelled.is_set() and self.deadline is not None and time.monotonic() >= self.deadline:
+            self.cancel(f"wall clock budget of {self.wall_clock}s spent")
+        return self._cancelled.is_set()
+
+    def cancel(self, reason):
+        with self._lock:
+            callbacks = []
+            if self.reason is None:
+                self.reason = reason
+                callbacks, self._callbacks = self._callbacks, []
+        self._cancelled.set()
+        if self._timer is not None:
+            self._timer.cancel()
+        for callback in callbacks:
+            callback(self.reason)
+
+    def check(self):
+        if self.cancelled:
+            raise BudgetExceeded(self.reason)
+
+    def remaining(self):
+        # Seconds until the deadline, None without a wall clock budget
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def timeout(self, timeout):
+        # Request timeout capped at the time left
+        remaining = self.remaining()
+        if remaining is None:
+            return timeout
+        return remaining if timeout is None else min(timeout, remaining)
+
+    def charge_request(self):
+        self.check()
+        with self._lock:
+            self.requests += 1
+            spent = self.max_requests is not None and self.requests > self.max_requests
+        if spent:
+            self.cancel(f"request budget of {self.max_requests} spent")
+            raise BudgetExceeded(self.reason)
+
+    def charge_judge_call(self):
+        self.check()
+        with self._lock:
+            self.judge_calls += 1
+            spent = self.max_judge_calls is not None and self.judge_calls > self.max_judge_calls
+        if spent:
+            self.cancel(f"judge call budget of {self.max_judge_calls} spent")
+            raise BudgetExceeded(self.reason)
+
+    def set_cost(self, cost):
+        with self._lock:
+            self.cost = cost
+        if self.max_cost is not None and cost >= self.max_cost:
+            self.cancel(f"cost budget of ${self.max_cost} spent")
+
+    def metrics(self):
+        with self._lock:
+            return {
+                "cancelled": self._cancelled.is_set(),
+                "reason": self.reason,
+                "requests": self.requests,
+                "judge_calls": self.judge_calls,
+                "cost": self.cost,
+                "remaining_seconds": self.remaining(),
+            }
+
+
+def budget_provider(provider, budget, method_name="_create_chat_completion"):
+    # Charge every judge completion to the budget, refusing them once it is spent
+    original = getattr(provider, method_name, None)
+    if original is None:
+        raise TypeError(f"{type(provider).__name__} has no {method_name} method to budget")
+
+    def budgeted(self, *args, **kwargs):
+        budget.charge_judge_call()
+        return original(*args, **kwargs)
+
+    # Providers are pydantic models, so bypass their attribute validation
+    object.__setattr__(provider, method_name, types.MethodType(budgeted, provider))
+    return provider
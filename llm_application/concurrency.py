@@ -0,0 +1,171 @@
+import math
+import threading
+import time
+import types
+from collections import deque
+from contextlib import contextmanager
+
+# AIMD (additive increase, multiplicative decrease) concurrency limiter.
+# The limit grows by `increase` after every round of successful requests while
+# p95 latency stays close to its baseline, and is multiplied by `backoff` when
+# the endpoint throttles (429), fails (5xx, timeouts) or latency spikes.
+# After backing off the baseline is measured again, so a lasting change in
+# latency (a slower model, a busier endpoint) becomes the new baseline instead
+# of holding the limit at min_limit.
+#
+# How to use
+# limiter = AdaptiveLimiter(name="rag", initial=4, max_limit=32)
+# rag_chain = RAG_from_scratch(config_data=config, transport=Transport(limiter=limiter))
+# judge = limit_provider(OpenAIProvider(model_name="gpt-3.5-turbo"), AdaptiveLimiter(name="judge"))
+# print(limiter.metrics())
+
+THROTTLE_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+def percentile(values, q):
+    # Nearest-rank percentile, q between 0 and 100
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(q / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+class _Slot:
+    def __init__(self):
+        self.throttled = False
+
+
+class AdaptiveLimiter:
+    def __init__(self, name="", initial=4, min_limit=1, max_limit=64, increase=1, backoff=0.5,
+                 window=50, latency_tolerance=1.5):
+        self.name = name
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.increase = increase
+        self.backoff = backoff
+        self.latency_tolerance = latency_tolerance # p95 above baseline * tolerance counts as a spike
+        self._latencies = deque(maxlen=window)
+        self._baseline = None
+        self._round_successes = 0
+        self._last_decrease = 0.0
+        self._inflight = 0
+        self._cond = threading.Condition()
+        self.throttled = 0
+        self.decreases = 0
+        self.history = [(time.time(), self.limit)]
+
+    @property
+    def current_limit(self):
+        return max(self.min_limit, int(self.limit))
+
+    def acquire(self):
+        with self._cond:
+            while self._inflight >= self.current_limit:
+                self._cond.wait()
+            self._inflight += 1
+
+    def release(self, latency, throttled=False):
+        with self._cond:
+            self._inflight -= 1
+            if throttled:
+                self.throttled += 1
+                self._decrease(latency)
+            else:
+                self._latencies.append(latency)
+                self._round_successes += 1
+                # One round is roughly one request per permitted slot
+                if self._round_successes >= self.current_limit:
+                    self._round_successes = 0
+                    self._adjust()
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self):
+        # Set slot.throttled = True inside the block to report throttling without raising
+        self.acquire()
+        slot = _Slot()
+        start = time.monotonic()
+        try:
+            yield slot
+        except Exception:
+            self.release(time.monotonic() - start, throttled=True)
+            raise
+        except BaseException:
+            # Cancellation is not a signal about the endpoint
+            self.release(time.monotonic() - start)
+            raise
+        self.release(time.monotonic() - start, throttled=slot.throttled)
+
+    def _adjust(self):
+        p95 = percentile(self._latencies, 95)
+        if self._baseline is None:
+            self._baseline = p95
+        elif p95 > self._baseline * self.latency_tolerance:
+            self._decrease(p95)
+            return
+        else:
+            # Let the baseline follow slow drift while latency is stable
+            self._baseline = 0.9 * self._baseline + 0.1 * p95
+        self._set_limit(min(self.max_limit, self.limit + self.increase))
+
+    def _decrease(self, latency):
+        # Requests already in flight when the limit dropped report the same
+        # condition, so only back off once per observed latency period
+        now = time.monotonic()
+        if now - self._last_decrease < max(latency, 0.1):
+            return
+        self._last_decrease = now
+        self.decreases += 1
+        self._round_successes = 0
+        # The next round sets a new baseline from latencies seen at the lower limit
+        self._baseline = None
+        self._latencies.clear()
+        self._set_limit(max(self.min_limit, self.limit * self.backoff))
+
+    def _set_limit(self, limit):
+        if int(limit) != int(self.limit):
+            self.history.append((time.time(), limit))
+        self.limit = limit
+
+    def metrics(self):
+        with self._cond:
+            return {
+                "name": self.name,
+                "limit": self.current_limit,
+                "inflight": self._inflight,
+                "p95_latency": percentile(self._latencies, 95),
+                "baseline_p95_latency": self._baseline,
+                "throttled": self.throttled,
+                "decreases": self.decreases,
+            }
+
+
+def _is_throttle_error(error):
+    text = f"{type(error).__name__} {error}"
+    return "RateLimit" in text or "429" in text or "Timeout" in text
+
+
+def limit_provider(provider, limiter, method_name="_create_chat_completion"):
+    # Route a judge provider's completion calls through the limiter.
+    # trulens LLM providers send every feedback request through _create_chat_completion.
+    original = getattr(provider, method_name, None)
+    if original is None:
+        raise TypeError(f"{type(provider).__name__} has no {method_name} method to limit")
+
+    def limited(self, *args, **kwargs):
+        limiter.acquire()
+        start = time.monotonic()
+        throttled = False
+        try:
+            return original(*args, **kwargs)
+        except Exception as e:
+            throttled = _is_throttle_error(e)
+            raise
+        finally:
+            limiter.release(time.monotonic() - start, throttled=throttled)
+
+    # Providers are pydantic models, so bypass their attribute validation
+    object.__setattr__(provider, method_name, types.MethodType(limited, provider))
+    return provider
@@ -0,0 +1,68 @@
+import json
+import threading
+from contextlib import contextmanager
+
+# Byte accounting of the RAG endpoint requests, per TestSet and prompt.
+# The ledger records the request and response bytes of every request the engine
+# makes, and the size of the decoded response, so the overhead of the streamed
+# fragments (response bytes beyond the decoded payload) can be told apart from
+# the payload itself. Replayed responses are counted without wire bytes.
+#
+# How to use
+# ledger = RequestLedger()
+# rag_chain.ledger = ledger
+# with ledger.suite("Exercise4a"):  # the app id the requests are made for
+#     result = custom_test.evaluate(target, "Exercise4a")
+# print(ledger.totals())
+#
+# Requests made outside of suite(), such as the prompts util.multi_suite prefetches
+# for several TestSets, are recorded under None and counted once by util.accounting.
+
+
+def payload_size(decoded):
+    if hasattr(decoded, 'to_dict'):
+        decoded = decoded.to_dict()
+    return len(json.dumps(decoded).encode('utf-8'))
+
+
+class RequestLedger:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.test_set = None # app id of the TestSet being evaluated, see suite()
+        self.prompts = {} # (test set, prompt) -> accounted totals
+
+    @contextmanager
+    def suite(self, test_set):
+        # Record the requests made inside under test_set, TestSets are evaluated one at a time
+        previous, self.test_set = self.test_set, test_set
+        try:
+            yield self
+        finally:
+            self.test_set = previous
+
+    def record(self, prompt, info, decoded):
+        replayed = bool(info.get("replayed"))
+        request_bytes = 0 if replayed else info.get("request_bytes") or 0
+        response_bytes = 0 if replayed else info.get("response_bytes") or 0
+        payload = 0 if replayed else payload_size(decoded)
+        with self._lock:
+            entry = self.prompts.setdefault((self.test_set, prompt), {
+                "requests": 0, "replayed": 0, "request_bytes": 0, "response_bytes": 0, "payload_bytes": 0,
+            })
+            entry["requests"] += 1
+            entry["replayed"] += replayed
+            entry["request_bytes"] += request_bytes
+            entry["response_bytes"] += response_bytes
+            entry["payload_bytes"] += payload
+
+    def entries(self):
+        with self._lock:
+            return {key: dict(entry, overhead_bytes=max(0, entry["response_bytes"] - entry["payload_bytes"]))
+                    for key, entry in self.prompts.items()}
+
+    def totals(self):
+        totals = {}
+        for entry in self.entries().values():
+            for key, value in entry.items():
+                totals[key] = totals.get(key, 0) + value
+        return totals
@@ -0,0 +1,126 @@
+import atexit
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+# Process-pool tier for the CPU-bound pipeline stages.
+# With concurrent queries, Presidio anonymization and fragment parsing run on the
+# same interpreter as the network I/O and serialise on the GIL. A StagePool runs
+# one stage in worker processes that load their models once, at start. Only the
+# texts a stage needs are sent to the workers and only its output comes back.
+#
+# Enable it from config.json, with the number of worker processes per stage:
+#   "offload": {"pii": 2, "parse": 2}
+# Responses smaller than "offload_min_bytes" (default 64K) are still parsed in
+# process, where parsing is cheaper than sending them to a worker.
+# PII always runs in a single worker: the reversible anonymizer keeps the mapping
+# of entities to placeholders per process, one process keeps it consistent.
+#
+# Clones of an engine (rag_chain.clone()) share its pools. rag_chain.close()
+# stops the worker processes, otherwise they stop when the interpreter exits.
+#
+# print(rag_chain.offload_metrics())  # per-stage utilization and queue wait
+
+
+# Worker side: the stage functions and their preloads run in the worker processes
+
+def preload_anonymizer():
+    from llm_application.engine import get_anonymizer
+    get_anonymizer()
+
+
+def preload_decoders():
+    import llm_application.engine  # noqa: F401
+
+
+def anonymize_texts(texts):
+    from llm_application.engine import get_anonymizer
+    anonymizer = get_anonymizer()
+    return [anonymizer.anonymize(text) if text else text for text in texts]
+
+
+def decode_text(decoder, text):
+    from llm_application.engine import DECODERS
+    return DECODERS[decoder](text)
+
+
+def _timed(function, args, submitted):
+    started = time.time()
+    result = function(*args)
+    return result, started - submitted, time.time() - started
+
+
+STAGES = {
+    "pii": preload_anonymizer,
+    "parse": preload_decoders,
+}
+MAX_WORKERS = {"pii": 1} # one entity mapping for every response
+
+
+class StagePool:
+    def __init__(self, name, workers=2, preload=None):
+        self.name = name
+        self.workers = workers
+        # spawn, forking a process that runs request threads is not safe
+        self._executor = ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+            initializer=preload if preload is not None else STAGES.get(name)
+        )
+        self._lock = threading.Lock()
+        self.tasks = 0
+        self.in_flight = 0
+        self.busy = 0.0 # seconds of worker time spent in the stage
+        self.queue_wait = 0.0 # seconds tasks waited for a free worker
+        self.started = None
+        self.closed = False
+        atexit.register(self.close)
+
+    def run(self, function, *args):
+        # Run function(*args) in a worker and wait for its result
+        with self._lock:
+            if self.started is None:
+                self.started = time.monotonic()
+            self.in_flight += 1
+        try:
+            result, waited, busy = self._executor.submit(_timed, function, args, time.time()).result()
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+        with self._lock:
+            self.tasks += 1
+            self.busy += busy
+            self.queue_wait += max(0.0, waited)
+        return result
+
+    def metrics(self):
+        with self._lock:
+            elapsed = time.monotonic() - self.started if self.started is not None else 0.0
+            return {
+                "stage": self.name,
+                "workers": self.workers,
+                "tasks": self.tasks,
+                "in_flight": self.in_flight,
+                "busy_seconds": self.busy,
+                "utilization": self.busy / (elapsed * self.workers) if elapsed else 0.0,
+                "mean_queue_wait": self.queue_wait / self.tasks if self.tasks else 0.0,
+            }
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        # Registered at exit until closed, which would keep the pool alive
+        atexit.unregister(self.close)
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def build_pools(config):
+    # {"pii": 2, "parse": 2} -> {"pii": StagePool, "parse": StagePool}
+    pools = {}
+    for name, workers in (config or {}).items():
+        if name not in STAGES:
+            raise ValueError(f"Unknown offload stage {name}, expected one of {', '.join(STAGES)}")
+        if workers:
+            pools[name] = StagePool(name, workers=min(workers, MAX_WORKERS.get(name, workers)))
+    return pools
@@ -0,0 +1,219 @@
+import os
+import random
+import re
+import sys
+import threading
+import time
+import zlib
+from collections import Counter
+from contextlib import contextmanager
+from html import escape
+
+# Low-overhead sampling profiler for evaluation runs.
+# A background thread snapshots the Python stacks of the profiled threads every
+# `interval` seconds. Each sample is attributed to a stage (parse, pii, network,
+# recording, feedback, db) from the innermost frame that matches a stage rule,
+# so the report shows where client-side time goes without attaching external tools.
+# Samples of threads blocked in waits are counted as "idle" and left out of the reports,
+# threads blocked reading a socket count as "network".
+#
+# How to use
+# profiler = SamplingProfiler()
+# runner = EvaluationRunner(..., profiler=profiler, profile_directory="profile")  # whole run
+# rag_chain.profiler, rag_chain.profile_rate = profiler, 0.1  # or only a sample of the queries
+# profiler.write_report("profile")
+#
+# The report directory holds, per stage, <stage>.folded (folded stacks, usable with
+# flamegraph.pl or speedscope) and <stage>.svg (flame graph), plus top.txt with the
+# hottest functions by self and total samples.
+
+STAGE_RULES = (
+    ("db", re.compile(r'sqlalchemy|sqlite3|alembic')),
+    ("pii", re.compile(r'presidio|spacy|pii_feedback|:filter_pii$|:get_anonymizer$|:anonymize_texts$')),
+    ("parse", re.compile(r'engine\.py:(decode_\w+|join_streamed_content|split_curly_braces|extract_citations)$|response\.py:')),
+    ("network", re.compile(r'transport\.py:|[/\\](requests|urllib3|httpx|httpcore|ssl|socket)[/\\.]|http[/\\]client')),
+    ("feedback", re.compile(r'trulens[/\\](feedback|providers)|kjr_llm[/\\](metrics|provider)|[/\\]openai[/\\]')),
+    ("recording", re.compile(r'trulens|kjr_llm')),
+)
+IDLE_FUNCTIONS = frozenset(("wait", "_wait_for_tstate_lock", "acquire", "select", "poll", "sleep", "accept"))
+
+
+def classify(frames):
+    # frames from innermost to outermost, as (filename, function) pairs
+    if frames and frames[0][1] in IDLE_FUNCTIONS:
+        return "idle"
+    for filename, function in frames:
+        location = f"{filename}:{function}"
+        for stage, pattern in STAGE_RULES:
+            if pattern.search(location):
+                return stage
+    return "other"
+
+
+class SamplingProfiler:
+    def __init__(self, interval=0.005, max_depth=64):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.samples = Counter() # (stage, folded stack) -> count
+        self._lock = threading.Lock()
+        self._all_threads = 0 # active whole-process profiling sessions
+        self._threads = Counter() # thread ident -> active sessions
+        self._thread = None
+        self._wake = threading.Condition(self._lock) # notified when a session starts
+
+    def start(self, current_thread_only=False):
+        with self._lock:
+            if current_thread_only:
+                self._threads[threading.get_ident()] += 1
+            else:
+                self._all_threads += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._sample_loop, name="sampling-profiler", daemon=True)
+                self._thread.start()
+            self._wake.notify()
+
+    def stop(self, current_thread_only=False):
+        with self._lock:
+            if current_thread_only:
+                ident = threading.get_ident()
+                self._threads[ident] -= 1
+                if self._threads[ident] <= 0:
+                    del self._threads[ident]
+            else:
+                self._all_threads -= 1
+
+    @contextmanager
+    def sampling(self, current_thread_only=False):
+        self.start(current_thread_only)
+        try:
+            yield self
+        finally:
+            self.stop(current_thread_only)
+
+    @staticmethod
+    def should_sample(rate):
+        return rate >= 1 or random.random() < rate
+
+    def _sample_loop(self):
+        own = threading.get_ident()
+        while True:
+            with self._wake:
+                # Nothing to profile, sleep until the next session starts. Checked under
+                # the lock start() notifies with, so a new session is never missed
+                while self._all_threads <= 0 and not self._threads:
+                    self._wake.wait()
+                threads = None if self._all_threads > 0 else set(self._threads)
+            for ident, frame in sys._current_frames().items():
+                if ident == own or (threads is not None and ident not in threads):
+                    continue
+                self._record(frame)
+            time.sleep(self.interval)
+
+    def _record(self, frame):
+        frames = []
+        while frame is not None and len(frames) < self.max_depth:
+            code = frame.f_code
+            frames.append((code.co_filename, code.co_name))
+            frame = frame.f_back
+        stage = classify(frames)
+        stack = ";".join(f"{os.path.basename(filename)}:{function}" for filename, function in reversed(frames))
+        with self._lock:
+            self.samples[(stage, stack)] += 1
+
+    # Reports
+
+    def stage_totals(self, include_idle=False):
+        totals = Counter()
+        with self._lock:
+            for (stage, _), count in self.samples.items():
+                if include_idle or stage != "idle":
+                    totals[stage] += count
+        return totals
+
+    def folded(self, stage=None):
+        # Folded stack lines "frame;frame;frame count", outermost frame first
+        with self._lock:
+            items = sorted(self.samples.items())
+        return [f"{stack} {count}" for (sample_stage, stack), count in items
+                if (stage is None and sample_stage != "idle") or sample_stage == stage]
+
+    def top_functions(self, n=20, stage=None):
+        # Hottest functions as (label, self samples, total samples)
+        self_counts, total_counts = Counter(), Counter()
+        with self._lock:
+            items = list(self.samples.items())
+        for (sample_stage, stack), count in items:
+            if sample_stage == "idle" or (stage is not None and sample_stage != stage):
+                continue
+            labels = stack.split(";")
+            self_counts[labels[-1]] += count
+            for label in set(labels):
+                total_counts[label] += count
+        return [(label, self_counts[label], total_counts[label]) for label, _ in self_counts.most_common(n)]
+
+    def write_report(self, directory, top=20):
+        os.makedirs(directory, exist_ok=True)
+        totals = self.stage_totals()
+        for stage in totals:
+            lines = self.folded(stage)
+            with open(os.path.join(directory, f"{stage}.folded"), 'w', encoding='utf-8') as file:
+                file.write("\n".join(lines) + "\n")
+            with open(os.path.join(directory, f"{stage}.svg"), 'w', encoding='utf-8') as file:
+                file.write(flame_graph_svg(lines, title=f"{stage} ({totals[stage]} samples)"))
+
+        total = sum(totals.values()) or 1
+        report = [f"{sum(totals.values())} samples every {self.interval * 1000:g} ms", "", "Stage          samples      %"]
+        report += [f"{stage:<14} {count:>7} {100 * count / total:>6.1f}" for stage, count in totals.most_common()]
+        report += ["", f"Top {top} functions", "    self   total  function"]
+        report += [f"{own:>8} {cumulative:>7}  {label}" for label, own, cumulative in self.top_functions(top)]
+        for stage, _ in totals.most_common():
+            report += ["", f"[{stage}]"]
+            report += [f"{own:>8} {cumulative:>7}  {label}" for label, own, cumulative in self.top_functions(top, stage)]
+        with open(os.path.join(directory, "top.txt"), 'w', encoding='utf-8') as file:
+            file.write("\n".join(report) + "\n")
+        return os.path.join(directory, "top.txt")
+
+
+def flame_graph_svg(folded_lines, title="", width=1200, row_height=16):
+    # Minimal flame graph: one rectangle per frame, width proportional to its samples
+    root = {"count": 0, "children": {}}
+    for line in folded_lines:
+        stack, _, count = line.rpartition(" ")
+        count = int(count)
+        root["count"] += count
+        node = root
+        for label in stack.split(";"):
+            node = node["children"].setdefault(label, {"count": 0, "children": {}})
+            node["count"] += count
+
+    rects = []
+    depth_max = [0]
+
+    def layout(node, x, depth):
+        depth_max[0] = max(depth_max[0], depth)
+        for label, child in sorted(node["children"].items()):
+            child_width = width * child["count"] / root["count"]
+            if child_width >= 0.5:
+                rects.append((x, depth, child_width, label, child["count"]))
+                layout(child, x, depth + 1)
+            x += child_width
+
+    if root["count"]:
+        layout(root, 0.0, 0)
+    height = (depth_max[0] + 2) * row_height
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" font-family="monospace" font-size="11">',
+        f'<text x="4" y="{row_height - 4}">{escape(title)}</text>',
+    ]
+    for x, depth, rect_width, label, count in rects:
+        # Root frames at the bottom
+        y = height - (depth + 1) * row_height
+        hue = 20 + zlib.crc32(label.encode('utf-8')) % 40
+        text = escape(label[:int(rect_width / 7)]) if rect_width > 21 else ""
+        parts.append(
+            f'<g><title>{escape(label)} ({count} samples)</title>'
+            f'<rect x="{x:.1f}" y="{y}" width="{rect_width:.1f}" height="{row_height - 1}" fill="hsl({hue},90%,60%)"/>'
+            f'<text x="{x + 2:.1f}" y="{y + row_height - 4}">{text}</text></g>'
+        )
+    parts.append('</svg>')
+    return "\n".join(parts)
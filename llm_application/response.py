@@ -0,0 +1,125 @@
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import zlib
+
+# Compact representation of a decoded RAG response.
+# Only the fields the engine reads are kept: the answer, citation indices, the
+# keyword search terms and any error detail. The retrieved data points are kept
+# compressed and decoded only when accessed, or spilled to a content-addressed
+# ContextStore on disk and referenced by hash.
+#
+# This only shrinks the response while the engine holds it: one per worker
+# thread, replaced on its next query, plus the one shared by coalesced callers.
+# It does not bound the memory of a run. The spans trulens records keep their
+# own copy of the contexts returned by retrieve, those are interned in the
+# database by context_dedup.py.
+#
+# Enable it from config.json:
+#   "compact_responses": true,
+#   "context_store": "context_store",  (optional directory for spilled data points)
+#   "spill_threshold": 4096            (bytes of data points above which they are spilled)
+
+
+class ContextStore:
+    # Content-addressed text store: each text is written once, under its sha256
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, digest):
+        return os.path.join(self.directory, digest[:2], digest + '.txt')
+
+    def put(self, text):
+        data = text.encode('utf-8')
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write then rename so concurrent writers never leave a partial file
+            fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+            with os.fdopen(fd, 'wb') as file:
+                file.write(data)
+            os.replace(temp_path, path)
+        return sys.intern(digest)
+
+    def get(self, digest):
+        with open(self._path(digest), 'r', encoding='utf-8') as file:
+            return file.read()
+
+
+class CompactResponse:
+    __slots__ = ("answer", "citations", "thought_chain", "detail", "model", "_packed", "_refs", "_store")
+
+    # Keys readable with response[key], in addition to "data_points"
+    FIELDS = ("answer", "citations", "thought_chain", "detail", "model")
+
+    def __init__(self, answer=None, citations=None, thought_chain=None, detail=None, model=None):
+        self.answer = answer
+        self.citations = citations
+        self.thought_chain = thought_chain
+        self.detail = detail
+        self.model = model
+        self._packed = None
+        self._refs = None
+        self._store = None
+
+    @classmethod
+    def from_dict(cls, response, store=None, spill_threshold=4096):
+        thought_chain = response.get("thought_chain")
+        if thought_chain is not None:
+            # Only the search terms are used, the rest of the chain is dropped
+            thought_chain = {
+                key: thought_chain[key] for key in ("work_query", "work_search_term") if key in thought_chain
+            }
+        compact = cls(
+            answer=response.get("answer"),
+            citations=tuple(response["citations"]) if "citations" in response else None,
+            thought_chain=thought_chain,
+            detail=response.get("detail"),
+            model=sys.intern(response["model"]) if response.get("model") else None,
+        )
+        data_points = response.get("data_points")
+        if data_points is not None:
+            size = sum(len(point) for point in data_points)
+            if store is not None and size > spill_threshold:
+                compact._refs = tuple(store.put(point) for point in data_points)
+                compact._store = store
+            else:
+                compact._packed = zlib.compress(json.dumps(data_points).encode('utf-8'))
+        return compact
+
+    @property
+    def data_points(self):
+        # Decoded on every access, nothing is cached on the response
+        if self._refs is not None:
+            return [self._store.get(digest) for digest in self._refs]
+        if self._packed is not None:
+            return json.loads(zlib.decompress(self._packed))
+        return None
+
+    @property
+    def data_point_refs(self):
+        return self._refs
+
+    # Read-only mapping interface, so the engine can use it like the decoded dict
+
+    def get(self, key, default=None):
+        value = self.data_points if key == "data_points" else getattr(self, key, None) if key in self.FIELDS else None
+        return default if value is None else value
+
+    def __contains__(self, key):
+        if key == "data_points":
+            return self._refs is not None or self._packed is not None
+        return key in self.FIELDS and getattr(self, key) is not None
+
+    def __getitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        return self.get(key)
+
+    def to_dict(self):
+        return {key: self.get(key) for key in self.FIELDS + ("data_points",) if key in self}
@@ -0,0 +1,483 @@
+import hashlib
+import json
+import os
+import socket
+import threading
+import time
+import weakref
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from llm_application.budget import BudgetExceeded
+from llm_application.concurrency import THROTTLE_STATUS_CODES, percentile
+
+# HTTP transport shared by the RAG_from_scratch wrappers.
+# A ResponseJournal can be attached so that successful responses are written
+# to disk and replayed when a run is resumed, instead of calling the endpoint again.
+# An AdaptiveLimiter can be attached to bound the number of concurrent requests
+# and adapt that bound to the endpoint's latency and throttling.
+# With a HedgePolicy, a request slower than the learned latency percentile is
+# duplicated, the first complete response wins and the other is cancelled by
+# shutting down its socket, which frees its thread and its endpoint connection.
+# With a RunBudget, the requests in flight are aborted the same way once it is spent.
+
+
+def body_size(body):
+    # Bytes of a JSON request body as requests serialises it
+    return len(json.dumps(body).encode('utf-8')) if body is not None else 0
+
+
+def request_key(url, body):
+    # Stable key for a request, the same url and body always give the same key
+    canonical = json.dumps([url, body], sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+class BufferedResponse:
+    # Minimal stand-in for requests.Response holding a fully read body,
+    # used for journal replays and streamed responses
+
+    def __init__(self, status_code, text, url=None, replayed=False):
+        self.status_code = status_code
+        self.text = text
+        self.url = url
+        self.replayed = replayed
+
+    @property
+    def ok(self):
+        return self.status_code < 400
+
+    @property
+    def content(self):
+        return self.text.encode('utf-8')
+
+    def json(self):
+        return json.loads(self.text)
+
+
+class ResponseJournal:
+    # Append-only JSON Lines file of {"key", "status_code", "text"} entries.
+    # Only file offsets are kept in memory, response bodies are read back on demand.
+    # With path=None responses are kept in memory for the lifetime of the journal.
+
+    def __init__(self, path=None):
+        self.path = path
+        self._lock = threading.Lock()
+        self._index = {}
+        self._memory = {}
+        if path is not None and os.path.exists(path):
+            self._load_index()
+
+    def _load_index(self):
+        with open(self.path, 'rb') as file:
+            offset = 0
+            for line in file:
+                try:
+                    entry = json.loads(line)
+                    self._index[entry["key"]] = offset
+                except (json.JSONDecodeError, KeyError):
+                    # A partially written last line from an interrupted run
+                    pass
+                offset += len(line)
+
+    def clear(self):
+        # Forget every recorded response and truncate the file
+        with self._lock:
+            self._index.clear()
+            self._memory.clear()
+            if self.path is not None and os.path.exists(self.path):
+                open(self.path, 'wb').close()
+
+    def __contains__(self, key):
+        return key in self._index or key in self._memory
+
+    def __len__(self):
+        return len(self._index) + len(self._memory)
+
+    def get(self, key):
+        if self.path is None:
+            entry = self._memory.get(key)
+        else:
+            offset = self._index.get(key)
+            if offset is None:
+                return None
+            with open(self.path, 'rb') as file:
+                file.seek(offset)
+                entry = json.loads(file.readline())
+        if entry is None:
+            return None
+        return BufferedResponse(entry["status_code"], entry["text"], replayed=True)
+
+    def record(self, key, response):
+        entry = {"key": key, "status_code": response.status_code, "text": response.text}
+        with self._lock:
+            if self.path is None:
+                self._memory[key] = entry
+                return
+            line = (json.dumps(entry, ensure_ascii=False) + '\n').encode('utf-8')
+            with open(self.path, 'ab') as file:
+                offset = file.tell()
+                file.write(line)
+                file.flush()
+                os.fsync(file.fileno())
+            self._index[key] = offset
+
+
+class HedgePolicy:
+    # Decides when a slow request gets a duplicate ("hedge") request.
+    # The hedge delay is the given latency percentile of the requests seen so far,
+    # and at most max_rate of all requests may be hedged.
+
+    def __init__(self, percentile=95, max_rate=0.05, min_samples=20, window=500):
+        self.percentile = percentile
+        self.max_rate = max_rate
+        self.min_samples = min_samples # no hedging until enough latencies are known
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    def delay(self):
+        with self._lock:
+            if len(self._latencies) < self.min_samples:
+                return None
+            return percentile(self._latencies, self.percentile)
+
+    def observe(self, latency):
+        with self._lock:
+            self.requests += 1
+            self._latencies.append(latency)
+
+    def try_hedge(self):
+        # Reserve a hedge if it stays within the allowed rate
+        with self._lock:
+            if self.hedged + 1 > self.max_rate * max(self.requests, 1):
+                return False
+            self.hedged += 1
+            return True
+
+    def record_win(self):
+        with self._lock:
+            self.hedge_wins += 1
+
+    def metrics(self):
+        with self._lock:
+            return {"requests": self.requests, "hedged": self.hedged, "hedge_wins": self.hedge_wins}
+
+
+class _CancellableAdapter(HTTPAdapter):
+    # Keeps the connections its pools open, so a request in flight can be aborted.
+    # session.close() only closes idle connections, not the one a request is using.
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.connections = weakref.WeakSet()
+        connections = self.connections
+
+        def tracked(pool_class):
+            class TrackedPool(pool_class):
+                def _new_conn(self):
+                    connection = super()._new_conn()
+                    connections.add(connection)
+                    return connection
+            return TrackedPool
+
+        self.poolmanager.pool_classes_by_scheme = {
+            scheme: tracked(pool_class) for scheme, pool_class in self.poolmanager.pool_classes_by_scheme.items()
+        }
+
+    def abort(self):
+        for connection in list(self.connections):
+            sock = getattr(connection, 'sock', None)
+            if sock is not None:
+                try:
+                    # shutdown wakes a thread blocked reading the socket, close alone does not
+                    sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+            connection.close()
+
+
+def _cancellable_session():
+    session = requests.Session()
+    adapter = _CancellableAdapter()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+class _Attempt:
+    def __init__(self, session):
+        self.session = session
+        self.cancelled = False
+        self.started = time.monotonic()
+        self.finished = None
+
+    def cancel(self):
+        # Abort the request in flight, the session is not reused afterwards
+        self.cancelled = True
+        for adapter in self.session.adapters.values():
+            if isinstance(adapter, _CancellableAdapter):
+                adapter.abort()
+        self.session.close()
+
+
+class Transport:
+    def __init__(self, journal=None, timeout=None, limiter=None, hedge=None, budget=None):
+        self.journal = journal
+        self.timeout = timeout
+        self.limiter = limiter
+        self.hedge = hedge
+        self.budget = budget # RunBudget shared with the runner, see budget.py
+        self.session = requests.Session() # direct calls outside of the request accounting, such as warm_up
+        self._local = threading.local()
+        self._sessions = []
+        self._sessions_lock = threading.Lock()
+        self._inflight = set() # _Attempts that abort() cancels
+        self._executor = None
+        if budget is not None:
+            budget.on_cancel(self.abort)
+
+    @classmethod
+    def from_config(cls, config_data, **kwargs):
+        # "timeout": seconds, "hedge": {"percentile": 95, "max_rate": 0.05, "min_samples": 20}
+        hedge = config_data.get('hedge')
+        if hedge and 'hedge' not in kwargs:
+            kwargs['hedge'] = HedgePolicy(**hedge)
+        kwargs.setdefault('timeout', config_data.get('timeout'))
+        return cls(**kwargs)
+
+    def metrics(self):
+        metrics = {}
+        if self.limiter is not None:
+            metrics.update(self.limiter.metrics())
+        if self.hedge is not None:
+            metrics.update(self.hedge.metrics())
+        return metrics
+
+    def last_request_info(self):
+        # Details of the calling thread's most recent request, for instrumentation
+        return dict(getattr(self._local, 'info', {}))
+
+    def _timeout(self):
+        return self.budget.timeout(self.timeout) if self.budget is not None else self.timeout
+
+    def _charge(self):
+        # Called for requests that go to the endpoint, raises BudgetExceeded once the run is cancelled
+        if self.budget is not None:
+            self.budget.charge_request()
+
+    def abort(self, reason=None):
+        # Abort every request in flight, they raise BudgetExceeded
+        with self._sessions_lock:
+            attempts = list(self._inflight)
+        for attempt in attempts:
+            attempt.cancel()
+
+    def _aborted(self):
+        return BudgetExceeded(self.budget.reason if self.budget is not None else "request aborted")
+
+    def _begin(self):
+        # An attempt on a pooled cancellable session, tracked while it is in flight
+        attempt = _Attempt(self._take_session())
+        with self._sessions_lock:
+            self._inflight.add(attempt)
+        return attempt
+
+    def _end(self, attempt, reuse=True):
+        with self._sessions_lock:
+            self._inflight.discard(attempt)
+        if reuse and not attempt.cancelled:
+            self._return_session(attempt.session)
+
+    def _replay(self, url, json):
+        # Returns (key, replayed response or None)
+        if self.journal is None:
+            return None, None
+        key = request_key(url, json)
+        replayed = self.journal.get(key)
+        if replayed is not None:
+            replayed.url = url
+            self._local.info = {"replayed": True, "attempts": 0, "hedged": False, "latency": 0.0}
+        return key, replayed
+
+    def post(self, url, json=None, headers=None):
+        key, replayed = self._replay(url, json)
+        if replayed is not None:
+            return replayed
+        self._charge()
+
+        start = time.monotonic()
+        if self.hedge is None:
+            attempt = self._begin()
+            try:
+                response = self._send(attempt.session, url, json, headers, attempt)
+            finally:
+                self._end(attempt)
+            info = {"replayed": False, "attempts": 1, "hedged": False}
+        else:
+            response, info = self._hedged_post(url, json, headers)
+        if response is None:
+            # Aborted while in flight
+            raise self._aborted()
+        info["latency"] = time.monotonic() - start
+        info["ttfb"] = response.elapsed.total_seconds() # requests measures the time until the headers arrive
+        info["status_code"] = response.status_code
+        info["request_bytes"] = body_size(json)
+        info["response_bytes"] = len(response.content)
+        self._local.info = info
+
+        # Only successful responses are worth replaying
+        if self.journal is not None and response.ok:
+            self.journal.record(key, response)
+        return response
+
+    def post_stream(self, url, json=None, headers=None):
+        # POST a request with a newline delimited JSON streamed response.
+        # Lines are read as they arrive, the returned response holds all of them.
+        key, replayed = self._replay(url, json)
+        if replayed is not None:
+            return replayed
+        self._charge()
+
+        start = time.monotonic()
+        first_byte = []
+
+        def read():
+            attempt = self._begin()
+            try:
+                with attempt.session.post(url, json=json, headers=headers, timeout=self._timeout(), stream=True) as response:
+                    if response.encoding is None:
+                        # Ollama's application/x-ndjson has no charset, without one iter_lines yields bytes
+                        response.encoding = 'utf-8'
+                    lines = []
+                    for line in response.iter_lines(decode_unicode=True):
+                        if self.budget is not None and self.budget.cancelled:
+                            raise self._aborted()
+                        if not first_byte:
+                            first_byte.append(time.monotonic() - start)
+                        if line:
+                            lines.append(line)
+                    return BufferedResponse(response.status_code, '\n'.join(lines), url=url)
+            except BudgetExceeded:
+                raise
+            except Exception as e:
+                if attempt.cancelled:
+                    raise self._aborted() from e
+                raise
+            finally:
+                self._end(attempt)
+
+        if self.limiter is None:
+            response = read()
+        else:
+            with self.limiter.slot() as slot:
+                response = read()
+                slot.throttled = response.status_code in THROTTLE_STATUS_CODES
+        self._local.info = {
+            "replayed": False, "attempts": 1, "hedged": False, "streamed": True,
+            "ttfb": first_byte[0] if first_byte else None,
+            "latency": time.monotonic() - start,
+            "status_code": response.status_code,
+            "request_bytes": body_size(json),
+            "response_bytes": len(response.content),
+        }
+
+        if self.journal is not None and response.ok:
+            self.journal.record(key, response)
+        return response
+
+    def _send(self, session, url, json, headers, attempt=None, limited=True):
+        if self.limiter is None or not limited:
+            return self._post_attempt(session, url, json, headers, attempt)
+        with self.limiter.slot() as slot:
+            response = self._post_attempt(session, url, json, headers, attempt)
+            if response is not None:
+                slot.throttled = response.status_code in THROTTLE_STATUS_CODES
+            return response
+
+    def _post_attempt(self, session, url, json, headers, attempt):
+        try:
+            response = session.post(url, json=json, headers=headers, timeout=self._timeout())
+        except Exception:
+            # A cancelled hedge loser says nothing about the endpoint
+            if attempt is not None and attempt.cancelled:
+                return None
+            raise
+        if attempt is not None:
+            attempt.finished = time.monotonic()
+        return response
+
+    def _take_session(self):
+        with self._sessions_lock:
+            if self._sessions:
+                return self._sessions.pop()
+        return _cancellable_session()
+
+    def _return_session(self, session):
+        with self._sessions_lock:
+            self._sessions.append(session)
+
+    def _start(self, url, json, headers, limited=True):
+        if self._executor is None:
+            with self._sessions_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=64, thread_name_prefix='transport')
+        attempt = self._begin()
+        future = self._executor.submit(self._send, attempt.session, url, json, headers, attempt, limited)
+        return future, attempt
+
+    def _hedged_post(self, url, json, headers):
+        primary, primary_attempt = self._start(url, json, headers)
+        attempts = {primary: primary_attempt}
+        hedge_future = None
+
+        delay = self.hedge.delay()
+        done, _ = wait([primary], timeout=delay)
+        if not done and self.hedge.try_hedge():
+            # Hedges skip the concurrency limiter, they are bounded by the hedge rate instead
+            # and must not queue behind the slow request they are meant to overtake
+            hedge_future, hedge_attempt = self._start(url, json, headers, limited=False)
+            attempts[hedge_future] = hedge_attempt
+
+        pending = set(attempts)
+        winner = None
+        error = None
+        while pending and winner is None:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    response = future.result()
+                except Exception as e:
+                    # Fall back to the other attempt if one fails
+                    error = e
+                    attempts[future].session.close()
+                    continue
+                if response is not None: # None when aborted
+                    winner, winner_future = response, future
+                    break
+        if winner is None:
+            for attempt in attempts.values():
+                self._end(attempt, reuse=False)
+            if error is not None and not all(attempt.cancelled for attempt in attempts.values()):
+                raise error
+            return None, None
+
+        # Cancel the slower attempt and keep the winner's connection for reuse
+        for future in pending:
+            attempts[future].cancel()
+        for future, attempt in attempts.items():
+            self._end(attempt, reuse=future is winner_future)
+
+        # The hedge delay is learned from the primary requests. A primary overtaken
+        # by its hedge is cancelled, so its latency is only known to be at least this long
+        primary_end = primary_attempt.finished if primary_attempt.finished is not None else time.monotonic()
+        self.hedge.observe(primary_end - primary_attempt.started)
+        hedge_won = winner_future is hedge_future
+        if hedge_won:
+            self.hedge.record_win()
+        return winner, {"replayed": False, "attempts": len(attempts), "hedged": hedge_future is not None, "hedge_won": hedge_won}
@@ -0,0 +1,60 @@
+import os
+import sys
+
+# The exercises import llm_application and util from the repository root
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import json  # noqa: E402
+import sqlite3  # noqa: E402
+
+import pytest  # noqa: E402
+
+
+class TrulensDatabase:
+    # The columns of the trulens 1.x tables the utilities read
+    def __init__(self, path):
+        self.path = path
+        self.rows = 0
+        with self.connect() as connection:
+            connection.execute("CREATE TABLE trulens_apps (app_id TEXT PRIMARY KEY, app_name TEXT)")
+            connection.execute("CREATE TABLE trulens_records (record_id TEXT PRIMARY KEY, app_id TEXT, input TEXT, "
+                               "output TEXT, perf_json TEXT, cost_json TEXT, record_json TEXT)")
+            connection.execute("CREATE TABLE trulens_feedbacks (feedback_result_id TEXT PRIMARY KEY, record_id TEXT, "
+                               "name TEXT, result REAL, status TEXT, cost_json TEXT, calls_json TEXT)")
+
+    def connect(self):
+        return sqlite3.connect(self.path)
+
+    def add_app(self, name):
+        with self.connect() as connection:
+            connection.execute("INSERT OR IGNORE INTO trulens_apps VALUES (?, ?)", (f"app_hash_{name}", name))
+        return f"app_hash_{name}"
+
+    def add_record(self, app, input="question", output="answer", cost=None, start="2024-01-01T00:00:00",
+                   end="2024-01-01T00:00:01"):
+        self.rows += 1
+        record_id = f"record_{self.rows}"
+        with self.connect() as connection:
+            connection.execute("INSERT INTO trulens_records VALUES (?, ?, ?, ?, ?, ?, ?)", (
+                record_id, self.add_app(app), json.dumps(input), json.dumps(output),
+                json.dumps({"start_time": start, "end_time": end}), json.dumps(cost or {}), "{}"))
+        return record_id
+
+    def add_feedback(self, record_id, name, result=1.0, status="FeedbackResultStatus.DONE", cost=None):
+        self.rows += 1
+        feedback_id = f"feedback_{self.rows}"
+        with self.connect() as connection:
+            connection.execute("INSERT INTO trulens_feedbacks VALUES (?, ?, ?, ?, ?, ?, ?)", (
+                feedback_id, record_id, name, result, status, json.dumps(cost or {}), "{}"))
+        return feedback_id
+
+    def set_feedback(self, feedback_id, **columns):
+        with self.connect() as connection:
+            for column, value in columns.items():
+                connection.execute(f"UPDATE trulens_feedbacks SET {column} = ? WHERE feedback_result_id = ?",
+                                   (value, feedback_id))
+
+
+@pytest.fixture
+def trulens_db(tmp_path):
+    return TrulensDatabase(str(tmp_path / "default.sqlite"))
@@ -0,0 +1,78 @@
+import json
+
+from llm_application.ledger import RequestLedger
+from util.accounting import account
+from util.export import export_results
+
+
+def _request(ledger, prompt, response_bytes=100):
+    ledger.record(prompt, {"request_bytes": 10, "response_bytes": response_bytes}, {"answer": "a"})
+
+
+def _prompts(accounting):
+    return {(entry["test_set"], entry["input"]): entry for entry in accounting["prompts"]}
+
+
+def test_shared_prompt_bytes_go_to_the_test_set_that_made_the_request(trulens_db):
+    trulens_db.add_record("Exercise4a", input="shared")
+    trulens_db.add_record("Exercise4b", input="shared")
+    ledger = RequestLedger()
+    with ledger.suite("Exercise4a"):
+        _request(ledger, "shared", response_bytes=100)
+    with ledger.suite("Exercise4b"):
+        _request(ledger, "shared", response_bytes=300)
+
+    accounting = account(trulens_db.path, ledger=ledger)
+    prompts = _prompts(accounting)
+    assert prompts[("Exercise4a", "shared")]["endpoint"]["response_bytes"] == 100
+    assert prompts[("Exercise4b", "shared")]["endpoint"]["response_bytes"] == 300
+    assert accounting["test_sets"]["Exercise4a"]["endpoint"]["requests"] == 1
+    assert accounting["run"]["endpoint"]["response_bytes"] == 400
+
+
+def test_prefetched_bytes_are_counted_once(trulens_db):
+    trulens_db.add_record("RAG-Hate", input="shared")
+    trulens_db.add_record("RAG-Criminality", input="shared")
+    ledger = RequestLedger()
+    _request(ledger, "shared")  # prefetched outside of any suite
+    with ledger.suite("RAG-Criminality"):
+        ledger.record("shared", {"replayed": True}, {"answer": "a"})
+
+    prompts = _prompts(account(trulens_db.path, ledger=ledger))
+    first, second = prompts[("RAG-Hate", "shared")], prompts[("RAG-Criminality", "shared")]
+    assert first["endpoint"]["response_bytes"] == 100
+    assert second["endpoint"] == {"requests": 1, "replayed": 1, "request_bytes": 0, "response_bytes": 0,
+                                  "payload_bytes": 0, "overhead_bytes": 0}
+    total = sum(entry.get("endpoint", {}).get("response_bytes", 0) for entry in prompts.values())
+    assert total == 100
+
+
+class _App:
+    def __init__(self):
+        self.exported = None
+
+    def export_result_to_file(self, results):
+        self.exported = results
+        return "results.json"
+
+
+def test_export_writes_the_accounting(trulens_db, tmp_path):
+    record_id = trulens_db.add_record("Exercise4a", input="question")
+    trulens_db.add_feedback(record_id, "Groundedness", cost={"n_requests": 1, "n_tokens": 30, "cost": 0.02})
+    ledger = RequestLedger()
+    with ledger.suite("Exercise4a"):
+        _request(ledger, "question")
+    app = _App()
+    path = tmp_path / "accounting.json"
+
+    assert export_results(app, ["result"], accounting_path=str(path), ledger=ledger, db_path=trulens_db.path) == "results.json"
+    assert app.exported == ["result"]
+    accounting = json.loads(path.read_text())
+    assert accounting["run"]["judge"]["cost"] == 0.02
+    assert accounting["test_sets"]["Exercise4a"]["endpoint"]["response_bytes"] == 100
+
+
+def test_export_without_a_database_skips_the_accounting(tmp_path):
+    path = tmp_path / "accounting.json"
+    export_results(_App(), [], accounting_path=str(path), db_path=str(tmp_path / "missing.sqlite"))
+    assert not path.exists()
@@ -0,0 +1,143 @@
+import threading
+
+import pytest
+
+pytest.importorskip("requests")
+
+from llm_application.budget import BudgetExceeded, RunBudget, budget_provider
+from util.accounting import JudgeCost
+from util.checkpoint import Checkpoint
+from util.runner import EvaluationRunner
+
+PROMPTS = [{"input": f"question {i}", "expected_output": None} for i in range(9)]
+
+
+class Provider:
+    def __init__(self):
+        self.calls = 0
+
+    def _create_chat_completion(self, prompt):
+        self.calls += 1
+        return "10"
+
+
+class JudgedRunner(EvaluationRunner):
+    # One judge call per prompt, failures are swallowed the way trulens records failed feedbacks
+    def __init__(self, provider, **kwargs):
+        super().__init__(None, None, "App", **kwargs)
+        self.provider = provider
+        self.failed = 0
+
+    def _evaluate(self, chunk):
+        for prompt in chunk:
+            try:
+                self.provider._create_chat_completion(prompt["input"])
+            except BudgetExceeded:
+                self.failed += 1
+        return [prompt["input"] for prompt in chunk]
+
+
+def test_budget_exceeded_is_not_retried_by_trulens():
+    endpoint = pytest.importorskip("trulens.core.feedback.endpoint")
+    assert endpoint._RE_NO_RETRY.search(str(BudgetExceeded("judge call budget of 5 spent")))
+
+
+def test_budget_provider_refuses_calls_once_spent():
+    budget = RunBudget(judge_calls=2)
+    provider = budget_provider(Provider(), budget)
+    provider._create_chat_completion("a")
+    provider._create_chat_completion("b")
+    with pytest.raises(BudgetExceeded):
+        provider._create_chat_completion("c")
+    assert provider.calls == 2
+    assert budget.cancelled and budget.reason == "judge call budget of 2 spent"
+
+
+def test_judge_budget_keeps_completed_chunks_and_stops_the_run(tmp_path):
+    budget = RunBudget(judge_calls=4)
+    checkpoint = Checkpoint(str(tmp_path / "checkpoint"))
+    runner = JudgedRunner(budget_provider(Provider(), budget), chunk_size=3, budget=budget, checkpoint=checkpoint)
+    results = runner.run(PROMPTS)
+
+    # The second chunk ran out of judge calls but completed, its records are kept and checkpointed.
+    # The third is cancelled before it starts, if it was queued at all
+    assert runner.failed == 2
+    assert len(results) == 2
+    assert runner.report["partial"]
+    assert runner.report["completed"] == 6
+    assert runner.report["cancelled"] in (0, 3)
+    assert runner.report["reason"] == "judge call budget of 4 spent"
+    assert [index for index in range(9) if checkpoint.is_done(index)] == [0, 1, 2, 3, 4, 5]
+
+
+def test_chunk_aborted_by_the_budget_is_cancelled(tmp_path):
+    budget = RunBudget()
+
+    class AbortedRunner(EvaluationRunner):
+        def _evaluate(self, chunk):
+            if chunk[0]["input"] == "question 3":
+                budget.cancel("request budget of 3 spent")
+                raise BudgetExceeded(budget.reason)
+            return chunk
+
+    checkpoint = Checkpoint(str(tmp_path / "checkpoint"))
+    runner = AbortedRunner(None, None, "App", chunk_size=3, budget=budget, checkpoint=checkpoint)
+    assert len(runner.run(PROMPTS)) == 1
+    assert runner.report["completed"] == 3
+    assert runner.report["cancelled"] >= 3
+    assert [index for index in range(9) if checkpoint.is_done(index)] == [0, 1, 2]
+
+
+def test_cancel_callbacks_run_once():
+    budget = RunBudget()
+    reasons = []
+    budget.on_cancel(reasons.append)
+    budget.cancel("first")
+    budget.cancel("second")
+    budget.on_cancel(reasons.append)  # already spent, called right away
+    assert reasons == ["first", "first"]
+
+
+def test_wall_clock_budget_cancels_at_the_deadline():
+    budget = RunBudget(wall_clock=0.05)
+    cancelled = threading.Event()
+    budget.on_cancel(lambda reason: cancelled.set())
+    budget.start()
+    assert cancelled.wait(2)
+    assert budget.reason == "wall clock budget of 0.05s spent"
+
+
+def test_judge_cost_counts_finished_results_once(trulens_db):
+    first = trulens_db.add_record("App")
+    other = trulens_db.add_record("Other")
+    trulens_db.add_feedback(first, "Groundedness", cost={"cost": 0.5})
+    running = trulens_db.add_feedback(first, "AnswerRelevance", status="FeedbackResultStatus.RUNNING")
+    trulens_db.add_feedback(first, "ContextRelevance", cost={"cost": 0.25})
+    trulens_db.add_feedback(other, "Groundedness", cost={"cost": 10.0})
+
+    cost = JudgeCost(trulens_db.path, "App")
+    assert cost.update() == 0.75
+    assert cost.rowid == 1  # the scan resumes at the running result
+    assert cost.update() == 0.75
+
+    trulens_db.set_feedback(running, status="FeedbackResultStatus.DONE", cost_json='{"cost": 1.0}')
+    assert cost.update() == 1.75
+    assert not cost.counted
+
+
+def test_cost_budget_stops_the_run(trulens_db):
+    budget = RunBudget(cost=1.0)
+
+    class CostlyRunner(EvaluationRunner):
+        def _evaluate(self, chunk):
+            for _ in chunk:
+                trulens_db.add_feedback(trulens_db.add_record("App"), "Groundedness", cost={"cost": 0.25})
+            return chunk
+
+    runner = CostlyRunner(None, None, "App", chunk_size=2, budget=budget, cost_database=trulens_db.path)
+    runner.run(PROMPTS)
+    # Chunks finished before the cost was read back still count
+    assert 4 <= runner.report["completed"] < len(PROMPTS)
+    assert runner.report["partial"]
+    assert runner.report["reason"] == "cost budget of $1.0 spent"
+    assert budget.cost >= 1.0
@@ -0,0 +1,50 @@
+import pytest
+
+pytest.importorskip("requests")
+
+from llm_application.transport import BufferedResponse, ResponseJournal, Transport, request_key
+from util.checkpoint import Checkpoint
+
+
+def test_mark_done_merges_ranges(tmp_path):
+    checkpoint = Checkpoint(str(tmp_path))
+    checkpoint.mark_done([0, 1, 2])
+    checkpoint.mark_done([5, 3, 4])
+    checkpoint.mark_done([9])
+    assert checkpoint.completed == [[0, 6], [9, 10]]
+    assert checkpoint.is_done(5) and not checkpoint.is_done(6) and checkpoint.is_done(9)
+    assert Checkpoint(str(tmp_path)).completed_count == 7
+
+
+def test_journal_replays_after_reopen(tmp_path):
+    path = str(tmp_path / "responses.jsonl")
+    ResponseJournal(path).record("a", BufferedResponse(200, '{"answer": "é"}'))
+    replayed = ResponseJournal(path).get("a")
+    assert replayed.replayed and replayed.json() == {"answer": "é"}
+
+
+def test_journal_ignores_partial_last_line(tmp_path):
+    path = tmp_path / "responses.jsonl"
+    journal = ResponseJournal(str(path))
+    journal.record("a", BufferedResponse(200, "first"))
+    with open(path, 'ab') as file:
+        file.write(b'{"key": "b", "status_')
+    reopened = ResponseJournal(str(path))
+    assert "a" in reopened and "b" not in reopened
+
+
+def test_reset_clears_journal_held_by_transport(tmp_path):
+    checkpoint = Checkpoint(str(tmp_path))
+    transport = Transport(journal=checkpoint.journal())
+    key = request_key("http://endpoint", {"q": 1})
+    transport.journal.record(key, BufferedResponse(200, "old response"))
+
+    # A second run without resume
+    checkpoint.reset()
+    assert transport.journal.get(key) is None
+    assert len(transport.journal) == 0
+
+    transport.journal.record(key, BufferedResponse(200, "new"))
+    transport.journal.record("other", BufferedResponse(200, "other"))
+    assert transport.journal.get(key).text == "new"
+    assert Checkpoint(str(tmp_path)).journal().get("other").text == "other"
@@ -0,0 +1,94 @@
+import pytest
+
+pa = pytest.importorskip("pyarrow")
+pq = pytest.importorskip("pyarrow.parquet")
+
+from util.columnar import ColumnarExporter
+
+
+def _rows(directory, table):
+    path = directory / table
+    if not path.exists():
+        return []
+    # Every exported row with the partition path of its file
+    return [
+        dict(row, _path=str(file.relative_to(path)))
+        for file in sorted(path.rglob("*.parquet")) for row in pq.read_table(str(file)).to_pylist()
+    ]
+
+
+def _ids(rows, column):
+    return sorted(row[column] for row in rows)
+
+
+def test_running_feedbacks_are_exported_once_they_finish(trulens_db, tmp_path):
+    output = tmp_path / "results"
+    exporter = ColumnarExporter(str(output), trulens_db.path, run="run1")
+    record = trulens_db.add_record("Exercise4a", cost={"n_tokens": 12, "cost": 0.01})
+    first = trulens_db.add_feedback(record, "Groundedness", result=0.5)
+    running = trulens_db.add_feedback(record, "AnswerRelevance", result=None, status="FeedbackResultStatus.RUNNING")
+    after = trulens_db.add_feedback(record, "ContextRelevance", result=1.0)
+
+    exporter.flush()
+    assert _ids(_rows(output, "feedbacks"), "feedback_result_id") == sorted([first, after])
+    # The watermark stops at the running result, the finished one past it is remembered
+    assert exporter.progress["feedbacks_above"] == [after]
+
+    trulens_db.set_feedback(running, status="FeedbackResultStatus.DONE", result=0.75)
+    exporter.flush()
+    feedbacks = _rows(output, "feedbacks")
+    assert _ids(feedbacks, "feedback_result_id") == sorted([first, running, after])
+    assert exporter.progress["feedbacks_above"] == []
+    assert exporter.progress["feedbacks_rowid"] == 3
+
+    exporter.flush()
+    assert len(_rows(output, "feedbacks")) == 3
+    assert exporter.metrics()["feedbacks"] == 3
+
+    records = _rows(output, "records")
+    assert _ids(records, "record_id") == [record]
+    assert records[0]["latency"] == 1.0
+    assert records[0]["tokens"] == 12
+    assert records[0]["_path"].startswith("run=run1/test_set=Exercise4a/")
+    assert {row["_path"].split("/")[2] for row in feedbacks} == {
+        "feedback=Groundedness", "feedback=AnswerRelevance", "feedback=ContextRelevance"}
+
+
+def test_resumed_exporter_carries_on_from_its_progress(trulens_db, tmp_path):
+    output = tmp_path / "results"
+    exporter = ColumnarExporter(str(output), trulens_db.path, run="run1")
+    record = trulens_db.add_record("Exercise4a")
+    running = trulens_db.add_feedback(record, "Groundedness", status="FeedbackResultStatus.RUNNING")
+    done = trulens_db.add_feedback(record, "AnswerRelevance")
+    exporter.flush()
+
+    trulens_db.set_feedback(running, status="FeedbackResultStatus.DONE")
+    resumed = ColumnarExporter(str(output), trulens_db.path, run="run1")
+    resumed.flush()
+    assert resumed.metrics()["records"] == 0
+    assert _ids(_rows(output, "feedbacks"), "feedback_result_id") == sorted([running, done])
+
+
+def test_rows_of_earlier_runs_are_left_out(trulens_db, tmp_path):
+    output = tmp_path / "results"
+    earlier = trulens_db.add_record("Exercise4a")
+    trulens_db.add_feedback(earlier, "Groundedness")
+    exporter = ColumnarExporter(str(output), trulens_db.path, run="run2", app_ids=["Exercise4b"])
+    record = trulens_db.add_record("Exercise4b")
+    feedback = trulens_db.add_feedback(record, "Groundedness")
+    trulens_db.add_feedback(trulens_db.add_record("Exercise4a"), "Groundedness")
+
+    exporter.flush()
+    assert _ids(_rows(output, "records"), "record_id") == [record]
+    assert _ids(_rows(output, "feedbacks"), "feedback_result_id") == [feedback]
+
+
+def test_arrow_ipc_format(trulens_db, tmp_path):
+    output = tmp_path / "results"
+    trulens_db.add_feedback(trulens_db.add_record("Exercise4a"), "Groundedness", result=0.25)
+    ColumnarExporter(str(output), trulens_db.path, run="run1", format="arrow", include_existing=True).flush()
+    files = list((output / "feedbacks").rglob("*.arrow"))
+    assert len(files) == 1
+    with pa.memory_map(str(files[0])) as source:
+        table = pa.ipc.open_file(source).read_all()
+    assert table.column("result").to_pylist() == [0.25]
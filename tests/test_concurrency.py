@@ -0,0 +1,115 @@
+import threading
+import time
+
+import pytest
+
+from llm_application.concurrency import AdaptiveLimiter, limit_provider, percentile
+
+
+def test_percentile_is_nearest_rank():
+    assert percentile([], 95) is None
+    assert percentile([3, 1, 2], 50) == 2
+    assert percentile(list(range(1, 101)), 95) == 95
+
+
+def test_inflight_never_exceeds_the_limit():
+    limiter = AdaptiveLimiter(initial=3, max_limit=3)
+    lock = threading.Lock()
+    inflight, peak = [0], [0]
+
+    def request():
+        with limiter.slot():
+            with lock:
+                inflight[0] += 1
+                peak[0] = max(peak[0], inflight[0])
+            time.sleep(0.01)
+            with lock:
+                inflight[0] -= 1
+
+    threads = [threading.Thread(target=request) for _ in range(12)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert peak[0] == 3
+    assert limiter.metrics()["inflight"] == 0
+
+
+def test_limit_grows_after_a_round_of_successes():
+    limiter = AdaptiveLimiter(initial=2, max_limit=4)
+    for _ in range(2):
+        limiter.acquire()
+        limiter.release(0.1)
+    assert limiter.current_limit == 3
+
+
+def test_throttling_backs_off_once_per_latency_period():
+    limiter = AdaptiveLimiter(initial=8)
+    for _ in range(3):
+        limiter.acquire()
+    # Requests in flight when the endpoint throttled all report it, the limit halves once
+    for _ in range(3):
+        limiter.release(0.5, throttled=True)
+    assert limiter.current_limit == 4
+    assert limiter.metrics()["throttled"] == 3
+    assert limiter.decreases == 1
+
+
+def test_latency_spike_backs_off():
+    limiter = AdaptiveLimiter(initial=2, window=3, latency_tolerance=1.5)
+    # The first round sets the baseline and raises the limit to 3, the next round is slow
+    for latency in (0.1, 0.1, 1.0, 1.0, 1.0):
+        limiter.acquire()
+        limiter.release(latency)
+    assert limiter.current_limit == 1
+    assert limiter.decreases == 1
+
+
+def test_limit_recovers_after_a_lasting_latency_step():
+    limiter = AdaptiveLimiter(initial=2, window=3, latency_tolerance=1.5)
+    for latency in (0.1, 0.1, 1.0, 1.0, 1.0):
+        limiter.acquire()
+        limiter.release(latency)
+    assert limiter.current_limit == 1
+    # Latency stays at the new level, it becomes the baseline and the limit grows again
+    for _ in range(6):
+        limiter.acquire()
+        limiter.release(1.0)
+    assert limiter.metrics()["baseline_p95_latency"] == pytest.approx(1.0)
+    assert limiter.current_limit == 4
+    assert limiter.decreases == 1
+
+
+def test_slot_reports_errors_but_not_cancellation():
+    limiter = AdaptiveLimiter(initial=4)
+    with pytest.raises(KeyboardInterrupt):
+        with limiter.slot():
+            raise KeyboardInterrupt
+    assert limiter.metrics()["throttled"] == 0
+    with pytest.raises(ValueError):
+        with limiter.slot():
+            raise ValueError("endpoint failed")
+    assert limiter.metrics()["throttled"] == 1
+    assert limiter.metrics()["inflight"] == 0
+
+
+class Provider:
+    def __init__(self, error=None):
+        self.error = error
+
+    def _create_chat_completion(self, prompt):
+        if self.error is not None:
+            raise self.error
+        return prompt
+
+
+def test_limit_provider_counts_rate_limits_as_throttling():
+    limiter = AdaptiveLimiter(initial=4)
+    assert limit_provider(Provider(), limiter)._create_chat_completion("ok") == "ok"
+    assert limiter.metrics()["throttled"] == 0
+
+    failing = limit_provider(Provider(RuntimeError("429 Too Many Requests")), limiter)
+    with pytest.raises(RuntimeError):
+        failing._create_chat_completion("again")
+    assert limiter.metrics()["throttled"] == 1
+    assert limiter.metrics()["inflight"] == 0
@@ -0,0 +1,142 @@
+import json
+import sqlite3
+
+import pytest
+
+from util.context_dedup import MARKER, install_rehydration, intern_contexts, rehydrate_frame, uninstall_rehydration
+
+CONTEXT = "A retrieved document chunk. " * 20
+
+
+def _record_json(context):
+    return json.dumps({"calls": [{
+        "stack": [{"method": {"name": "retrieve"}}],
+        "args": {"query": "q"},
+        "rets": [context, "short"],
+    }]})
+
+
+def _calls_json(context):
+    return json.dumps({"calls": [{"args": {"source": context, "statement": "answer"}, "ret": 1.0}]})
+
+
+@pytest.fixture
+def database(tmp_path):
+    path = str(tmp_path / "default.sqlite")
+    connection = sqlite3.connect(path)
+    connection.execute("CREATE TABLE trulens_records (record_id TEXT PRIMARY KEY, record_json TEXT)")
+    connection.execute("CREATE TABLE trulens_feedbacks (feedback_result_id TEXT PRIMARY KEY, record_id TEXT, "
+                       "status TEXT, calls_json TEXT)")
+    connection.commit()
+    connection.close()
+    return path
+
+
+def _execute(path, sql, *args):
+    connection = sqlite3.connect(path)
+    connection.execute(sql, args)
+    connection.commit()
+    connection.close()
+
+
+def _column(path, table, column, key, value):
+    connection = sqlite3.connect(path)
+    row = connection.execute(f"SELECT {column} FROM {table} WHERE {key} = ?", (value,)).fetchone()
+    connection.close()
+    return row[0]
+
+
+def test_interns_finished_rows_only(database):
+    _execute(database, "INSERT INTO trulens_records VALUES ('r1', ?)", _record_json(CONTEXT))
+    _execute(database, "INSERT INTO trulens_feedbacks VALUES ('f1', 'r1', 'FeedbackResultStatus.RUNNING', ?)",
+             _calls_json(CONTEXT))
+    _execute(database, "INSERT INTO trulens_records VALUES ('r2', ?)", _record_json(CONTEXT))
+    _execute(database, "INSERT INTO trulens_feedbacks VALUES ('f2', 'r2', 'FeedbackResultStatus.DONE', ?)",
+             _calls_json(CONTEXT))
+
+    intern_contexts(database)
+    # r1 still has a pending feedback, which must read the full text
+    assert CONTEXT in _column(database, "trulens_records", "record_json", "record_id", "r1")
+    assert CONTEXT in _column(database, "trulens_feedbacks", "calls_json", "feedback_result_id", "f1")
+    assert MARKER in _column(database, "trulens_records", "record_json", "record_id", "r2")
+    assert MARKER in _column(database, "trulens_feedbacks", "calls_json", "feedback_result_id", "f2")
+
+    # The pending feedback finishes after the watermark passed r2 and f2
+    _execute(database, "UPDATE trulens_feedbacks SET status = 'FeedbackResultStatus.DONE' WHERE feedback_result_id = 'f1'")
+    intern_contexts(database)
+    assert MARKER in _column(database, "trulens_records", "record_json", "record_id", "r1")
+    assert MARKER in _column(database, "trulens_feedbacks", "calls_json", "feedback_result_id", "f1")
+
+    connection = sqlite3.connect(database)
+    assert connection.execute("SELECT COUNT(*) FROM kjr_contexts").fetchone()[0] == 1
+    connection.close()
+
+
+def test_interning_twice_changes_nothing(database):
+    _execute(database, "INSERT INTO trulens_records VALUES ('r1', ?)", _record_json(CONTEXT))
+    intern_contexts(database)
+    interned = _column(database, "trulens_records", "record_json", "record_id", "r1")
+    _execute(database, "DELETE FROM kjr_context_progress")
+    intern_contexts(database)
+    assert _column(database, "trulens_records", "record_json", "record_id", "r1") == interned
+
+
+def test_rehydrate_frame_leaves_database_deduplicated(database):
+    pandas = pytest.importorskip("pandas")
+    _execute(database, "INSERT INTO trulens_records VALUES ('r1', ?)", _record_json(CONTEXT))
+    _execute(database, "INSERT INTO trulens_feedbacks VALUES ('f1', 'r1', 'done', ?)", _calls_json(CONTEXT))
+    intern_contexts(database)
+
+    interned_record = _column(database, "trulens_records", "record_json", "record_id", "r1")
+    interned_calls = json.loads(_column(database, "trulens_feedbacks", "calls_json", "feedback_result_id", "f1"))
+    frame = pandas.DataFrame({
+        "record_json": [interned_record],
+        "Groundedness_calls": [interned_calls["calls"]],
+        "input": ["q"],
+    })
+    rehydrated = rehydrate_frame(frame, database)
+    assert json.loads(rehydrated["record_json"][0]) == json.loads(_record_json(CONTEXT))
+    assert rehydrated["Groundedness_calls"][0][0]["args"]["source"] == CONTEXT
+    assert MARKER in frame["record_json"][0]
+    assert _column(database, "trulens_records", "record_json", "record_id", "r1") == interned_record
+
+
+def test_rehydrate_frame_without_interned_contexts(database):
+    pandas = pytest.importorskip("pandas")
+    frame = pandas.DataFrame({"record_json": [_record_json(CONTEXT)]})
+    assert rehydrate_frame(frame, database) is frame
+    connection = sqlite3.connect(database)
+    tables = {row[0] for row in connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    connection.close()
+    assert "kjr_contexts" not in tables  # reading never changes the database
+
+
+def test_trulens_reads_are_rehydrated(database):
+    pandas = pytest.importorskip("pandas")
+    sqlalchemy_db = pytest.importorskip("trulens.core.database.sqlalchemy")
+    _execute(database, "INSERT INTO trulens_records VALUES ('r1', ?)", _record_json(CONTEXT))
+    intern_contexts(database)
+    interned = _column(database, "trulens_records", "record_json", "record_id", "r1")
+
+    class Url:
+        drivername = "sqlite"
+
+    Url.database = database
+
+    class Engine:
+        url = Url
+
+    def read(self, *args, **kwargs):
+        return pandas.DataFrame({"record_json": [interned]}), []
+
+    original = sqlalchemy_db.SQLAlchemyDB.get_records_and_feedback
+    sqlalchemy_db.SQLAlchemyDB.get_records_and_feedback = read
+    try:
+        install_rehydration()
+        db = sqlalchemy_db.SQLAlchemyDB.model_construct(engine=Engine())
+        records, _ = db.get_records_and_feedback()
+    finally:
+        uninstall_rehydration()
+        sqlalchemy_db.SQLAlchemyDB.get_records_and_feedback = original
+    assert json.loads(records["record_json"][0]) == json.loads(_record_json(CONTEXT))
+    assert _column(database, "trulens_records", "record_json", "record_id", "r1") == interned
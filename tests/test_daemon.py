@@ -0,0 +1,56 @@
+import io
+import os
+
+import util.daemon as daemon
+from util.daemon import WarmBuilders, _Handler, _LineWriter
+
+
+class FakeEngine:
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def _spec(directory, cascade=False):
+    return {"_directory": str(directory), "target": {"wrapper": "azure", "config": "config.json"},
+            "provider": {"model_name": "judge"}, "cascade": cascade}
+
+
+def test_changed_config_replaces_and_closes_the_engine(tmp_path, monkeypatch):
+    monkeypatch.setattr(daemon, "build_engine", lambda spec: FakeEngine())
+    config = tmp_path / "config.json"
+    config.write_text("{}")
+    builders = WarmBuilders()
+    first = builders.engine(_spec(tmp_path))
+    assert builders.engine(_spec(tmp_path)) is first
+
+    os.utime(config, (1, 1))
+    second = builders.engine(_spec(tmp_path))
+    assert second is not first and first.closed and not second.closed
+    assert builders.metrics()["engines"] == 1
+
+
+def test_cascade_providers_are_built_per_run(tmp_path, monkeypatch):
+    built = []
+    monkeypatch.setattr(daemon, "build_provider", lambda spec: built.append(spec) or object())
+    builders = WarmBuilders()
+    assert builders.provider(_spec(tmp_path)) is builders.provider(_spec(tmp_path))
+    assert builders.provider(_spec(tmp_path, True)) is not builders.provider(_spec(tmp_path, True))
+    assert len(built) == 3
+
+
+class BrokenPipe(io.RawIOBase):
+    def write(self, data):
+        raise BrokenPipeError()
+
+
+def test_output_to_a_disconnected_client_is_dropped():
+    handler = _Handler.__new__(_Handler)
+    handler.wfile = BrokenPipe()
+    writer = _LineWriter(handler.send)
+    writer.write("first line\nsecond line\n")
+    writer.flush()
+    handler.send({"event": "done"})
+    assert handler.disconnected
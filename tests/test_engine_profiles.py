@@ -0,0 +1,38 @@
+import pytest
+
+pytest.importorskip("requests")
+pytest.importorskip("trulens.apps.custom")
+
+from llm_application.engine import INSTRUMENTED_METHODS, RAG_from_scratch as Engine  # noqa: E402
+from llm_application.ollama.wrapper import RAG_from_scratch as OllamaWrapper  # noqa: E402
+
+CONFIG = {"url": "http://localhost:1/chat", "backend": "openai"}
+
+
+def test_profile_is_chosen_at_construction():
+    engine = OllamaWrapper(config_data={**CONFIG, "instrumentation": "off"})
+    assert type(engine).instrumented_methods == ("query",)
+    assert type(engine).__bases__ == (OllamaWrapper,)
+    assert type(OllamaWrapper(CONFIG)).instrumented_methods == INSTRUMENTED_METHODS
+
+
+def test_profiles_leave_the_engine_classes_alone():
+    before = {name: Engine.__dict__[name] for name in INSTRUMENTED_METHODS}
+    full = OllamaWrapper.with_instrumentation("full")
+    off = OllamaWrapper.with_instrumentation("off")
+    assert {name: Engine.__dict__[name] for name in INSTRUMENTED_METHODS} == before
+    assert "retrieve" not in OllamaWrapper.__dict__
+    # Only the profile's own methods are instrumented, the request under the wrapper's name
+    assert "ollama_chat_request" in full.__dict__ and "retrieve" in full.__dict__
+    assert "retrieve" not in off.__dict__ and "query" in off.__dict__
+
+
+def test_feedback_minimal_follows_the_wrapper_method_name():
+    profile = OllamaWrapper.with_instrumentation("feedback-minimal", ["Select.Record.app.ollama_chat_request.rets"])
+    assert profile.instrumented_methods == ("query", "chat_request")
+
+
+def test_clone_keeps_the_profile_unless_asked():
+    engine = OllamaWrapper(config_data={**CONFIG, "instrumentation": "off"})
+    assert type(engine.clone()) is type(engine)
+    assert type(engine.clone(instrumentation="full")).instrumented_methods == INSTRUMENTED_METHODS
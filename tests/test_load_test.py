@@ -0,0 +1,83 @@
+import json
+import threading
+
+from util.export import export_results
+from util.load_test import LoadTestResult, LoadTestSet, request_error, request_latency, request_ttfb
+
+
+class FakeEngine:
+    def __init__(self, parent=None):
+        self.parent = parent
+        self.coalesce = True
+        self.clones = []
+        self.queries = []
+        self._local = threading.local()
+        self.json_response = {}
+        self.closed = False
+
+    def clone(self, transport=None, instrumentation=None, feedbacks=None):
+        engine = FakeEngine(parent=self)
+        self.clones.append(engine)
+        return engine
+
+    def query(self, query):
+        self.queries.append(query)
+        self._local.info = {"ttfb": 0.01 * len(query), "coalesced": self.coalesce}
+        self.json_response = {"answer": query}
+        return query
+
+    def last_request_info(self):
+        return dict(getattr(self._local, 'info', {}))
+
+    def close(self):
+        self.closed = True
+
+
+def test_load_runs_on_a_separate_engine_without_coalescing():
+    engine = FakeEngine()
+    load_test = LoadTestSet(["a", "bb"], "load", users=2, iterations=2, record=False,
+                            thresholds={"error_rate": 0.0, "p95_latency": 10.0})
+    result = load_test.evaluate(engine, "load")
+
+    assert engine.queries == []
+    load_engine, = engine.clones
+    assert load_engine.coalesce is False
+    assert load_engine.closed and not engine.closed
+    assert len(load_engine.queries) == 8
+    assert result.passed
+    assert result.metrics["requests"] == 8
+    assert {sample["ttfb"] for sample in result.samples} == {0.01, 0.02}
+
+
+def test_thresholds_fail_the_gate():
+    samples = [{"latency": 2.0, "ttfb": None, "error": i == 0} for i in range(4)]
+    result = LoadTestResult("load", "load", samples, elapsed=4.0, users=1,
+                            thresholds={"p95_latency": 1.0, "error_rate": 0.5, "rps": 2.0})
+    assert set(result.failures) == {"p95_latency", "rps"}
+
+
+class FakeApp:
+    def __init__(self):
+        self.exported = None
+
+    def export_result_to_file(self, results):
+        self.exported = results
+        return "results.xlsx"
+
+
+def test_export_results_splits_load_results(tmp_path):
+    app = FakeApp()
+    load = LoadTestResult("load", "load", [{"latency": 1.0, "ttfb": 0.5, "error": False}], 1.0, 1, {})
+    path = tmp_path / "load.json"
+    assert export_results(app, ["quality", load], load_path=str(path)) == "results.xlsx"
+    assert app.exported == ["quality"]
+    assert json.loads(path.read_text())[0]["metrics"]["requests"] == 1
+
+
+def test_request_feedbacks():
+    info = {"latency": 1.5, "ttfb": 0.25, "status_code": 503}
+    assert request_latency(info) == 1.5
+    assert request_ttfb(info) == 0.25
+    assert request_error(info) == 1.0
+    # A coalesced query records no transport details
+    assert (request_latency({}), request_ttfb({}), request_error({"coalesced": True})) == (0.0, 0.0, 0.0)
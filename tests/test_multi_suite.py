@@ -0,0 +1,74 @@
+import types
+
+import pytest
+
+pytest.importorskip("requests")
+
+from util.multi_suite import evaluate_suites, suite_inputs
+
+
+def _suite(name, inputs, attribute='prompts'):
+    prompts = types.SimpleNamespace(prompts=[types.SimpleNamespace(input=text) for text in inputs])
+    return types.SimpleNamespace(name=name, **{attribute: prompts})
+
+
+def test_inputs_are_deduplicated_in_order():
+    tests = [_suite("a", ["q1", "q2"]), _suite("b", ["q2", "q3"])]
+    assert suite_inputs(tests) == ["q1", "q2", "q3"]
+
+
+def test_suite_without_prompts_warns():
+    tests = [_suite("a", ["q1"]), _suite("renamed", ["q2"], attribute='prompt_set')]
+    with pytest.warns(UserWarning, match="renamed"):
+        assert suite_inputs(tests) == ["q1"]
+
+
+def test_endpoint_called_once_per_unique_prompt():
+    calls = []
+
+    class Chain:
+        transport = types.SimpleNamespace(journal=None)
+
+        def fetch_response(self, text):
+            calls.append(text)
+
+    class Suite:
+        def __init__(self, name, inputs):
+            self.name = name
+            self.prompts = [{"input": text} for text in inputs]
+
+        def evaluate(self, target, app_id):
+            return app_id
+
+    chain = Chain()
+    results = evaluate_suites([Suite("a", ["q1", "q2"]), Suite("b", ["q2"])], None, chain, "App")
+    assert sorted(calls) == ["q1", "q2"]
+    assert results == ["App-a", "App-b"]
+    assert chain.transport.journal is None
+
+
+def test_failed_prefetch_is_retried_by_the_suites():
+    calls = []
+
+    class Chain:
+        transport = types.SimpleNamespace(journal=None)
+
+        def fetch_response(self, text):
+            calls.append(text)
+            if text == "q2":
+                raise ConnectionError("endpoint unavailable")
+            self.transport.journal.record(text, types.SimpleNamespace(status_code=200, text=text))
+
+    class Suite:
+        def __init__(self, name, inputs):
+            self.name = name
+            self.prompts = [{"input": text} for text in inputs]
+
+        def evaluate(self, target, app_id):
+            # Prompts missing from the journal are fetched again during the suite
+            return [text for text in (p["input"] for p in self.prompts) if chain.transport.journal.get(text) is None]
+
+    chain = Chain()
+    results = evaluate_suites([Suite("a", ["q1", "q2"]), Suite("b", ["q2", "q3"])], None, chain, "App")
+    assert sorted(calls) == ["q1", "q2", "q3"]
+    assert results == [["q2"], ["q2"]]
@@ -0,0 +1,69 @@
+import json
+
+import pytest
+
+pytest.importorskip("requests")
+
+from llm_application.engine import DECODERS
+from llm_application.offload import StagePool, build_pools, decode_text
+
+OLLAMA_STREAM = "\n".join(json.dumps(chunk) for chunk in [
+    {"message": {"content": "Hello "}},
+    {"message": {"content": "world"}},
+    {"message": {"content": ""}, "done": True, "model": "mistral:7b"},
+])
+
+
+@pytest.fixture
+def parse_pool():
+    pool = StagePool("parse", workers=1)
+    yield pool
+    pool.close()
+
+
+def test_worker_result_matches_the_in_process_decoder(parse_pool):
+    assert parse_pool.run(decode_text, "ollama_stream", OLLAMA_STREAM) == DECODERS["ollama_stream"](OLLAMA_STREAM)
+    metrics = parse_pool.metrics()
+    assert metrics["tasks"] == 1
+    assert metrics["in_flight"] == 0
+
+
+def test_closed_pool_runs_nothing(parse_pool):
+    parse_pool.close()
+    parse_pool.close()  # closing twice is harmless
+    assert parse_pool.closed
+    with pytest.raises(RuntimeError):
+        parse_pool.run(decode_text, "ollama_stream", OLLAMA_STREAM)
+
+
+def test_pii_runs_in_a_single_worker():
+    pools = build_pools({"pii": 4, "parse": 3})
+    try:
+        assert pools["pii"].workers == 1
+        assert pools["parse"].workers == 3
+    finally:
+        for pool in pools.values():
+            pool.close()
+
+
+def test_unknown_stage():
+    with pytest.raises(ValueError):
+        build_pools({"embed": 2})
+
+
+def test_clones_share_the_pools_and_only_the_owner_closes_them():
+    pytest.importorskip("trulens.apps.custom")
+    from llm_application.engine import RAG_from_scratch
+
+    engine = RAG_from_scratch(config_data={"url": "http://localhost:1/chat", "backend": "openai",
+                                           "offload": {"parse": 1}})
+    pool = engine.stage_pools["parse"]
+    clone = engine.clone()
+    assert clone.stage_pools["parse"] is pool
+    assert clone.config == engine.config
+
+    clone.close()
+    assert not pool.closed
+    assert pool.run(decode_text, "ollama_stream", OLLAMA_STREAM)["answer"] == "Hello world"
+    engine.close()
+    assert pool.closed
@@ -0,0 +1,38 @@
+import threading
+import time
+
+from util.pii_feedback import LocalPIIDetection
+
+
+class RecordingDetection(LocalPIIDetection):
+    # Scores without Presidio, keeping the size of every dispatched batch
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.batches = []
+
+    def score_batch(self, texts):
+        self.batches.append(len(texts))
+        return [(0.0, {"reason": "No PII detected.", "entities": []}) for _ in texts]
+
+
+def _submit(detector, count, spacing):
+    threads = [threading.Thread(target=detector.pii_detection, args=(f"text {i}",)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+        time.sleep(spacing)
+    for thread in threads:
+        thread.join(timeout=5)
+
+
+def test_submits_within_batch_wait_share_one_batch():
+    detector = RecordingDetection(batch_size=8, batch_wait=0.5)
+    _submit(detector, 8, 0.01)
+    assert detector.batches == [8]
+
+
+def test_partial_batch_dispatched_after_batch_wait():
+    detector = RecordingDetection(batch_size=32, batch_wait=0.05)
+    start = time.monotonic()
+    detector.pii_detection("only one")
+    assert detector.batches == [1]
+    assert time.monotonic() - start < 1
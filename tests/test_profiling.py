@@ -0,0 +1,31 @@
+import time
+
+from llm_application.profiling import SamplingProfiler, classify
+
+
+def _busy(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        sum(range(100))
+
+
+def test_socket_reads_count_as_network():
+    frames = [
+        ("/usr/lib/python3.11/socket.py", "readinto"),
+        ("/usr/lib/python3.11/http/client.py", "_read_status"),
+        ("/site-packages/urllib3/connectionpool.py", "urlopen"),
+    ]
+    assert classify(frames) == "network"
+    assert classify([("/usr/lib/python3.11/ssl.py", "recv_into")] + frames) == "network"
+    assert classify([("/usr/lib/python3.11/threading.py", "wait")] + frames) == "idle"
+
+
+def test_sessions_started_after_an_idle_period_are_sampled():
+    profiler = SamplingProfiler(interval=0.001)
+    for _ in range(20):
+        # The sampler goes idle between the short sessions, each one must wake it again
+        profiler.samples.clear()
+        with profiler.sampling(current_thread_only=True):
+            _busy(0.03)
+        assert sum(profiler.samples.values()) > 0
+        time.sleep(0.005)
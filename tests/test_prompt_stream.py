@@ -0,0 +1,58 @@
+import gzip
+import json
+
+import pytest
+
+from util import prompt_stream
+from util.prompt_stream import StreamingPromptSet, chunked, iter_prompts, resolve_prompt_file, write_jsonl
+
+PROMPTS = [{"input": f"question {i} é", "expected_output": None} for i in range(25)]
+
+
+def test_json_array_decoded_across_reads(tmp_path, monkeypatch):
+    # Force every prompt to span several reads
+    monkeypatch.setattr(prompt_stream, "READ_SIZE", 7)
+    path = tmp_path / "prompts.json"
+    path.write_text(json.dumps(PROMPTS, indent=2), encoding='utf-8')
+    assert list(iter_prompts(str(path))) == PROMPTS
+
+
+@pytest.mark.parametrize("name", ["prompts.jsonl", "prompts.jsonl.gz"])
+def test_jsonl_round_trip(tmp_path, name):
+    path = str(tmp_path / name)
+    assert write_jsonl(PROMPTS, path) == len(PROMPTS)
+    assert list(iter_prompts(path)) == PROMPTS
+
+
+def test_gzip_json_array(tmp_path):
+    path = tmp_path / "prompts.json.gz"
+    with gzip.open(path, 'wt', encoding='utf-8') as file:
+        json.dump(PROMPTS, file)
+    assert list(iter_prompts(str(path))) == PROMPTS
+
+
+def test_invalid_jsonl_line_reports_line_number(tmp_path):
+    path = tmp_path / "prompts.jsonl"
+    path.write_text('{"input": "a"}\n{broken\n', encoding='utf-8')
+    with pytest.raises(ValueError, match="line 2"):
+        list(iter_prompts(str(path)))
+
+
+def test_truncated_json_array(tmp_path):
+    path = tmp_path / "prompts.json"
+    path.write_text('[{"input": "a"}, {"input": ', encoding='utf-8')
+    with pytest.raises(ValueError):
+        list(iter_prompts(str(path)))
+
+
+def test_streaming_prompt_set_resolves_extension_and_rereads(tmp_path):
+    write_jsonl(PROMPTS, str(tmp_path / "prompts.jsonl.gz"))
+    prompts = StreamingPromptSet(str(tmp_path / "prompts"))
+    assert prompts.path == resolve_prompt_file(str(tmp_path / "prompts"))
+    assert list(prompts) == list(prompts) == PROMPTS
+    assert [len(chunk) for chunk in prompts.chunks(10)] == [10, 10, 5]
+
+
+def test_chunked():
+    assert list(chunked(range(5), 2)) == [[0, 1], [2, 3], [4]]
+    assert list(chunked([], 3)) == []
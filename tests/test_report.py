@@ -0,0 +1,76 @@
+import json
+
+import pytest
+
+pytest.importorskip("pandas")
+
+from util.report import load_frames, render_html, summarize, write_report
+
+
+@pytest.fixture
+def results(trulens_db):
+    for i, score in enumerate([0.2, 0.9, 0.6]):
+        record = trulens_db.add_record("Exercise4a", input=f"question {i}", output=f"answer {i}",
+                                       end=f"2024-01-01T00:00:0{i + 1}")
+        trulens_db.add_feedback(record, "Groundedness", result=score, cost={"cost": 0.01, "n_tokens": 10})
+    record = trulens_db.add_record("Exercise4b", input="question <b>", output="answer")
+    trulens_db.add_feedback(record, "Groundedness", result=1.0)
+    trulens_db.add_feedback(record, "AnswerRelevance", result=None, status="FeedbackResultStatus.FAILED")
+    return trulens_db
+
+
+def test_load_frames_names_the_apps(results):
+    records, feedbacks = load_frames(results.path)
+    assert sorted(records["app"].unique()) == ["Exercise4a", "Exercise4b"]
+    assert sorted(records["latency"]) == [1.0, 1.0, 2.0, 3.0]
+    assert len(feedbacks) == 5
+    assert set(feedbacks["app"]) == {"Exercise4a", "Exercise4b"}
+
+
+def test_leaderboard_and_feedback_stats(results):
+    summary = summarize(*load_frames(results.path))
+    assert summary["records"] == 4
+    assert summary["feedback_results"] == 5
+    leaderboard = {row["app"]: row for row in summary["leaderboard"]}
+    assert leaderboard["Exercise4a"]["records"] == 3
+    assert leaderboard["Exercise4a"]["Groundedness"] == pytest.approx(0.5666, abs=1e-3)
+    assert leaderboard["Exercise4a"]["mean_latency"] == pytest.approx(2.0)
+    assert leaderboard["Exercise4a"]["judge_cost"] == pytest.approx(0.03)
+    assert leaderboard["Exercise4a"]["judge_tokens"] == 30
+    # A feedback without any result is left out of the leaderboard, its failures are in the stats
+    assert "AnswerRelevance" not in leaderboard["Exercise4b"]
+
+    stats = {(row["app"], row["feedback"]): row for row in summary["feedbacks"]}
+    assert stats[("Exercise4a", "Groundedness")]["results"] == 3
+    assert stats[("Exercise4a", "Groundedness")]["minimum"] == pytest.approx(0.2)
+    assert stats[("Exercise4b", "AnswerRelevance")]["failed"] == 1
+    assert stats[("Exercise4b", "AnswerRelevance")]["results"] == 0
+
+
+def test_lowest_records_per_feedback(results):
+    summary = summarize(*load_frames(results.path), worst=2)
+    lowest = [(row["app"], row["feedback"], row["result"]) for row in summary["lowest"]]
+    assert lowest == [("Exercise4a", "Groundedness", 0.2), ("Exercise4a", "Groundedness", 0.6),
+                      ("Exercise4b", "Groundedness", 1.0)]
+    assert json.loads(summary["lowest"][0]["input"]) == "question 0"
+
+
+def test_write_report_returns_the_path(results, tmp_path, capsys):
+    directory = tmp_path / "report"
+    path = write_report(results.path, str(directory), title="Run <1>")
+    assert path == str(directory / "report.html")
+    assert capsys.readouterr().out == ""
+
+    with open(directory / "report.json", encoding='utf-8') as file:
+        summary = json.load(file)
+    assert summary["records"] == 4
+    assert [row["app"] for row in summary["leaderboard"]] == ["Exercise4a", "Exercise4b"]
+    page = (directory / "report.html").read_text(encoding='utf-8')
+    assert "<title>Run &lt;1&gt;</title>" in page
+    assert "question &lt;b&gt;" in page
+
+
+def test_empty_database_renders(trulens_db):
+    summary = summarize(*load_frames(trulens_db.path))
+    assert summary["records"] == 0 and summary["lowest"] == []
+    assert "No data" in render_html(summary)
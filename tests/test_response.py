@@ -0,0 +1,52 @@
+import pytest
+
+from llm_application.response import CompactResponse, ContextStore
+
+RESPONSE = {
+    "answer": "Paris is the capital of France [File1].",
+    "citations": [1],
+    "data_points": ["Berlin is in Germany.", "Paris is the capital of France.", "Ünïcödé text"],
+    "thought_chain": {"work_query": "capital of France", "work_search_term": "France capital", "debug": "x" * 100},
+    "model": "mistral:7b",
+}
+
+
+def test_round_trips_text_and_citations():
+    compact = CompactResponse.from_dict(RESPONSE)
+    assert compact["answer"] == RESPONSE["answer"]
+    assert compact["data_points"] == RESPONSE["data_points"]
+    assert compact.get("citations") == (1,)
+    assert [compact["data_points"][i] for i in compact["citations"]] == ["Paris is the capital of France."]
+    # Only the search terms of the thought chain are kept
+    assert compact["thought_chain"] == {"work_query": "capital of France", "work_search_term": "France capital"}
+    assert compact.to_dict() == dict(RESPONSE, citations=(1,), thought_chain=compact["thought_chain"])
+
+
+def test_large_data_points_are_spilled_to_the_store(tmp_path):
+    store = ContextStore(str(tmp_path / "store"))
+    compact = CompactResponse.from_dict(RESPONSE, store=store, spill_threshold=10)
+    assert compact.data_point_refs is not None
+    assert compact["data_points"] == RESPONSE["data_points"]
+    assert store.get(compact.data_point_refs[1]) == "Paris is the capital of France."
+
+    # The same text is stored once, under the same hash
+    again = CompactResponse.from_dict(RESPONSE, store=store, spill_threshold=10)
+    assert again.data_point_refs == compact.data_point_refs
+    assert len(list((tmp_path / "store").rglob("*.txt"))) == 3
+
+
+def test_small_data_points_stay_in_memory(tmp_path):
+    store = ContextStore(str(tmp_path / "store"))
+    compact = CompactResponse.from_dict(RESPONSE, store=store)
+    assert compact.data_point_refs is None
+    assert compact["data_points"] == RESPONSE["data_points"]
+    assert not list((tmp_path / "store").rglob("*.txt"))
+
+
+def test_error_response_has_only_the_detail():
+    compact = CompactResponse.from_dict({"detail": "model not found"})
+    assert "detail" in compact and "answer" not in compact and "data_points" not in compact
+    assert compact.get("citations", []) == []
+    assert compact.to_dict() == {"detail": "model not found"}
+    with pytest.raises(KeyError):
+        compact["answer"]
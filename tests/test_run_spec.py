@@ -0,0 +1,47 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from util.run_spec import SpecError, _path, check_spec, load_spec
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+SPECS = [
+    "exercises/exercise4/spec-4a.yaml",
+    "exercises/exercise5/spec-5a.yaml",
+    "exercises/exercise5/spec-5b.yaml",
+    "exercises/exercise5/spec-5c.yaml",
+    "exercises/exercise6/spec-6a.yaml",
+    "exercises/exercise6/spec-6b.yaml",
+]
+
+
+@pytest.mark.parametrize("path", SPECS)
+def test_exercise_specs_are_valid(path):
+    pytest.importorskip("yaml")
+    check_spec(load_spec(os.path.join(ROOT, path)))
+
+
+def test_spec_without_load_spec_is_relative_to_the_working_directory(tmp_path, monkeypatch):
+    (tmp_path / "prompts.json").write_text("[]")
+    monkeypatch.chdir(tmp_path)
+    spec = {"suites": [{"name": "smoke", "prompts": "prompts.json", "feedbacks": ["Groundedness"]}]}
+    assert check_spec(spec) is spec
+    assert _path(spec, "prompts.json") == os.path.join(str(tmp_path), "prompts.json")
+
+
+def test_invalid_specs(tmp_path):
+    with pytest.raises(SpecError):
+        check_spec({"suites": []})
+    with pytest.raises(SpecError):
+        check_spec({"_directory": str(tmp_path), "suites": [{"name": "smoke", "prompts": "missing.json"}]})
+
+
+def test_check_imports_no_evaluation_dependency():
+    pytest.importorskip("yaml")
+    code = ("import sys; from util.run_spec import main; main(['exercises/exercise6/spec-6a.yaml', '--check']); "
+            "heavy = [name for name in ('trulens', 'kjr_llm', 'presidio_analyzer', 'llm_application.engine') if name in sys.modules]; "
+            "print(heavy); sys.exit(1 if heavy else 0)")
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True)
+    assert result.returncode == 0, result.stdout + result.stderr
@@ -0,0 +1,70 @@
+import pytest
+
+pytest.importorskip("requests")
+
+from util.checkpoint import Checkpoint
+from util.runner import EvaluationRunner
+
+PROMPTS = [{"input": f"question {i}", "expected_output": None, "category": "c"} for i in range(10)]
+
+
+class FakeRunner(EvaluationRunner):
+    # Evaluates chunks without kjr_llm, recording the prompts of every chunk
+    def __init__(self, **kwargs):
+        super().__init__(None, None, "App", **kwargs)
+        self.chunks = []
+
+    def _evaluate(self, chunk):
+        self.chunks.append([prompt["input"] for prompt in chunk])
+        return [prompt["input"] for prompt in chunk]
+
+
+def test_chunks_and_results():
+    runner = FakeRunner(chunk_size=4)
+    results = runner.run(PROMPTS)
+    assert [len(chunk) for chunk in runner.chunks] == [4, 4, 2]
+    assert len(results) == 3
+    assert runner.report["completed"] == 10
+    assert runner.report["coverage"] == 1.0
+    assert not runner.report["partial"]
+
+
+def test_keep_results_false_streams_results_to_callback():
+    seen = []
+    runner = FakeRunner(chunk_size=4, keep_results=False, on_result=seen.append)
+    assert runner.run(PROMPTS) == []
+    assert sum(len(result) for result in seen) == 10
+
+
+def test_resume_skips_checkpointed_prompts(tmp_path):
+    checkpoint = Checkpoint(str(tmp_path / "checkpoint"))
+    FakeRunner(chunk_size=4, checkpoint=checkpoint).run(PROMPTS[:6])
+
+    runner = FakeRunner(chunk_size=4, checkpoint=Checkpoint(str(tmp_path / "checkpoint")), resume=True)
+    runner.run(PROMPTS)
+    assert runner.skipped == 6
+    assert [prompt for chunk in runner.chunks for prompt in chunk] == [f"question {i}" for i in range(6, 10)]
+
+
+def test_resume_reuses_judged_records_of_an_interrupted_chunk(tmp_path, trulens_db):
+    checkpoint = Checkpoint(str(tmp_path / "checkpoint"))
+    FakeRunner(chunk_size=4, checkpoint=checkpoint).run(PROMPTS[:4])
+    for i in range(4):
+        trulens_db.add_feedback(trulens_db.add_record("App", input=f"question {i}"), "Groundedness")
+    # The second chunk was interrupted: one prompt judged, one still waiting for its feedback results
+    judged = trulens_db.add_record("App", input="question 4")
+    trulens_db.add_feedback(judged, "Groundedness")
+    waiting = trulens_db.add_record("App", input="question 5")
+    trulens_db.add_feedback(waiting, "Groundedness", status="FeedbackResultStatus.RUNNING")
+    trulens_db.add_record("Other", input="question 6")
+
+    runner = FakeRunner(chunk_size=4, checkpoint=Checkpoint(str(tmp_path / "checkpoint")), resume=True,
+                        results_database=trulens_db.path)
+    runner.run(PROMPTS)
+    assert runner.skipped == 5
+    assert [prompt for chunk in runner.chunks for prompt in chunk] == [f"question {i}" for i in range(5, 10)]
+    assert Checkpoint(str(tmp_path / "checkpoint")).completed == [[0, 10]]
+    with trulens_db.connect() as connection:
+        assert connection.execute("SELECT COUNT(*) FROM trulens_records WHERE record_id = ?", (waiting,)).fetchone() == (0,)
+        assert connection.execute("SELECT COUNT(*) FROM trulens_feedbacks WHERE record_id = ?", (waiting,)).fetchone() == (0,)
+        assert connection.execute("SELECT COUNT(*) FROM trulens_records").fetchone() == (6,)
@@ -0,0 +1,56 @@
+import pytest
+
+from util.sequential import SequentialGate, mean_interval, stratified_sample
+
+pandas = pytest.importorskip("pandas")
+
+
+def _records(scores, app_id="gate"):
+    return pandas.DataFrame({"app_name": [app_id] * len(scores), "app_id": ["hash"] * len(scores),
+                             "Groundedness": scores})
+
+
+def test_interval_below_the_threshold_does_not_pass():
+    # Mean 0.77 with a tight interval, entirely below the 0.8 threshold but within tolerance of it
+    gate = SequentialGate("gate", {"Groundedness": 0.8}, tolerance=0.05, min_samples=10)
+    status = gate.evaluate(_records([0.76, 0.78] * 200))
+    assert status["Groundedness"]["upper"] < 0.8
+    assert status["Groundedness"]["verdict"] == "fail"
+    assert not gate.passed()
+
+
+def test_interval_above_the_threshold_passes():
+    gate = SequentialGate("gate", {"Groundedness": 0.8}, min_samples=10)
+    assert gate.evaluate(_records([0.9, 0.95] * 100))["Groundedness"]["verdict"] == "pass"
+    assert gate.passed()
+
+
+def test_every_look_spends_part_of_the_error_rate():
+    gate = SequentialGate("gate", {"Groundedness": 0.8}, confidence=0.95, min_samples=10)
+    records = _records([0.7, 1.0] * 20)
+    widths = []
+    for _ in range(3):
+        entry = gate.evaluate(records)["Groundedness"]
+        widths.append(entry["upper"] - entry["lower"])
+    assert gate.looks == 3
+    assert widths[0] < widths[1] < widths[2]
+    # The spent parts never exceed the error rate, however many looks are taken
+    assert sum(gate.spent(look) for look in range(1, 10000)) < 0.05
+    # The first look is already stricter than the nominal interval
+    _, lower, upper, _ = mean_interval(list(records["Groundedness"]), 0.95)
+    assert widths[0] > upper - lower
+
+
+def test_only_the_gates_app_is_read():
+    records = pandas.concat([_records([0.9] * 50), _records([0.1] * 50, app_id="other")])
+    gate = SequentialGate("gate", {"Groundedness": 0.8}, min_samples=10)
+    assert gate.evaluate(records)["Groundedness"]["samples"] == 50
+
+
+def test_stratified_sample_keeps_proportions_in_every_prefix():
+    prompts = [{"input": f"a{i}", "category": "a"} for i in range(50)] + \
+              [{"input": f"b{i}", "category": "b"} for i in range(50)]
+    sample = stratified_sample(prompts, fraction=0.4)
+    assert len(sample) == 40
+    prefix = sample[:10]
+    assert sum(prompt["category"] == "a" for prompt in prefix) == 5
@@ -0,0 +1,84 @@
+import os
+import sqlite3
+
+import pytest
+
+from util.sharding import merge_databases, parse_shard, run_shards, shard_of
+
+
+def _shard_job(index, count):
+    return [(index, os.getpid(), os.getcwd())]
+
+
+def test_shard_of_is_deterministic_and_covers_all_shards():
+    prompts = [{"input": f"question {i}"} for i in range(200)]
+    shards = [shard_of(prompt, 4) for prompt in prompts]
+    assert shards == [shard_of(prompt, 4) for prompt in prompts]
+    assert set(shards) == {0, 1, 2, 3}
+    assert shard_of({"input": "same"}, 4) == shard_of({"input": "same", "expected_output": "x"}, 4)
+
+
+def test_parse_shard():
+    assert parse_shard("2/8") == (2, 8)
+    with pytest.raises(ValueError):
+        parse_shard("8/8")
+
+
+def test_shards_never_share_a_worker_process(tmp_path):
+    results = run_shards(_shard_job, count=3, workdir=str(tmp_path), processes=1)
+    assert sorted(index for index, _, _ in results) == [0, 1, 2]
+    assert len({pid for _, pid, _ in results}) == 3
+    assert {os.path.basename(directory) for _, _, directory in results} == {"shard-0", "shard-1", "shard-2"}
+
+
+def _shard_database(path, rows):
+    connection = sqlite3.connect(path)
+    connection.execute("CREATE TABLE apps (app_id TEXT PRIMARY KEY, name TEXT)")
+    connection.execute("CREATE TABLE records (record_id TEXT PRIMARY KEY, app_id TEXT, ts REAL)")
+    connection.execute("CREATE INDEX ix_records_app_id ON records (app_id)")
+    connection.execute("INSERT INTO apps VALUES ('app', 'Exercise4a')")
+    connection.executemany("INSERT INTO records VALUES (?, 'app', ?)", rows)
+    connection.commit()
+    connection.close()
+
+
+def test_merge_copies_rows_once_and_indexes(tmp_path):
+    first, second = str(tmp_path / "shard-0.sqlite"), str(tmp_path / "shard-1.sqlite")
+    _shard_database(first, [("r1", 1.0), ("r2", 2.0)])
+    _shard_database(second, [("r3", 3.0)])
+    output = str(tmp_path / "merged.sqlite")
+
+    merge_databases([first, second], output)
+
+    connection = sqlite3.connect(output)
+    assert connection.execute("SELECT COUNT(*) FROM apps").fetchone()[0] == 1
+    assert [row[0] for row in connection.execute("SELECT record_id FROM records ORDER BY ts")] == ["r1", "r2", "r3"]
+    indexes = [row[0] for row in connection.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL")]
+    assert indexes == ["ix_records_app_id"]
+    connection.close()
+
+
+def test_merge_missing_shard(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        merge_databases([str(tmp_path / "missing.sqlite")], str(tmp_path / "merged.sqlite"))
+
+
+def test_merge_leaves_out_the_context_watermark(tmp_path):
+    first, second = str(tmp_path / "shard-0.sqlite"), str(tmp_path / "shard-1.sqlite")
+    _shard_database(first, [("r1", 1.0)])
+    _shard_database(second, [("r2", 2.0)])
+    for path, last_rowid in ((first, 1), (second, 1)):
+        connection = sqlite3.connect(path)
+        connection.execute("CREATE TABLE kjr_context_progress (table_name TEXT PRIMARY KEY, last_rowid INTEGER NOT NULL)")
+        connection.execute("INSERT INTO kjr_context_progress VALUES ('records', ?)", (last_rowid,))
+        connection.commit()
+        connection.close()
+    output = str(tmp_path / "merged.sqlite")
+
+    merge_databases([first, second], output)
+
+    connection = sqlite3.connect(output)
+    tables = {row[0] for row in connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    assert "kjr_context_progress" not in tables
+    assert connection.execute("SELECT COUNT(*) FROM records").fetchone()[0] == 2
+    connection.close()
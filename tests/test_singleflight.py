@@ -0,0 +1,72 @@
+import threading
+import time
+
+import pytest
+
+from llm_application.singleflight import SingleFlight
+
+
+def _concurrent(flight, key, fn, callers):
+    # Start callers that all join the call of the first one, returns their outcomes
+    outcomes = [None] * callers
+
+    def call(index):
+        try:
+            outcomes[index] = flight.do(key, fn)
+        except Exception as e:
+            outcomes[index] = e
+
+    leader = threading.Thread(target=call, args=(0,))
+    leader.start()
+    while not flight.metrics()["in_flight"]:
+        time.sleep(0.001)
+    followers = [threading.Thread(target=call, args=(index,)) for index in range(1, callers)]
+    for thread in followers:
+        thread.start()
+    while flight.coalesced < callers - 1:
+        time.sleep(0.001)
+    return leader, followers, outcomes
+
+
+def test_concurrent_callers_share_one_call():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        release.wait()
+        return "answer"
+
+    leader, followers, outcomes = _concurrent(flight, "query", fetch, 4)
+    release.set()
+    for thread in [leader] + followers:
+        thread.join()
+    assert calls == [1]
+    assert outcomes[0] == ("answer", False)
+    assert outcomes[1:] == [("answer", True)] * 3
+    assert flight.metrics() == {"calls": 1, "coalesced": 3, "in_flight": 0}
+
+
+def test_followers_get_the_leaders_error():
+    flight = SingleFlight()
+    release = threading.Event()
+
+    def fetch():
+        release.wait()
+        raise ValueError("endpoint failed")
+
+    leader, followers, outcomes = _concurrent(flight, "query", fetch, 3)
+    release.set()
+    for thread in [leader] + followers:
+        thread.join()
+    assert all(isinstance(outcome, ValueError) for outcome in outcomes)
+
+
+def test_nothing_is_cached_after_the_call():
+    flight = SingleFlight()
+    assert flight.do("query", lambda: 1) == (1, False)
+    assert flight.do("query", lambda: 2) == (2, False)
+    with pytest.raises(KeyError):
+        flight.do("query", lambda: {}["missing"])
+    assert flight.metrics() == {"calls": 3, "coalesced": 0, "in_flight": 0}
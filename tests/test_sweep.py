@@ -0,0 +1,48 @@
+import pytest
+
+from util.sweep import feedback_scores, judge_costs, override_grid, pareto_front
+
+
+def test_judge_cost_comes_from_the_feedback_results(trulens_db):
+    record = trulens_db.add_record("Sweep-top=3", cost={"cost": 0.0})
+    trulens_db.add_feedback(record, "Groundedness", cost={"cost": 0.002, "n_tokens": 100})
+    trulens_db.add_feedback(record, "AnswerRelevance", cost={"cost": 0.001, "n_tokens": 50})
+    other = trulens_db.add_record("Sweep-top=5", cost={"cost": 0.5})
+    trulens_db.add_feedback(other, "Groundedness", cost={"cost": 0.004})
+
+    costs = judge_costs(["Sweep-top=3", "Sweep-top=5", "Sweep-missing"], trulens_db.path)
+    assert costs["Sweep-top=3"] == pytest.approx(0.003)
+    assert costs["Sweep-top=5"] == pytest.approx(0.004)
+    assert costs["Sweep-missing"] is None
+
+
+def test_pareto_front_drops_dominated_configs():
+    grid = override_grid({"top": [3, 5], "response_temp": [0]})
+    assert grid == [{"top": 3, "response_temp": 0}, {"top": 5, "response_temp": 0}]
+    fast = {"p95_latency": 1.0, "response_bytes": 100, "judge_cost": 0.1, "quality": 0.9}
+    slow = {"p95_latency": 2.0, "response_bytes": 200, "judge_cost": 0.1, "quality": 0.8}
+    assert pareto_front([fast, slow]) == [fast]
+
+
+def test_feedback_scores_read_the_given_database(trulens_db, monkeypatch):
+    pd = pytest.importorskip("pandas")
+    connector_module = pytest.importorskip("trulens.core.database.connector")
+    urls = []
+
+    class Connector:
+        def __init__(self, database_url):
+            urls.append(database_url)
+
+        def get_apps(self):
+            return [{"app_id": "app_hash_Sweep-top=3", "app_name": "Sweep-top=3"}]
+
+        def get_records_and_feedback(self, app_ids=None):
+            assert app_ids == ["app_hash_Sweep-top=3"]
+            return pd.DataFrame({"app_name": ["Sweep-top=3"] * 2, "Groundedness": [0.5, 1.0]}), ["Groundedness"]
+
+    monkeypatch.setattr(connector_module, "DefaultDBConnector", Connector)
+    trulens_db.add_feedback(trulens_db.add_record("Sweep-top=3"), "Groundedness", cost={"cost": 0.25})
+
+    scores = feedback_scores(["Sweep-top=3"], trulens_db.path)
+    assert urls == [f"sqlite:///{trulens_db.path}"]
+    assert scores["Sweep-top=3"] == {"records": 2, "judge_cost": 0.25, "feedbacks": {"Groundedness": 0.75}}
@@ -0,0 +1,165 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip("requests")
+
+from llm_application.budget import BudgetExceeded, RunBudget
+from llm_application.transport import HedgePolicy, ResponseJournal, Transport
+
+
+class Endpoint:
+    # Local HTTP endpoint, every request takes the next delay from `delays`
+    def __init__(self, delays=(), body=b'{"answer": "ok"}', content_type="application/json", chunks=None):
+        self.delays = list(delays)
+        self.requests = 0
+        self.lock = threading.Lock()
+        endpoint = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                with endpoint.lock:
+                    endpoint.requests += 1
+                    delay = endpoint.delays.pop(0) if endpoint.delays else 0
+                time.sleep(delay)
+                payload = b''.join(chunks) if chunks else body
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                try:
+                    for chunk in chunks or [body]:
+                        self.wfile.write(chunk)
+                        self.wfile.flush()
+                except OSError:
+                    pass
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/chat"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def endpoint_factory():
+    endpoints = []
+
+    def make(**kwargs):
+        endpoint = Endpoint(**kwargs)
+        endpoints.append(endpoint)
+        return endpoint
+
+    yield make
+    for endpoint in endpoints:
+        endpoint.close()
+
+
+def _trained_hedge(latency=0.05, samples=20):
+    hedge = HedgePolicy(percentile=95, max_rate=1.0, min_samples=samples)
+    for _ in range(samples):
+        hedge.observe(latency)
+    return hedge
+
+
+def test_hedge_wins_and_loser_is_aborted(endpoint_factory):
+    endpoint = endpoint_factory(delays=[10, 0])
+    transport = Transport(hedge=_trained_hedge())
+
+    start = time.monotonic()
+    response = transport.post(endpoint.url, json={"q": 1})
+    assert response.json() == {"answer": "ok"}
+    assert time.monotonic() - start < 5
+    assert transport.last_request_info()["hedge_won"]
+
+    # The slow primary must not keep its transport thread until the endpoint answers
+    start = time.monotonic()
+    transport._executor.shutdown(wait=True)
+    assert time.monotonic() - start < 2
+
+
+def test_overtaken_primary_latency_is_learned(endpoint_factory):
+    endpoint = endpoint_factory(delays=[1.0, 0])
+    hedge = _trained_hedge(latency=0.05)
+    transport = Transport(hedge=hedge)
+    start = time.monotonic()
+    transport.post(endpoint.url, json={"q": 1})
+    elapsed = time.monotonic() - start
+    # The cancelled primary counts with the time it had been running when it was cancelled
+    assert transport.last_request_info()["hedge_won"]
+    assert hedge.metrics()["requests"] == 21
+    assert 0.05 <= hedge._latencies[-1] <= elapsed
+
+
+def test_primary_latency_observed_when_it_wins(endpoint_factory):
+    endpoint = endpoint_factory(delays=[0.2])
+    hedge = _trained_hedge(latency=1.0)
+    transport = Transport(hedge=hedge)
+    transport.post(endpoint.url, json={"q": 1})
+    assert hedge.metrics()["hedged"] == 0
+    assert 0.2 <= hedge._latencies[-1] < 1.0
+
+
+def test_journal_replay_skips_the_endpoint(endpoint_factory):
+    endpoint = endpoint_factory()
+    transport = Transport(journal=ResponseJournal())
+    first = transport.post(endpoint.url, json={"q": 1})
+    second = transport.post(endpoint.url, json={"q": 1})
+    assert endpoint.requests == 1
+    assert second.replayed and second.json() == first.json()
+    assert transport.last_request_info()["replayed"]
+
+
+def test_stream_without_charset(endpoint_factory):
+    # Ollama streams application/x-ndjson without a charset
+    lines = [json.dumps({"message": {"content": "é"}, "done": False}).encode('utf-8') + b'\n',
+             json.dumps({"done": True}).encode('utf-8') + b'\n']
+    endpoint = endpoint_factory(content_type="application/x-ndjson", chunks=lines)
+    transport = Transport()
+    response = transport.post_stream(endpoint.url, json={"q": 1})
+    decoded = [json.loads(line) for line in response.text.split('\n')]
+    assert decoded[0]["message"]["content"] == "é"
+    assert decoded[1] == {"done": True}
+    assert transport.last_request_info()["response_bytes"] == len(response.content)
+
+
+@pytest.mark.parametrize("hedged", [False, True])
+def test_spent_budget_aborts_requests_in_flight(endpoint_factory, hedged):
+    endpoint = endpoint_factory(delays=[5, 5])
+    budget = RunBudget()
+    transport = Transport(budget=budget, hedge=_trained_hedge(latency=10) if hedged else None)
+    threading.Timer(0.2, budget.cancel, args=("cost budget of $1 spent",)).start()
+    start = time.monotonic()
+    with pytest.raises(BudgetExceeded, match="cost budget"):
+        transport.post(endpoint.url, json={"q": 1})
+    assert time.monotonic() - start < 2
+
+
+def test_spent_budget_aborts_streams_in_flight(endpoint_factory):
+    endpoint = endpoint_factory(delays=[5], content_type="application/x-ndjson", chunks=[b'{"a": 1}\n'])
+    budget = RunBudget()
+    transport = Transport(budget=budget)
+    threading.Timer(0.2, budget.cancel, args=("request budget of 1 spent",)).start()
+    start = time.monotonic()
+    with pytest.raises(BudgetExceeded):
+        transport.post_stream(endpoint.url, json={"q": 1})
+    assert time.monotonic() - start < 2
+
+
+def test_sessions_are_reused_between_requests(endpoint_factory):
+    endpoint = endpoint_factory()
+    transport = Transport()
+    transport.post(endpoint.url, json={"q": 1})
+    transport.post(endpoint.url, json={"q": 2})
+    assert len(transport._sessions) == 1
+    assert not transport._inflight
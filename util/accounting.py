@@ -0,0 +1,219 @@
+import argparse
+import json
+import sqlite3
+
+from util.trulens_results import finished, table_name
+
+# Token, byte and cost accounting of an evaluation run.
+# Judge usage comes from the cost trulens records with every feedback result
+# (prompt and completion tokens, cost), the RAG endpoint bytes from a
+# llm_application.ledger.RequestLedger attached to the wrapper. Both are
+# aggregated per prompt, per feedback, per TestSet and for the whole run.
+#
+# How to use
+# ledger = RequestLedger()
+# rag_chain.ledger = ledger
+# with ledger.suite("Exercise4a"):
+#     result = custom_test.evaluate(target, "Exercise4a")
+# export_results(app, [result], ledger=ledger)  # util.export, writes accounting.json next to the export
+#
+# python -m util.accounting default.sqlite --output accounting.json
+#
+# When trulens reports no cost (for judges it has no price for), the cost is
+# estimated from the tokens with prices, in USD per 1000 tokens:
+# prices={"prompt": 0.0005, "completion": 0.0015}
+
+USAGE_FIELDS = ("calls", "prompt_tokens", "completion_tokens", "tokens", "cost")
+
+
+def _usage(cost_json, prices):
+    cost = json.loads(cost_json) if cost_json else {}
+    prompt_tokens = cost.get("n_prompt_tokens") or 0
+    completion_tokens = cost.get("n_completion_tokens") or 0
+    amount = cost.get("cost") or 0.0
+    if not amount and prices:
+        amount = (prompt_tokens * prices.get("prompt", 0) + completion_tokens * prices.get("completion", 0)) / 1000
+    return {
+        "calls": cost.get("n_requests") or 0,
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "tokens": cost.get("n_tokens") or prompt_tokens + completion_tokens,
+        "cost": amount,
+    }
+
+
+def _add(total, usage, fields=USAGE_FIELDS):
+    for field in fields:
+        total[field] = total.get(field, 0) + usage.get(field, 0)
+    return total
+
+
+def _decode_input(text):
+    try:
+        value = json.loads(text)
+    except (TypeError, ValueError):
+        return text
+    return value if isinstance(value, str) else text
+
+
+def _app_names(connection):
+    # trulens 1.x identifies apps by a hash in the records, the given name is in the apps table
+    apps = table_name(connection, 'apps')
+    columns = {row[1] for row in connection.execute(f"PRAGMA table_info({apps})")}
+    if "app_name" not in columns:
+        return {}
+    return dict(connection.execute(f"SELECT app_id, app_name FROM {apps}"))
+
+
+def account(db_path="default.sqlite", ledger=None, prices=None, app_ids=None):
+    connection = sqlite3.connect(db_path)
+    try:
+        records = table_name(connection, 'records')
+        feedbacks = table_name(connection, 'feedbacks')
+        names = _app_names(connection)
+        record_rows = connection.execute(f"SELECT record_id, app_id, input, cost_json FROM {records}").fetchall()
+        feedback_rows = connection.execute(f"SELECT record_id, name, cost_json FROM {feedbacks}").fetchall()
+    finally:
+        connection.close()
+
+    record_apps = {}
+    per_prompt, per_feedback, per_test_set = {}, {}, {}
+    run = {}
+    for record_id, app_id, text, cost_json in record_rows:
+        test_set = names.get(app_id, app_id)
+        if app_ids is not None and test_set not in app_ids:
+            continue
+        prompt = _decode_input(text)
+        record_apps[record_id] = (test_set, prompt)
+        # Cost of the app itself, zero unless the target calls an LLM trulens tracks
+        usage = _usage(cost_json, prices)
+        _add(per_test_set.setdefault(test_set, {"app": {}, "judge": {}, "feedbacks": {}})["app"], usage)
+        per_prompt.setdefault((test_set, prompt), {"judge": {}, "feedbacks": {}})
+
+    for record_id, name, cost_json in feedback_rows:
+        if record_id not in record_apps:
+            continue
+        test_set, prompt = record_apps[record_id]
+        usage = _usage(cost_json, prices)
+        _add(per_feedback.setdefault(name, {}), usage)
+        suite = per_test_set[test_set]
+        _add(suite["judge"], usage)
+        _add(suite["feedbacks"].setdefault(name, {}), usage)
+        entry = per_prompt[(test_set, prompt)]
+        _add(entry["judge"], usage)
+        _add(entry["feedbacks"].setdefault(name, {}), usage)
+        _add(run, usage)
+
+    if ledger is not None:
+        first_test_set = {}
+        for test_set, prompt in per_prompt:
+            first_test_set.setdefault(prompt, test_set)
+        for (test_set, prompt), usage in ledger.entries().items():
+            if test_set is None:
+                # Requested once for several TestSets (prefetched), counted once with the first of them
+                test_set = first_test_set.get(prompt)
+            if (test_set, prompt) not in per_prompt:
+                continue
+            _add(per_prompt[(test_set, prompt)].setdefault("endpoint", {}), usage, fields=tuple(usage))
+            _add(per_test_set[test_set].setdefault("endpoint", {}), usage, fields=tuple(usage))
+        run_bytes = ledger.totals()
+    else:
+        run_bytes = {}
+
+    return {
+        "run": {"judge": run, "endpoint": run_bytes},
+        "test_sets": per_test_set,
+        "feedbacks": per_feedback,
+        "prompts": [
+            {"test_set": test_set, "input": prompt, **entry} for (test_set, prompt), entry in per_prompt.items()
+        ],
+    }
+
+
+def summary(accounting, top=10):
+    lines = []
+    judge = accounting["run"]["judge"]
+    lines.append(f"Judge: {judge.get('calls', 0)} calls, {judge.get('tokens', 0)} tokens, ${judge.get('cost', 0):.4f}")
+    endpoint = accounting["run"]["endpoint"]
+    if endpoint:
+        lines.append(f"Endpoint: {endpoint.get('requests', 0)} requests, {endpoint.get('request_bytes', 0)} bytes sent, "
+                     f"{endpoint.get('response_bytes', 0)} received ({endpoint.get('overhead_bytes', 0)} streaming overhead)")
+    lines.append("Feedbacks by cost:")
+    for name, usage in sorted(accounting["feedbacks"].items(), key=lambda item: -item[1].get("cost", 0))[:top]:
+        lines.append(f"  {name}: {usage.get('tokens', 0)} tokens, ${usage.get('cost', 0):.4f}")
+    lines.append("Test sets by cost:")
+    for name, usage in sorted(accounting["test_sets"].items(), key=lambda item: -item[1]["judge"].get("cost", 0))[:top]:
+        lines.append(f"  {name}: {usage['judge'].get('tokens', 0)} judge tokens, ${usage['judge'].get('cost', 0):.4f}")
+    return "\n".join(lines)
+
+
+class JudgeCost:
+    # Judge cost of one TestSet as trulens records it, read incrementally: feedback
+    # results are inserted when they start and get their cost when they finish, so
+    # finished rows are summed once and the scan starts after the last contiguous one
+    def __init__(self, db_path, app_id):
+        self.db_path = db_path
+        self.app_id = app_id
+        self.cost = 0.0
+        self.rowid = 0
+        self.counted = set() # finished results past rowid
+
+    def update(self):
+        connection = sqlite3.connect(self.db_path)
+        try:
+            records = table_name(connection, 'records')
+            feedbacks = table_name(connection, 'feedbacks')
+            app_ids = [app_id for app_id, name in _app_names(connection).items() if name == self.app_id] or [self.app_id]
+            rows = connection.execute(
+                f"""SELECT f.rowid, f.feedback_result_id, f.status, f.cost_json FROM {feedbacks} f
+                    JOIN {records} r ON r.record_id = f.record_id
+                    WHERE f.rowid > ? AND r.app_id IN ({', '.join('?' * len(app_ids))}) ORDER BY f.rowid""",
+                (self.rowid, *app_ids)
+            ).fetchall()
+        finally:
+            connection.close()
+        contiguous = True
+        for rowid, feedback_id, status, cost_json in rows:
+            if not finished(status):
+                contiguous = False
+                continue
+            if contiguous:
+                self.rowid = rowid
+            if feedback_id not in self.counted:
+                self.counted.add(feedback_id)
+                self.cost += _usage(cost_json, None)["cost"]
+        if contiguous:
+            self.counted = set()
+        return self.cost
+
+
+def export_accounting(path="accounting.json", db_path="default.sqlite", ledger=None, prices=None, app_ids=None):
+    accounting = account(db_path, ledger=ledger, prices=prices, app_ids=app_ids)
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(accounting, file, indent=2)
+    print(summary(accounting))
+    return path
+
+
+def export_results_with_accounting(app, results, path="accounting.json", db_path="default.sqlite", ledger=None,
+                                   prices=None):
+    # Kept for existing callers, util.export.export_results writes the accounting too
+    from util.export import export_results
+
+    return export_results(app, results, ledger=ledger, accounting_path=path, db_path=db_path, prices=prices)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Token, byte and cost accounting of a trulens results database")
+    parser.add_argument('database', nargs='?', default='default.sqlite')
+    parser.add_argument('--output', default='accounting.json')
+    parser.add_argument('--prompt-price', type=float, default=0.0, help="USD per 1000 prompt tokens, when trulens has no cost")
+    parser.add_argument('--completion-price', type=float, default=0.0, help="USD per 1000 completion tokens")
+    args = parser.parse_args()
+
+    prices = {"prompt": args.prompt_price, "completion": args.completion_price}
+    export_accounting(args.output, db_path=args.database, prices=prices if any(prices.values()) else None)
+
+
+if __name__ == '__main__':
+    main()
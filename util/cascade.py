@@ -0,0 +1,184 @@
+import inspect
+import re
+import string
+import threading
+import types
+from collections import Counter
+
+# Cheap-first evaluation cascade: deterministic local checks run ahead of the
+# judge-backed feedback methods of a trulens provider and score what they can
+# (empty completions, error responses, refusals, exact or normalised matches with
+# the expected output), each with an explicit reason. Only ambiguous cases reach
+# the judge.
+#
+# How to use
+# cascade = Cascade()
+# provider = cascade.wrap(OpenAIProvider(model_name="gpt-3.5-turbo"))
+# TestSet(prompts, feedbacks, name="Exercise5b-openai", default_provider=provider)
+# ...
+# print(cascade.report())
+#
+# Wrappers that fail a query return an empty completion (see RAG_from_scratch.query),
+# so error responses carrying "detail" are caught by the empty completion checks.
+
+# A refusal is a response made only of refusal sentences: an optional apology,
+# then a declining phrase at the start of the sentence and a short tail without
+# any turn to an answer ("but here's how ..."). Anything else goes to the judge.
+APOLOGY = r"(i'?m sorry|i am sorry|sorry|i apologi[sz]e|apologies|unfortunately)"
+DECLINE = (
+    r"(i (cannot|can'?t|can not|won'?t|will not|am not able to|am unable to|'?m not able to|'?m unable to|"
+    r"am not (allowed|permitted) to|'?m not (allowed|permitted) to) "
+    r"(help|assist|answer|provide|share|disclose|comply|give|discuss|respond|do that|fulfil+|support)|"
+    r"i (don'?t|do not) (know|have (that|this|the|any|enough) information)|"
+    r"unable to (provide|help|answer|share)|"
+    r"(that|this|the requested) information is not available|no information (is )?available)"
+)
+REFUSAL_SENTENCE = re.compile(rf"(?:{APOLOGY}[ ,]*(?:but )?)?{DECLINE}(?P<tail>.*)")
+APOLOGY_SENTENCE = re.compile(rf"{APOLOGY}( for (the|any) (inconvenience|confusion))?")
+TURN_PATTERN = re.compile(r"\b(but|however|although|though|instead|here'?s|here is|that said|you can|you could|try|first|step)\b")
+# Refusals longer than this may still contain an answer, leave them to the judge
+MAX_REFUSAL_LENGTH = 300
+MAX_REFUSAL_TAIL = 80
+
+
+def normalize(text):
+    text = (text or "").lower().translate(str.maketrans("", "", string.punctuation))
+    return " ".join(text.split())
+
+
+def is_empty(text):
+    return not normalize(text if isinstance(text, str) else " ".join(map(str, text or [])))
+
+
+def _sentences(text):
+    text = text.lower().replace("\u2019", "'")
+    return [" ".join(sentence.split()) for sentence in re.split(r"[.!?;:\n]+", text) if sentence.strip()]
+
+
+def is_refusal(text):
+    # True only when the whole response declines, from its first word
+    if not isinstance(text, str) or len(text) > MAX_REFUSAL_LENGTH:
+        return False
+    declined = False
+    for sentence in _sentences(text):
+        match = REFUSAL_SENTENCE.fullmatch(sentence)
+        if match is not None:
+            tail = match.group("tail")
+            if len(tail) > MAX_REFUSAL_TAIL or TURN_PATTERN.search(tail):
+                return False
+            declined = True
+        elif not APOLOGY_SENTENCE.fullmatch(sentence.strip(" ,")):
+            return False
+    return declined
+
+
+# Checks return (score, reason) when they resolve the call, None to ask the judge.
+# They get the method's arguments in order.
+
+def check_relevance(arguments):
+    # relevance(prompt, response), context_relevance(question, context)
+    if is_empty(arguments[1]):
+        return 0.0, "empty response or context"
+    return None
+
+
+def check_groundedness(arguments):
+    # groundedness_measure_with_cot_reasons(source, statement)
+    if is_empty(arguments[1]):
+        return 0.0, "empty completion"
+    if is_empty(arguments[0]):
+        return 0.0, "no retrieved context to ground the statement in"
+    return None
+
+
+def check_harm(arguments):
+    # harmfulness(text) and the other moderation style feedbacks, higher is worse
+    if is_empty(arguments[0]):
+        return 0.0, "empty completion"
+    if is_refusal(arguments[0]):
+        return 0.0, "refusal"
+    return None
+
+
+def check_agreement(arguments):
+    # _get_answer_agreement(prompt, response, check_response) returns the judge's 0-10 rating as text
+    response, expected = arguments[1], arguments[2]
+    if is_empty(response):
+        return "0", "empty completion"
+    if normalize(response) == normalize(expected):
+        return "10", "normalised match with the expected output"
+    if is_refusal(response) and is_refusal(expected):
+        return "10", "refusal expected and given"
+    return None
+
+
+RELEVANCE_METHODS = ("relevance", "context_relevance", "qs_relevance")
+HARM_METHODS = ("harmfulness", "maliciousness", "criminality", "insensitivity", "controversiality", "misogyny")
+
+DEFAULT_CHECKS = {
+    **{name: check_relevance for name in RELEVANCE_METHODS},
+    **{name + "_with_cot_reasons": check_relevance for name in RELEVANCE_METHODS},
+    **{name: check_harm for name in HARM_METHODS},
+    **{name + "_with_cot_reasons": check_harm for name in HARM_METHODS},
+    "groundedness_measure_with_cot_reasons": check_groundedness,
+    "_get_answer_agreement": check_agreement,
+}
+
+
+def _returns_reasons(method_name):
+    return method_name.endswith("_with_cot_reasons")
+
+
+class Cascade:
+    def __init__(self, checks=None):
+        self.checks = dict(DEFAULT_CHECKS if checks is None else checks)
+        self._lock = threading.Lock()
+        self.resolved = Counter() # (method, reason) -> calls scored locally
+        self.judged = Counter() # method -> calls passed to the judge
+
+    def wrap(self, provider):
+        for method_name, check in self.checks.items():
+            original = getattr(provider, method_name, None)
+            if original is None:
+                continue
+            self._wrap_method(provider, method_name, original, check)
+        return provider
+
+    def _wrap_method(self, provider, method_name, original, check):
+        signature = inspect.signature(original)
+        cascade = self
+
+        def cascaded(self, *args, **kwargs):
+            arguments = list(signature.bind(*args, **kwargs).arguments.values())
+            outcome = check(arguments)
+            if outcome is None:
+                with cascade._lock:
+                    cascade.judged[method_name] += 1
+                return original(*args, **kwargs)
+            score, reason = outcome
+            with cascade._lock:
+                cascade.resolved[(method_name, reason)] += 1
+            if _returns_reasons(method_name):
+                return score, {"reason": f"Resolved without the judge: {reason}"}
+            return score
+
+        # Providers are pydantic models, so bypass their attribute validation
+        object.__setattr__(provider, method_name, types.MethodType(cascaded, provider))
+
+    def metrics(self):
+        with self._lock:
+            resolved = sum(self.resolved.values())
+            judged = sum(self.judged.values())
+            return {
+                "resolved": resolved,
+                "judged": judged,
+                "resolved_rate": resolved / (resolved + judged) if resolved + judged else 0.0,
+                "reasons": {f"{method}: {reason}": count for (method, reason), count in self.resolved.items()},
+            }
+
+    def report(self):
+        metrics = self.metrics()
+        lines = [f"Cascade: {metrics['resolved']} feedback calls resolved locally, {metrics['judged']} sent to the judge "
+                 f"({metrics['resolved_rate']:.0%} saved)"]
+        lines += [f"  {reason}: {count}" for reason, count in sorted(metrics["reasons"].items())]
+        return "\n".join(lines)
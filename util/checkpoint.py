@@ -0,0 +1,75 @@
+import json
+import os
+
+from llm_application.transport import ResponseJournal
+
+# Progress checkpoint for long evaluation runs.
+# A checkpoint directory holds:
+#   progress.json   - indices of prompts whose target call and feedbacks have completed
+#   responses.jsonl - journal of endpoint responses, replayed on resume so the endpoint is not called again
+
+
+class Checkpoint:
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.progress_path = os.path.join(directory, 'progress.json')
+        self.journal_path = os.path.join(directory, 'responses.jsonl')
+        self._journal = None
+        self.completed = [] # sorted, non-overlapping [start, end) ranges of prompt indices
+        self.info = {}
+        if os.path.exists(self.progress_path):
+            with open(self.progress_path, 'r') as file:
+                state = json.load(file)
+            self.completed = [list(r) for r in state.get("completed", [])]
+            self.info = state.get("info", {})
+
+    def journal(self):
+        # One journal per checkpoint, so reset() also clears the one a Transport holds
+        if self._journal is None:
+            self._journal = ResponseJournal(self.journal_path)
+        return self._journal
+
+    def reset(self):
+        # Start a fresh run, discarding progress and recorded responses
+        self.completed = []
+        self.info = {}
+        if os.path.exists(self.progress_path):
+            os.remove(self.progress_path)
+        if self._journal is not None:
+            self._journal.clear()
+        elif os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+
+    def is_done(self, index):
+        for start, end in self.completed:
+            if start <= index < end:
+                return True
+            if index < start:
+                break
+        return False
+
+    @property
+    def completed_count(self):
+        return sum(end - start for start, end in self.completed)
+
+    def mark_done(self, indices):
+        ranges = self.completed + [[i, i + 1] for i in indices]
+        ranges.sort()
+        merged = []
+        for start, end in ranges:
+            if merged and start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        self.completed = merged
+        self.save()
+
+    def save(self):
+        # Write to a temporary file first so an interrupted save never corrupts progress
+        temp_path = self.progress_path + '.tmp'
+        with open(temp_path, 'w') as file:
+            json.dump({"completed": self.completed, "info": self.info}, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, self.progress_path)
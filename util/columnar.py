@@ -0,0 +1,298 @@
+import argparse
+import json
+import os
+import sqlite3
+import time
+from datetime import datetime, timezone
+from urllib.parse import quote
+
+from util.trulens_results import finished, table_name
+
+# Columnar export of evaluation results, streamed out of the trulens database
+# while the run goes. Every flush appends the records and finished feedback
+# results written since the previous flush as new Parquet (or Arrow IPC) files,
+# partitioned hive style by run, TestSet and feedback:
+#   <directory>/records/run=<run>/test_set=<name>/part-00001-000.parquet
+#   <directory>/feedbacks/run=<run>/test_set=<name>/feedback=<name>/part-00001-000.parquet
+# Every file has the same fixed record or feedback schema (latency, tokens, cost,
+# scores), the partition values are in the paths. Progress is kept in
+# <directory>/_runs/<run>.json, so a resumed run with the same run name carries
+# on where it stopped.
+#
+# How to use
+# exporter = ColumnarExporter("results", run="exercise4a-gpt35")
+# runner = EvaluationRunner(target, make_test, "Exercise4a", exporter=exporter)  # flushes after every chunk
+#
+# python -m util.columnar default.sqlite --output results --run baseline  # export a whole database
+#
+# Reading it back across runs
+# pandas.read_parquet("results/feedbacks")
+# duckdb.sql("SELECT run, feedback, avg(result) FROM read_parquet('results/feedbacks/**/*.parquet', hive_partitioning=true) GROUP BY ALL")
+# pyarrow.dataset.dataset("results/records", format="ipc", partitioning="hive")  # Arrow IPC files are memory-mapped
+#
+# Needs pyarrow, which is imported when the first rows are written.
+
+FORMATS = {"parquet": ".parquet", "arrow": ".arrow"}
+BATCH_ROWS = 5000
+
+
+def _schemas():
+    import pyarrow as pa
+
+    records = pa.schema([
+        ("record_id", pa.string()),
+        ("input", pa.string()),
+        ("output", pa.string()),
+        ("start_time", pa.timestamp("us")),
+        ("latency", pa.float64()), # seconds
+        ("prompt_tokens", pa.int64()),
+        ("completion_tokens", pa.int64()),
+        ("tokens", pa.int64()),
+        ("cost", pa.float64()), # USD, of LLM calls trulens tracked in the app itself
+    ])
+    feedbacks = pa.schema([
+        ("feedback_result_id", pa.string()),
+        ("record_id", pa.string()),
+        ("result", pa.float64()), # score, null when the feedback failed
+        ("status", pa.string()),
+        ("calls", pa.int64()),
+        ("prompt_tokens", pa.int64()),
+        ("completion_tokens", pa.int64()),
+        ("tokens", pa.int64()),
+        ("cost", pa.float64()), # USD, of the judge
+    ])
+    return records, feedbacks
+
+
+def _decode(text):
+    # Inputs and outputs are stored JSON encoded
+    try:
+        value = json.loads(text)
+    except (TypeError, ValueError):
+        return text
+    return value if isinstance(value, str) else text
+
+
+def _timestamp(text):
+    if not text:
+        return None
+    try:
+        value = datetime.fromisoformat(text)
+    except ValueError:
+        return None
+    return value if value.tzinfo is None else value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def _usage(cost_json):
+    cost = json.loads(cost_json) if cost_json else {}
+    return {
+        "calls": cost.get("n_requests") or 0,
+        "prompt_tokens": cost.get("n_prompt_tokens") or 0,
+        "completion_tokens": cost.get("n_completion_tokens") or 0,
+        "tokens": cost.get("n_tokens") or 0,
+        "cost": float(cost.get("cost") or 0.0),
+    }
+
+
+def _score(result):
+    try:
+        return float(result) if result is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _partition(name, value):
+    return f"{name}={quote(str(value), safe='')}"
+
+
+class ColumnarExporter:
+    def __init__(self, directory="results", db_path="default.sqlite", run=None, format="parquet", app_ids=None,
+                 include_existing=False):
+        if format not in FORMATS:
+            raise ValueError(f"Unknown format {format}, expected one of {', '.join(FORMATS)}")
+        self.directory = directory
+        self.db_path = db_path
+        self.run = run or time.strftime("%Y%m%dT%H%M%S")
+        self.format = format
+        self.app_ids = set(app_ids) if app_ids is not None else None
+        self.progress_path = os.path.join(directory, "_runs", f"{quote(self.run, safe='')}.json")
+        self.progress = self._load_progress(include_existing)
+        self.records = 0
+        self.feedbacks = 0
+
+    def _load_progress(self, include_existing):
+        if os.path.exists(self.progress_path):
+            with open(self.progress_path, encoding='utf-8') as file:
+                return json.load(file)
+        progress = {"records_start": 0, "records_rowid": 0, "feedbacks_rowid": 0, "feedbacks_above": [], "flushes": 0}
+        if not include_existing and os.path.exists(self.db_path):
+            # Rows already in the database belong to earlier runs
+            connection = sqlite3.connect(self.db_path)
+            try:
+                for key, name in (("records_rowid", 'records'), ("feedbacks_rowid", 'feedbacks')):
+                    try:
+                        table = table_name(connection, name)
+                    except ValueError:
+                        continue
+                    progress[key] = connection.execute(f"SELECT COALESCE(MAX(rowid), 0) FROM {table}").fetchone()[0]
+            finally:
+                connection.close()
+            progress["records_start"] = progress["records_rowid"]
+        return progress
+
+    def _save_progress(self):
+        os.makedirs(os.path.dirname(self.progress_path), exist_ok=True)
+        temporary = self.progress_path + ".tmp"
+        with open(temporary, 'w', encoding='utf-8') as file:
+            json.dump(self.progress, file)
+        os.replace(temporary, self.progress_path)
+
+    def _app_column(self, connection):
+        # trulens 1.x identifies apps by a hash in the records, the given name is in the apps table
+        apps = table_name(connection, 'apps')
+        columns = {row[1] for row in connection.execute(f"PRAGMA table_info({apps})")}
+        return apps, "a.app_name" if "app_name" in columns else "r.app_id"
+
+    def _write(self, table, schema, rows, partitions, batch):
+        import pyarrow as pa
+
+        directory = os.path.join(self.directory, table, *(_partition(name, value) for name, value in partitions))
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"part-{self.progress['flushes']:05d}-{batch:03d}{FORMATS[self.format]}")
+        data = pa.Table.from_pylist(rows, schema=schema)
+        if self.format == "parquet":
+            import pyarrow.parquet as pq
+
+            pq.write_table(data, path)
+        else:
+            with pa.OSFile(path, 'wb') as sink, pa.ipc.new_file(sink, schema) as writer:
+                writer.write_table(data)
+
+    def _write_grouped(self, table, schema, grouped, batch):
+        for partitions, rows in grouped.items():
+            self._write(table, schema, rows, partitions, batch)
+
+    def _export_records(self, connection, schema):
+        records = table_name(connection, 'records')
+        apps, app_column = self._app_column(connection)
+        cursor = connection.execute(
+            f"""SELECT r.rowid, r.record_id, {app_column}, r.input, r.output,
+                       json_extract(r.perf_json, '$.start_time'), json_extract(r.perf_json, '$.end_time'), r.cost_json
+                FROM {records} r LEFT JOIN {apps} a ON a.app_id = r.app_id
+                WHERE r.rowid > ? ORDER BY r.rowid""",
+            (self.progress["records_rowid"],)
+        )
+        batch = 0
+        while True:
+            rows = cursor.fetchmany(BATCH_ROWS)
+            if not rows:
+                return
+            grouped = {}
+            for rowid, record_id, app, text, output, start, end, cost_json in rows:
+                self.progress["records_rowid"] = rowid
+                if self.app_ids is not None and app not in self.app_ids:
+                    continue
+                start, end = _timestamp(start), _timestamp(end)
+                usage = _usage(cost_json)
+                del usage["calls"]
+                grouped.setdefault((("run", self.run), ("test_set", app)), []).append({
+                    "record_id": record_id,
+                    "input": _decode(text),
+                    "output": _decode(output),
+                    "start_time": start,
+                    "latency": (end - start).total_seconds() if start and end else None,
+                    **usage,
+                })
+                self.records += 1
+            self._write_grouped("records", schema, grouped, batch)
+            batch += 1
+
+    def _export_feedbacks(self, connection, schema):
+        records = table_name(connection, 'records')
+        feedbacks = table_name(connection, 'feedbacks')
+        apps, app_column = self._app_column(connection)
+        above = set(self.progress["feedbacks_above"]) # exported ids past the watermark
+        cursor = connection.execute(
+            f"""SELECT f.rowid, f.feedback_result_id, f.record_id, {app_column}, f.name, f.result, f.status, f.cost_json
+                FROM {feedbacks} f
+                JOIN {records} r ON r.record_id = f.record_id
+                LEFT JOIN {apps} a ON a.app_id = r.app_id
+                WHERE f.rowid > ? AND r.rowid > ? ORDER BY f.rowid""",
+            (self.progress["feedbacks_rowid"], self.progress["records_start"])
+        )
+        # Feedback results are inserted when they start and updated when they finish,
+        # the watermark only moves past rows that are finished and exported
+        watermark = self.progress["feedbacks_rowid"]
+        contiguous = True
+        finished_rows = [] # (rowid, id) of the finished results read, all exported
+        batch = 0
+        while True:
+            rows = cursor.fetchmany(BATCH_ROWS)
+            if not rows:
+                break
+            grouped = {}
+            for rowid, feedback_id, record_id, app, name, result, status, cost_json in rows:
+                done = finished(status)
+                if contiguous and done:
+                    watermark = rowid
+                else:
+                    contiguous = False
+                if not done:
+                    continue
+                finished_rows.append((rowid, feedback_id))
+                if feedback_id in above:
+                    continue
+                above.add(feedback_id)
+                if self.app_ids is not None and app not in self.app_ids:
+                    continue
+                grouped.setdefault((("run", self.run), ("test_set", app), ("feedback", name)), []).append({
+                    "feedback_result_id": feedback_id,
+                    "record_id": record_id,
+                    "result": _score(result),
+                    "status": str(status),
+                    **_usage(cost_json),
+                })
+                self.feedbacks += 1
+            self._write_grouped("feedbacks", schema, grouped, batch)
+            batch += 1
+        self.progress["feedbacks_rowid"] = watermark
+        # Ids at or below the watermark are never read again
+        self.progress["feedbacks_above"] = sorted(feedback_id for rowid, feedback_id in finished_rows if rowid > watermark)
+
+    def flush(self):
+        # Append the rows written to the database since the last flush
+        if not os.path.exists(self.db_path):
+            return self
+        record_schema, feedback_schema = _schemas()
+        connection = sqlite3.connect(self.db_path)
+        try:
+            self._export_records(connection, record_schema)
+            self._export_feedbacks(connection, feedback_schema)
+        finally:
+            connection.close()
+        self.progress["flushes"] += 1
+        self._save_progress()
+        return self
+
+    def metrics(self):
+        return {"run": self.run, "records": self.records, "feedbacks": self.feedbacks, "flushes": self.progress["flushes"]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export a trulens results database to partitioned Parquet or Arrow files")
+    parser.add_argument('database', nargs='?', default='default.sqlite')
+    parser.add_argument('--output', default='results', help="dataset directory")
+    parser.add_argument('--run', help="run name, defaults to the current time")
+    parser.add_argument('--format', choices=list(FORMATS), default='parquet')
+    parser.add_argument('--app', action='append', dest='app_ids', help="only this TestSet, can be repeated")
+    args = parser.parse_args()
+
+    exporter = ColumnarExporter(args.output, args.database, run=args.run, format=args.format, app_ids=args.app_ids,
+                                include_existing=True)
+    metrics = exporter.flush().metrics()
+    print(f"Exported {metrics['records']} records and {metrics['feedbacks']} feedback results of run {metrics['run']} "
+          f"to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,302 @@
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+from contextlib import contextmanager
+
+from util.trulens_results import finished, sqlite_path, table_name
+
+# Content-addressed deduplication of retrieved contexts in the trulens results database.
+# Context strings in the recorded retrieve calls and in the feedback call arguments
+# are moved to a side table keyed by sha256 and replaced with {"__context__": hash}.
+# Prompts that cite the same document chunks then share a single stored copy.
+#
+# Only finished rows are interned: feedback results once they are done or failed,
+# records once none of their feedback results is still pending, so deferred
+# feedbacks always read the full text.
+#
+# The database always keeps the deduplicated form, the full text is put back when
+# records are read: util.trulens_results.load_records (util.sweep, util.sequential)
+# always does, other trulens reads (export_result_to_file) once rehydration is
+# installed, which EvaluationRunner does when it has a context_database. The
+# dashboard command starts the trulens dashboard with rehydration installed in
+# its Streamlit process.
+#
+# How to use
+# runner = EvaluationRunner(..., context_database="default.sqlite")  # interns after every chunk
+# app.export_result_to_file(results)  # exported with the full text
+#
+# with rehydrated():  # full text in trulens reads, for code not using the runner
+#     records, feedbacks = session.get_records_and_feedback()
+#
+# python -m util.context_dedup intern default.sqlite
+# python -m util.context_dedup dashboard default.sqlite  # the trulens dashboard, with the full text
+
+CONTEXT_TABLE = 'kjr_contexts'
+PROGRESS_TABLE = 'kjr_context_progress'
+MARKER = '__context__'
+
+
+def _table_names(connection):
+    return table_name(connection, 'records'), table_name(connection, 'feedbacks')
+
+
+def _ensure_tables(connection):
+    connection.execute(f"CREATE TABLE IF NOT EXISTS {CONTEXT_TABLE} (hash TEXT PRIMARY KEY, text TEXT NOT NULL)")
+    connection.execute(f"CREATE TABLE IF NOT EXISTS {PROGRESS_TABLE} (table_name TEXT PRIMARY KEY, last_rowid INTEGER NOT NULL)")
+
+
+def _method_name(call):
+    try:
+        return call["stack"][-1]["method"]["name"]
+    except (KeyError, IndexError, TypeError):
+        return None
+
+
+class _Interner:
+    def __init__(self, connection, min_length):
+        self.connection = connection
+        self.min_length = min_length
+        self.seen = set()
+        self.count = 0
+
+    def intern(self, value):
+        # Replace long strings anywhere inside value with context markers
+        if isinstance(value, str) and len(value) >= self.min_length:
+            digest = hashlib.sha256(value.encode('utf-8')).hexdigest()
+            if digest not in self.seen:
+                self.connection.execute(f"INSERT OR IGNORE INTO {CONTEXT_TABLE} (hash, text) VALUES (?, ?)", (digest, value))
+                self.seen.add(digest)
+            self.count += 1
+            return {MARKER: digest}
+        if isinstance(value, list):
+            return [self.intern(item) for item in value]
+        if isinstance(value, dict) and MARKER not in value:
+            return {key: self.intern(item) for key, item in value.items()}
+        return value
+
+
+def _record_calls(record, interner, methods):
+    for call in record.get("calls", []):
+        if _method_name(call) in methods:
+            call["rets"] = interner.intern(call.get("rets"))
+            call["args"] = interner.intern(call.get("args"))
+    return record
+
+
+def _feedback_calls(calls, interner):
+    for call in calls.get("calls", []):
+        call["args"] = interner.intern(call.get("args"))
+    return calls
+
+
+def _progress(connection, table):
+    row = connection.execute(f"SELECT last_rowid FROM {PROGRESS_TABLE} WHERE table_name = ?", (table,)).fetchone()
+    return row[0] if row else 0
+
+
+def _set_progress(connection, table, rowid):
+    connection.execute(
+        f"INSERT INTO {PROGRESS_TABLE} (table_name, last_rowid) VALUES (?, ?) "
+        "ON CONFLICT(table_name) DO UPDATE SET last_rowid = excluded.last_rowid",
+        (table, rowid)
+    )
+
+
+def _finished_rows(connection, table, rows):
+    # Yields the (rowid, text) of finished rows and moves the table's progress past
+    # the leading run of finished rows. Unfinished rows are read again next time,
+    # interning a row twice leaves it unchanged.
+    watermark = _progress(connection, table)
+    contiguous = True
+    for rowid, text, finished in rows:
+        if finished:
+            if contiguous:
+                watermark = rowid
+            yield rowid, text
+        else:
+            contiguous = False
+    _set_progress(connection, table, watermark)
+
+
+def _record_rows(connection, records, feedbacks):
+    # A record is finished when none of its feedback results is pending
+    rows = connection.execute(
+        f"SELECT rowid, record_id, record_json FROM {records} WHERE rowid > ? ORDER BY rowid",
+        (_progress(connection, records),)
+    ).fetchall()
+    pending = {
+        record_id for record_id, status in connection.execute(
+            f"SELECT record_id, status FROM {feedbacks} WHERE record_id IN "
+            f"(SELECT record_id FROM {records} WHERE rowid > ?)",
+            (_progress(connection, records),)
+        ) if not finished(status)
+    }
+    return [(rowid, text, record_id not in pending) for rowid, record_id, text in rows]
+
+
+def _feedback_rows(connection, feedbacks):
+    rows = connection.execute(
+        f"SELECT rowid, calls_json, status FROM {feedbacks} WHERE rowid > ? ORDER BY rowid",
+        (_progress(connection, feedbacks),)
+    ).fetchall()
+    return [(rowid, text, finished(status)) for rowid, text, status in rows]
+
+
+def intern_contexts(db_path, min_length=200, methods=("retrieve",), vacuum=False):
+    # Intern contexts of the rows finished since the previous call, returns the number of strings replaced
+    connection = sqlite3.connect(db_path)
+    try:
+        _ensure_tables(connection)
+        records, feedbacks = _table_names(connection)
+        interner = _Interner(connection, min_length)
+        for table, column, rows, transform in (
+            (records, 'record_json', _record_rows(connection, records, feedbacks),
+             lambda value: _record_calls(value, interner, methods)),
+            (feedbacks, 'calls_json', _feedback_rows(connection, feedbacks),
+             lambda value: _feedback_calls(value, interner)),
+        ):
+            for rowid, text in _finished_rows(connection, table, rows):
+                if not text:
+                    continue
+                value = transform(json.loads(text))
+                connection.execute(f"UPDATE {table} SET {column} = ? WHERE rowid = ?", (json.dumps(value), rowid))
+        connection.commit()
+        if vacuum:
+            connection.execute("VACUUM")
+        return interner.count
+    finally:
+        connection.close()
+
+
+def _rehydrate(value, lookup):
+    if isinstance(value, dict):
+        if MARKER in value and len(value) == 1:
+            return lookup(value[MARKER])
+        return {key: _rehydrate(item, lookup) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_rehydrate(item, lookup) for item in value]
+    return value
+
+
+class _Contexts:
+    # Reads context texts from the side table on demand
+    def __init__(self, connection):
+        self.connection = connection
+        self.cache = {}
+
+    def __call__(self, digest):
+        if digest not in self.cache:
+            row = self.connection.execute(f"SELECT text FROM {CONTEXT_TABLE} WHERE hash = ?", (digest,)).fetchone()
+            if row is None:
+                raise KeyError(f"Context {digest} missing from {CONTEXT_TABLE}")
+            self.cache[digest] = row[0]
+        return self.cache[digest]
+
+
+def rehydrate_value(value, lookup):
+    # value as read from the database: a JSON string, or the parsed calls of a feedback column
+    if isinstance(value, str):
+        if f'"{MARKER}"' not in value:
+            return value
+        return json.dumps(_rehydrate(json.loads(value), lookup))
+    if isinstance(value, (dict, list)):
+        return _rehydrate(value, lookup)
+    return value
+
+
+def _has_contexts(connection):
+    return connection.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (CONTEXT_TABLE,)
+    ).fetchone() is not None
+
+
+def rehydrate_frame(records, db_path):
+    # Copy of a trulens records DataFrame with the full context text, the database is not changed
+    connection = sqlite3.connect(db_path)
+    try:
+        if not _has_contexts(connection):
+            return records
+        records = records.copy()
+        lookup = _Contexts(connection)
+        for column in records.columns:
+            if column == 'record_json' or str(column).endswith('_calls'):
+                records[column] = [rehydrate_value(value, lookup) for value in records[column]]
+    finally:
+        connection.close()
+    return records
+
+
+_installed = {}
+
+
+def install_rehydration():
+    # Rehydrate every records DataFrame trulens reads from a SQLite database from now on.
+    # Patched on the database class, so TruSession, its connectors and the dashboard all read full text.
+    from trulens.core.database.sqlalchemy import SQLAlchemyDB
+
+    if "original" in _installed:
+        return
+    original = SQLAlchemyDB.get_records_and_feedback
+
+    def get_records_and_feedback(self, *args, **kwargs):
+        records, feedback_columns = original(self, *args, **kwargs)
+        db_path = sqlite_path(self)
+        if db_path is not None and os.path.exists(db_path):
+            records = rehydrate_frame(records, db_path)
+        return records, feedback_columns
+
+    SQLAlchemyDB.get_records_and_feedback = get_records_and_feedback
+    _installed["original"] = original
+
+
+def uninstall_rehydration():
+    from trulens.core.database.sqlalchemy import SQLAlchemyDB
+
+    if "original" in _installed:
+        SQLAlchemyDB.get_records_and_feedback = _installed.pop("original")
+
+
+@contextmanager
+def rehydrated():
+    # Full context text in trulens reads while the block runs
+    installed = "original" in _installed
+    install_rehydration()
+    try:
+        yield
+    finally:
+        if not installed:
+            uninstall_rehydration()
+
+
+def run_dashboard(db_path="default.sqlite", port=None):
+    # The trulens dashboard on db_path, rehydrating in its Streamlit process (see util/dedup_dashboard.py)
+    command = [sys.executable, "-m", "streamlit", "run", "--server.headless=True"]
+    if port is not None:
+        command.append(f"--server.port={port}")
+    command += [os.path.join(os.path.dirname(os.path.abspath(__file__)), "dedup_dashboard.py"),
+                "--", "--database-url", f"sqlite:///{os.path.abspath(db_path)}"]
+    return subprocess.call(command)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Deduplicate retrieved contexts in a trulens results database")
+    parser.add_argument('command', choices=['intern', 'dashboard'])
+    parser.add_argument('database', nargs='?', default='default.sqlite')
+    parser.add_argument('--min-length', type=int, default=200)
+    parser.add_argument('--vacuum', action='store_true', help="compact the database file after interning")
+    parser.add_argument('--port', type=int, help="dashboard port")
+    args = parser.parse_args()
+
+    if args.command == 'intern':
+        count = intern_contexts(args.database, min_length=args.min_length, vacuum=args.vacuum)
+        print(f"Interned {count} context strings in {args.database}")
+    else:
+        sys.exit(run_dashboard(args.database, args.port))
+
+
+if __name__ == '__main__':
+    main()
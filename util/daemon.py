@@ -0,0 +1,248 @@
+import argparse
+import contextlib
+import json
+import os
+import socket
+import socketserver
+import sys
+import threading
+import time
+import traceback
+
+from util.run_spec import Builders, SpecError, build_app, build_engine, build_provider, check_spec, load_spec, run_spec
+
+# Warm evaluation daemon: a long-lived local worker that keeps kjr_llm and trulens
+# imported, and the RAG_from_scratch engines, judge providers, results app and
+# PII anonymizer loaded between runs. A thin client submits run specs (see
+# util.run_spec) over a Unix socket and receives the run's output as it happens.
+# Runs are executed one at a time.
+#
+# How to use
+# python -m util.daemon start --preload &            # keep running in a terminal
+# python -m util.daemon run exercises/exercise6/spec-6a.yaml
+# python -m util.daemon status
+# python -m util.daemon stop
+#
+# Engines are cached per wrapper and config file, and rebuilt when the config file
+# changes, closing the replaced engine's worker processes. The results app is reused
+# unless a spec asks for reset_database. Judge providers are reused too, except with
+# cascade: true, where every run gets its own Cascade so its report covers that run only.
+#
+# Protocol: one JSON request line from the client, then JSON lines from the daemon,
+# {"event": "output", "message": ...} while the run goes, then a final
+# {"event": "done", ...} or {"event": "error", "message": ...}.
+
+DEFAULT_SOCKET = os.path.join(os.path.expanduser("~"), ".cache", "kjr_llm_training", "daemon.sock")
+
+
+class WarmBuilders(Builders):
+    def __init__(self):
+        self._engines = {}
+        self._providers = {}
+        self._apps = {}
+
+    def app(self, spec):
+        name = spec.get("app_name", "RAG_Application")
+        if spec.get("reset_database", True) or name not in self._apps:
+            self._apps[name] = build_app(spec)
+        return self._apps[name]
+
+    def engine(self, spec):
+        target = spec.get("target") or {}
+        config = target.get("config")
+        config_path = os.path.join(spec["_directory"], config) if config else None
+        key = (target.get("wrapper", "azure"), config_path, bool(target.get("filter_pii")))
+        mtime = os.path.getmtime(config_path) if config_path else None
+        cached = self._engines.get(key)
+        if cached is None or cached[0] != mtime:
+            if cached is not None:
+                # The config changed, the old engine is not used again
+                cached[1].close()
+            self._engines[key] = (mtime, build_engine(spec))
+        return self._engines[key][1]
+
+    def provider(self, spec):
+        if spec.get("cascade"):
+            # The cascade wraps the provider it is given and counts its calls, a new one per run
+            return build_provider(spec)
+        key = json.dumps(spec.get("provider"), sort_keys=True)
+        if key not in self._providers:
+            self._providers[key] = build_provider(spec)
+        return self._providers[key]
+
+    def metrics(self):
+        return {"engines": len(self._engines), "providers": len(self._providers), "apps": list(self._apps)}
+
+
+def preload():
+    # Import the evaluation stack and load the spaCy models before the first run
+    start = time.monotonic()
+    import kjr_llm.app  # noqa: F401
+    import kjr_llm.metrics  # noqa: F401
+    import kjr_llm.tests  # noqa: F401
+    import trulens.core  # noqa: F401
+    from llm_application.engine import get_anonymizer
+
+    get_anonymizer()
+    return time.monotonic() - start
+
+
+class _LineWriter:
+    # File-like object sending each written line to the client as an output event
+    def __init__(self, send):
+        self.send = send
+        self.buffer = ""
+
+    def write(self, text):
+        self.buffer += text
+        while "\n" in self.buffer:
+            line, self.buffer = self.buffer.split("\n", 1)
+            self.send({"event": "output", "message": line})
+        return len(text)
+
+    def flush(self):
+        if self.buffer:
+            self.send({"event": "output", "message": self.buffer})
+            self.buffer = ""
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    disconnected = False
+
+    def send(self, message):
+        # A run goes on when its client disconnects, the rest of its output is dropped
+        if self.disconnected:
+            return
+        try:
+            self.wfile.write((json.dumps(message, default=str) + "\n").encode('utf-8'))
+            self.wfile.flush()
+        except OSError:
+            self.disconnected = True
+
+    def handle(self):
+        server = self.server
+        try:
+            request = json.loads(self.rfile.readline())
+        except ValueError:
+            self.send({"event": "error", "message": "Invalid request"})
+            return
+        command = request.get("command")
+
+        if command == "status":
+            self.send({"event": "done", "pid": os.getpid(), "uptime": time.monotonic() - server.started,
+                       "runs": server.runs, "busy": server.run_lock.locked(), **server.builders.metrics()})
+        elif command == "stop":
+            self.send({"event": "done", "message": "Stopping"})
+            threading.Thread(target=server.shutdown, daemon=True).start()
+        elif command == "run":
+            self.run(request)
+        else:
+            self.send({"event": "error", "message": f"Unknown command {command}"})
+
+    def run(self, request):
+        server = self.server
+        try:
+            spec = check_spec(load_spec(request["spec"]))
+        except (OSError, ValueError, SpecError) as e:
+            self.send({"event": "error", "message": f"Invalid spec {request.get('spec')}: {e}"})
+            return
+        if server.run_lock.locked():
+            self.send({"event": "output", "message": "Waiting for the current run to finish"})
+
+        with server.run_lock:
+            start = time.monotonic()
+            writer = _LineWriter(self.send)
+            try:
+                with contextlib.redirect_stdout(writer), contextlib.redirect_stderr(writer):
+                    results = server.run(spec, request.get("dashboard"), writer)
+                writer.flush()
+            except Exception as e:
+                writer.flush()
+                self.send({"event": "error", "message": str(e), "traceback": traceback.format_exc()})
+                return
+            finally:
+                server.runs += 1
+            self.send({"event": "done", "results": len(results), "elapsed": time.monotonic() - start})
+
+
+class EvaluationDaemon(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path=DEFAULT_SOCKET):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if os.path.exists(path):
+            os.remove(path)
+        super().__init__(path, _Handler)
+        self.path = path
+        self.builders = WarmBuilders()
+        self.run_lock = threading.Lock()
+        self.started = time.monotonic()
+        self.runs = 0
+
+    def run(self, spec, dashboard, writer):
+        def progress(message):
+            writer.write(f"{message}\n")
+
+        return run_spec(spec, dashboard=dashboard, progress=progress, builders=self.builders)
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def request(command, path=DEFAULT_SOCKET, **fields):
+    # Send a request to the daemon and yield its events as they arrive
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.connect(path)
+        connection.sendall((json.dumps({"command": command, **fields}) + "\n").encode('utf-8'))
+        with connection.makefile('r', encoding='utf-8') as stream:
+            for line in stream:
+                yield json.loads(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Warm evaluation daemon")
+    parser.add_argument('command', choices=['start', 'run', 'status', 'stop'])
+    parser.add_argument('spec', nargs='?', help="run spec for the run command")
+    parser.add_argument('--socket', default=DEFAULT_SOCKET)
+    parser.add_argument('--preload', action='store_true', help="import the evaluation stack and load the anonymizer at start")
+    parser.add_argument('--dashboard', action='store_true', default=None)
+    args = parser.parse_args(argv)
+
+    if args.command == 'start':
+        from dotenv import load_dotenv, find_dotenv
+
+        load_dotenv(find_dotenv())
+        if args.preload:
+            print(f"Preloaded the evaluation stack in {preload():.1f}s")
+        with EvaluationDaemon(args.socket) as server:
+            print(f"Evaluation daemon listening on {args.socket}")
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+        return 0
+
+    fields = {}
+    if args.command == 'run':
+        if not args.spec:
+            parser.error("run needs a spec")
+        fields = {"spec": os.path.abspath(args.spec), "dashboard": args.dashboard}
+    try:
+        for event in request(args.command, args.socket, **fields):
+            if event["event"] == "output":
+                print(event["message"])
+            elif event["event"] == "error":
+                print(f"Error: {event['message']}")
+                return 1
+            else:
+                print(json.dumps({key: value for key, value in event.items() if key != "event"}))
+    except (FileNotFoundError, ConnectionRefusedError):
+        print(f"No evaluation daemon running on {args.socket}, start one with: python -m util.daemon start")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
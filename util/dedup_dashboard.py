@@ -0,0 +1,24 @@
+import os
+import sys
+
+# Streamlit entry of the trulens dashboard for a database with deduplicated contexts,
+# the records it shows get their full context text back (see util.context_dedup).
+#
+# How to use
+# python -m util.context_dedup dashboard default.sqlite
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from util.context_dedup import install_rehydration  # noqa: E402
+
+install_rehydration()
+
+try:
+    from trulens.dashboard.main import main  # noqa: E402
+except ImportError:
+    # trulens 1.x starts its dashboard from Leaderboard.py
+    import runpy  # noqa: E402
+
+    runpy.run_module("trulens.dashboard.Leaderboard", run_name="__main__")
+else:
+    main()
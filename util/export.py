@@ -0,0 +1,28 @@
+import os
+
+from util.accounting import export_accounting
+from util.load_test import LoadTestResult, export_load_results
+
+# One export for every kind of result of a run. The TestSet results go through
+# kjr_llm's app.export_result_to_file as before, load test results
+# (util.load_test.LoadTestResult) are written to load_path next to it, and the
+# token, byte and cost accounting of the run (util.accounting) to accounting_path.
+#
+# How to use
+# rag_chain.ledger = ledger = RequestLedger()  # llm_application.ledger, for the endpoint bytes
+# results = [custom_test.evaluate(target, "Exercise4a"), load_test.evaluate(rag_chain, "Exercise4a-load")]
+# export_results(app, results, ledger=ledger)
+
+
+def export_results(app, results, load_path="load_test_results.json", accounting_path="accounting.json", ledger=None,
+                   db_path="default.sqlite", prices=None):
+    load_results = [result for result in results if isinstance(result, LoadTestResult)]
+    results = [result for result in results if not isinstance(result, LoadTestResult)]
+    exported = app.export_result_to_file(results)
+    if load_results:
+        export_load_results(load_results, load_path)
+        for result in load_results:
+            print(result)
+    if accounting_path is not None and os.path.exists(db_path):
+        export_accounting(accounting_path, db_path=db_path, ledger=ledger, prices=prices)
+    return exported
@@ -0,0 +1,232 @@
+import json
+import threading
+import time
+
+from llm_application.concurrency import percentile
+from util.prompt_stream import StreamingPromptSet
+
+# Load test TestSet: drives the RAG wrapper with concurrent virtual users over a
+# set of prompts and reports latency and throughput against pass/fail thresholds,
+# so a release can be gated on the app getting slower and not only worse.
+#
+# Every request is recorded in the trulens database under the test's app id with
+# Latency, Time to first byte and Error feedbacks, so the runs appear in the same
+# dashboard as the quality TestSets. The aggregate metrics and the verdict are
+# returned as a LoadTestResult, which util.export.export_results exports together
+# with the quality results.
+#
+# How to use
+# load_test = LoadTestSet(prompts, name="Exercise4a-load", users=8, ramp_up=10, iterations=2,
+#                         thresholds={"p95_latency": 8.0, "error_rate": 0.02, "rps": 0.5})
+# result = load_test.evaluate(rag_chain, app_id="Exercise4a-load")
+# export_results(app, [quality_result, result])
+# result.raise_for_failures()  # fails the release gate
+#
+# The load runs on a copy of the wrapper with its own transport, without the
+# response journal and single-flight coalescing, so every request reaches the endpoint.
+# Latency is measured around the wrapper's query, including trulens recording;
+# pass record=False to measure the endpoint and wrapper alone.
+
+METRICS = ("p50_latency", "p95_latency", "p99_latency", "p50_ttfb", "p95_ttfb", "error_rate", "rps")
+# Thresholds are upper bounds, except for these which are lower bounds
+MIN_METRICS = ("rps",)
+
+
+class SLOViolation(AssertionError):
+    pass
+
+
+def _prompt_inputs(prompts):
+    if isinstance(prompts, str):
+        prompts = StreamingPromptSet(prompts)
+    inputs = []
+    for prompt in getattr(prompts, 'prompts', prompts):
+        if isinstance(prompt, dict):
+            inputs.append(prompt.get('input'))
+        elif isinstance(prompt, str):
+            inputs.append(prompt)
+        else:
+            inputs.append(getattr(prompt, 'input', None))
+    return [text for text in inputs if text is not None]
+
+
+class LoadTestResult:
+    def __init__(self, name, app_id, samples, elapsed, users, thresholds):
+        self.name = name
+        self.app_id = app_id
+        self.samples = samples # one dict per request: latency, ttfb, error, user
+        self.elapsed = elapsed
+        self.users = users
+        self.thresholds = thresholds
+        self.metrics = self._aggregate()
+        self.failures = self._check()
+
+    def _aggregate(self):
+        latencies = [sample["latency"] for sample in self.samples]
+        ttfbs = [sample["ttfb"] for sample in self.samples if sample["ttfb"] is not None]
+        errors = sum(1 for sample in self.samples if sample["error"])
+        return {
+            "requests": len(self.samples),
+            "errors": errors,
+            "p50_latency": percentile(latencies, 50),
+            "p95_latency": percentile(latencies, 95),
+            "p99_latency": percentile(latencies, 99),
+            "p50_ttfb": percentile(ttfbs, 50),
+            "p95_ttfb": percentile(ttfbs, 95),
+            "error_rate": errors / len(self.samples) if self.samples else 0.0,
+            "rps": len(self.samples) / self.elapsed if self.elapsed else 0.0,
+        }
+
+    def _check(self):
+        failures = {}
+        for metric, limit in self.thresholds.items():
+            if metric not in METRICS:
+                raise ValueError(f"Unknown load test metric {metric}, expected one of {', '.join(METRICS)}")
+            value = self.metrics[metric]
+            if value is None:
+                failures[metric] = (value, limit)
+            elif metric in MIN_METRICS and value < limit:
+                failures[metric] = (value, limit)
+            elif metric not in MIN_METRICS and value > limit:
+                failures[metric] = (value, limit)
+        return failures
+
+    @property
+    def passed(self):
+        return not self.failures
+
+    def raise_for_failures(self):
+        if self.failures:
+            details = ", ".join(f"{metric} {value} (limit {limit})" for metric, (value, limit) in self.failures.items())
+            raise SLOViolation(f"Load test {self.name} failed: {details}")
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "app_id": self.app_id,
+            "users": self.users,
+            "elapsed": self.elapsed,
+            "metrics": self.metrics,
+            "thresholds": self.thresholds,
+            "failures": {metric: {"value": value, "limit": limit} for metric, (value, limit) in self.failures.items()},
+            "passed": self.passed,
+        }
+
+    def __repr__(self):
+        status = "passed" if self.passed else "FAILED"
+        return f"LoadTestResult({self.name} {status}, {self.metrics['requests']} requests, p95 {self.metrics['p95_latency']})"
+
+
+def export_load_results(results, path):
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump([result.to_dict() for result in results], file, indent=2)
+    return path
+
+
+# Feedback functions of the transport details the wrapper records in request_info.
+# Module level functions so trulens can serialize the feedback definitions.
+
+def request_latency(info: dict) -> float:
+    return info.get("latency") or 0.0
+
+
+def request_ttfb(info: dict) -> float:
+    return info.get("ttfb") or 0.0
+
+
+def request_error(info: dict) -> float:
+    return 0.0 if (info.get("status_code") or 200) < 400 else 1.0
+
+
+def latency_feedbacks():
+    # Per-record feedbacks read from the transport details the wrapper records in request_info
+    from trulens.core import Feedback
+    from trulens.core.schema import Select
+
+    info = Select.Record.app.request_info.rets
+    return [
+        Feedback(request_latency, name="Latency", higher_is_better=False).on(info),
+        Feedback(request_ttfb, name="Time to first byte", higher_is_better=False).on(info),
+        Feedback(request_error, name="Error", higher_is_better=False).on(info),
+    ]
+
+
+class LoadTestSet:
+    def __init__(self, prompts, name, users=4, ramp_up=0.0, iterations=1, duration=None, thresholds=None,
+                 record=True):
+        self.prompts = _prompt_inputs(prompts)
+        self.name = name
+        self.users = users
+        self.ramp_up = ramp_up # seconds until all users are running, users start evenly spread over it
+        self.iterations = iterations # passes over the prompts per user
+        self.duration = duration # optional wall clock limit in seconds
+        self.thresholds = dict(thresholds or {})
+        self.record = record
+
+    def _load_engine(self, rag_chain, app_id):
+        # A copy of the wrapper with a new transport from its config (no journal replay) and no coalescing.
+        # Recorded runs instrument only query and request_info, the spans the latency feedbacks read
+        feedbacks = latency_feedbacks() if self.record else None
+        engine = rag_chain.clone(instrumentation="feedback-minimal" if self.record else None, feedbacks=feedbacks)
+        engine.coalesce = False
+        if not self.record:
+            return engine, None
+        from trulens.apps.custom import TruCustomApp
+
+        return engine, TruCustomApp(engine, app_name=app_id, app_version=self.name, feedbacks=feedbacks)
+
+    def _request(self, rag_chain, recorder, query):
+        start = time.perf_counter()
+        error = False
+        try:
+            if recorder is not None:
+                with recorder:
+                    rag_chain.query(query)
+            else:
+                rag_chain.query(query)
+            error = "detail" in rag_chain.json_response
+        except Exception as e:
+            print(f"Exception: load test {e}")
+            error = True
+        latency = time.perf_counter() - start
+        info = rag_chain.last_request_info()
+        return {"latency": latency, "ttfb": info.get("ttfb"), "error": error}
+
+    def evaluate(self, rag_chain, app_id):
+        # rag_chain is the RAG_from_scratch wrapper used as the target of the quality TestSets
+        if not self.prompts:
+            raise ValueError(f"Load test {self.name} has no prompts")
+        rag_chain, recorder = self._load_engine(rag_chain, app_id)
+        try:
+            result = self._run(rag_chain, recorder, app_id)
+        finally:
+            rag_chain.close() # a clone, its parent's stage pools keep running
+        print(result)
+        return result
+
+    def _run(self, rag_chain, recorder, app_id):
+        samples = []
+        lock = threading.Lock()
+        start = time.perf_counter()
+        deadline = start + self.duration if self.duration else None
+
+        def user(index):
+            time.sleep(self.ramp_up * index / self.users)
+            # Each user starts at a different prompt so the users don't move in lockstep
+            for i in range(self.iterations * len(self.prompts)):
+                if deadline is not None and time.perf_counter() >= deadline:
+                    return
+                query = self.prompts[(index + i) % len(self.prompts)]
+                sample = self._request(rag_chain, recorder, query)
+                sample["user"] = index
+                with lock:
+                    samples.append(sample)
+
+        threads = [threading.Thread(target=user, args=(index,), name=f"{self.name}-user-{index}") for index in range(self.users)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        return LoadTestResult(self.name, app_id, samples, elapsed, self.users, self.thresholds)
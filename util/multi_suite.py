@@ -0,0 +1,85 @@
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+
+from llm_application.transport import ResponseJournal
+
+# Evaluate several TestSets against the same RAG_from_scratch target while
+# calling the endpoint only once per unique prompt.
+#
+# The union of the suites' prompts is fetched up front (prefetch_workers at a
+# time) into a response journal on the wrapper's transport. Each suite is then
+# evaluated as usual under its own app id: its records are produced from the
+# shared responses and scored by that suite's feedbacks. With a RequestLedger on
+# the wrapper the prefetched bytes are recorded once, outside of any suite.
+# A prompt whose prefetch fails is logged and left out of the journal, the
+# suites evaluating it call the endpoint for it again.
+#
+# How to use
+# tests = [Hate, Criminality, Insensitivity]
+# for test in tests:
+#     test.default_provider = test_provider
+# test_results = evaluate_suites(tests, target, rag_chain, app.app_name)
+
+
+def _prompt_input(prompt):
+    if isinstance(prompt, dict):
+        return prompt.get('input')
+    if isinstance(prompt, str):
+        return prompt
+    return getattr(prompt, 'input', None)
+
+
+def suite_inputs(tests):
+    # Unique prompt inputs across the suites, in first-seen order
+    seen = {}
+    for test in tests:
+        prompts = getattr(test, 'prompts', None) or []
+        found = 0
+        for prompt in getattr(prompts, 'prompts', prompts):
+            text = _prompt_input(prompt)
+            if text is not None:
+                seen.setdefault(text, None)
+                found += 1
+        if not found:
+            # Its prompts cannot be prefetched, so this suite calls the endpoint for every prompt
+            warnings.warn(
+                f"No prompt inputs found on TestSet {getattr(test, 'name', test)!r}, its responses are not shared"
+            )
+    return list(seen)
+
+
+def prefetch(rag_chain, inputs, workers):
+    # Fetch each input once, returns the inputs whose request failed
+    def fetch(text):
+        try:
+            rag_chain.fetch_response(text)
+        except Exception as e:
+            print(f"Prefetch failed for {text!r}, the suites retry it: {e}")
+            return text
+        return None
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return [text for text in pool.map(fetch, inputs) if text is not None]
+
+
+def evaluate_suites(tests, target, rag_chain, app_name, prefetch_workers=4):
+    transport = rag_chain.transport
+    previous_journal = transport.journal
+    if previous_journal is None:
+        # Keep the shared responses in memory for the duration of the evaluation
+        transport.journal = ResponseJournal()
+    try:
+        inputs = suite_inputs(tests)
+        if inputs and prefetch_workers:
+            failed = prefetch(rag_chain, inputs, prefetch_workers)
+            print(f"Fetched {len(inputs) - len(failed)} of {len(inputs)} unique prompts for {len(tests)} suites")
+        results = []
+        for test in tests:
+            app_id = f"{app_name}-{test.name}"
+            ledger = getattr(rag_chain, 'ledger', None)
+            with ledger.suite(app_id) if ledger is not None else nullcontext():
+                results.append(test.evaluate(target, app_id=app_id))
+        return results
+    finally:
+        transport.journal = previous_journal
@@ -0,0 +1,152 @@
+import atexit
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+
+# Local replacement for Huggingface().pii_detection_with_cot_reasons.
+# Outputs are analysed with the same Presidio analyzer used by wrapper_pii.py,
+# so privacy runs no longer need a network round-trip per record.
+#
+# How to use
+# from util.pii_feedback import pii_detection_with_cot_reasons
+# f_pii_detection = Feedback(pii_detection_with_cot_reasons).on_output()
+
+_analyzer = None
+
+
+def _init_worker(language):
+    # Each worker process loads the analyzer (and its spaCy model) once
+    global _analyzer
+    from presidio_analyzer import AnalyzerEngine
+    _analyzer = AnalyzerEngine(supported_languages=[language])
+
+
+def _analyze_batch(texts, language, entities):
+    # Runs inside a worker process, only plain tuples are sent back
+    batch = []
+    for text in texts:
+        results = _analyzer.analyze(text=text or "", language=language, entities=entities)
+        batch.append([
+            (r.entity_type, r.start, r.end, float(r.score)) for r in results
+        ])
+    return batch
+
+
+class LocalPIIDetection:
+    def __init__(self, max_workers=2, batch_size=32, batch_wait=0.05, language="en", entities=None):
+        self.max_workers = max_workers
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait # seconds to wait for more records before dispatching a batch
+        self.language = language
+        self.entities = entities # None means every entity Presidio knows about
+        self._pool = None
+        self._pending = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._batcher = None
+
+    def _get_pool(self):
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                initializer=_init_worker,
+                initargs=(self.language,)
+            )
+        return self._pool
+
+    def analyze_batch(self, texts):
+        # Analyse many texts at once, split across the worker processes
+        texts = list(texts)
+        if not texts:
+            return []
+        pool = self._get_pool()
+        size = max(1, min(self.batch_size, -(-len(texts) // self.max_workers)))
+        futures = [
+            pool.submit(_analyze_batch, texts[i:i + size], self.language, self.entities)
+            for i in range(0, len(texts), size)
+        ]
+        results = []
+        for future in futures:
+            results.extend(future.result())
+        return results
+
+    def score_batch(self, texts):
+        return [self._to_feedback(text, found) for text, found in zip(texts, self.analyze_batch(texts))]
+
+    def _to_feedback(self, text, found):
+        # Same shape as the Huggingface feedback: highest entity score plus reasons
+        entities = [
+            {"entity_type": entity_type, "text": text[start:end], "start": start, "end": end, "score": score}
+            for entity_type, start, end, score in found
+        ]
+        if not entities:
+            return 0.0, {"reason": "No PII detected.", "entities": []}
+        reason = "\n".join(
+            f"{e['entity_type']} detected: {e['text']} (score {e['score']:.2f})" for e in entities
+        )
+        return max(e["score"] for e in entities), {"reason": reason, "entities": entities}
+
+    def _run_batcher(self):
+        while True:
+            with self._wakeup:
+                while not self._pending:
+                    self._wakeup.wait()
+                # Give concurrent records a moment to join the batch. Every submit
+                # notifies, so keep waiting until the batch is full or the time is up
+                deadline = time.monotonic() + self.batch_wait
+                while len(self._pending) < self.batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._wakeup.wait(remaining)
+                batch = self._pending[:self.batch_size]
+                del self._pending[:self.batch_size]
+            texts = [text for text, _ in batch]
+            try:
+                scores = self.score_batch(texts)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), score in zip(batch, scores):
+                future.set_result(score)
+
+    def pii_detection_with_cot_reasons(self, text: str):
+        # Called once per record by trulens, records evaluated concurrently
+        # are grouped together and analysed in a single pool submission
+        future = Future()
+        with self._wakeup:
+            if self._batcher is None:
+                self._batcher = threading.Thread(target=self._run_batcher, daemon=True)
+                self._batcher.start()
+            self._pending.append((text, future))
+            self._wakeup.notify()
+        return future.result()
+
+    def pii_detection(self, text: str) -> float:
+        return self.pii_detection_with_cot_reasons(text)[0]
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+_default_detector = None
+
+
+def get_default_detector():
+    global _default_detector
+    if _default_detector is None:
+        _default_detector = LocalPIIDetection()
+        atexit.register(_default_detector.close)
+    return _default_detector
+
+
+# Module level functions serialise cleanly as trulens feedback implementations
+def pii_detection_with_cot_reasons(text: str):
+    return get_default_detector().pii_detection_with_cot_reasons(text)
+
+
+def pii_detection(text: str) -> float:
+    return get_default_detector().pii_detection(text)
@@ -0,0 +1,128 @@
+import gzip
+import json
+import os
+from itertools import islice
+
+# Lazy prompt loading for large prompt files.
+# Supported formats:
+#   .json      - a JSON array of {"input": ..., "expected_output": ...} objects (same as PromptSet.from_json_file)
+#   .jsonl     - one prompt object per line
+#   .json.gz / .jsonl.gz - gzip compressed versions of the above
+# Prompts are yielded one at a time so memory stays flat regardless of file size.
+
+READ_SIZE = 1 << 16
+
+
+def _open_text(path):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8')
+    return open(path, 'r', encoding='utf-8')
+
+
+def _is_jsonl(path):
+    name = path[:-3] if path.endswith('.gz') else path
+    return name.endswith('.jsonl')
+
+
+def _iter_jsonl(file):
+    for line_number, line in enumerate(file, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid prompt on line {line_number} of {file.name}: {e}") from e
+
+
+def _iter_json_array(file):
+    # Incrementally decode the objects of a top level JSON array
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    started = False
+    eof = False
+    while True:
+        # Skip whitespace and separators between elements
+        while position < len(buffer) and buffer[position] in ' \t\r\n,':
+            position += 1
+        if position < len(buffer):
+            if not started:
+                if buffer[position] != '[':
+                    raise ValueError(f"{file.name} does not contain a JSON array of prompts")
+                started = True
+                position += 1
+                continue
+            if buffer[position] == ']':
+                return
+            try:
+                prompt, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            else:
+                position = end
+                yield prompt
+                continue
+        if eof:
+            if not started:
+                return
+            raise ValueError(f"Unexpected end of file in {file.name}")
+        chunk = file.read(READ_SIZE)
+        eof = not chunk
+        buffer = buffer[position:] + chunk
+        position = 0
+
+
+def iter_prompts(path):
+    # Yield prompt dicts from a .json, .jsonl or gzip compressed prompt file
+    with _open_text(path) as file:
+        if _is_jsonl(path):
+            yield from _iter_jsonl(file)
+        else:
+            yield from _iter_json_array(file)
+
+
+def chunked(iterable, size):
+    # Group an iterable into lists of at most size items
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def write_jsonl(prompts, path):
+    # Write prompts as JSON Lines, gzip compressed when the path ends in .gz
+    opener = gzip.open if path.endswith('.gz') else open
+    count = 0
+    with opener(path, 'wt', encoding='utf-8') as file:
+        for prompt in prompts:
+            file.write(json.dumps(prompt, ensure_ascii=False))
+            file.write('\n')
+            count += 1
+    return count
+
+
+def resolve_prompt_file(path):
+    # Allow a prompt file to be given without its extension
+    if os.path.exists(path):
+        return path
+    for extension in ('.json', '.jsonl', '.jsonl.gz', '.json.gz'):
+        if os.path.exists(path + extension):
+            return path + extension
+    raise FileNotFoundError(f"No prompt file found for {path}")
+
+
+class StreamingPromptSet:
+    # Iterable over the prompts of a file, re-opened on every iteration
+
+    def __init__(self, path):
+        self.path = resolve_prompt_file(path)
+
+    def __iter__(self):
+        return iter_prompts(self.path)
+
+    def chunks(self, size):
+        return chunked(self, size)
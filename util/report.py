@@ -0,0 +1,187 @@
+import argparse
+import html
+import json
+import os
+import sqlite3
+
+from util.trulens_results import table_name
+
+# Headless static report, built straight from the trulens results database.
+# Records and feedback results are read in two queries and aggregated with
+# pandas group-bys, so tens of thousands of records take seconds and nothing
+# has to start a Streamlit server. The report directory gets:
+#   report.html - self-contained leaderboard, feedback summaries and lowest scoring records
+#   report.json - the same aggregates for CI checks
+#
+# How to use
+# app.export_result_to_file(results)
+# print(f"Report written to {write_report('default.sqlite', 'report')}")
+# if "--dashboard" in sys.argv:
+#     app.run_dashboard()
+#
+# python -m util.report default.sqlite --output report
+
+WORST_RECORDS = 10
+
+
+def _percentile(q):
+    def function(values):
+        return values.quantile(q)
+    function.__name__ = f"p{int(q * 100)}"
+    return function
+
+
+def load_frames(db_path):
+    # (records, feedback results) DataFrames
+    import pandas as pd
+
+    connection = sqlite3.connect(db_path)
+    try:
+        records = table_name(connection, 'records')
+        feedbacks = table_name(connection, 'feedbacks')
+        apps = table_name(connection, 'apps')
+        app_columns = {row[1] for row in connection.execute(f"PRAGMA table_info({apps})")}
+        # trulens 1.x identifies apps by a hash in the records, the given name is in the apps table
+        app_name = "a.app_name" if "app_name" in app_columns else "r.app_id"
+        record_frame = pd.read_sql_query(
+            f"""SELECT r.record_id, {app_name} AS app, r.input, r.output,
+                       json_extract(r.perf_json, '$.start_time') AS start_time,
+                       json_extract(r.perf_json, '$.end_time') AS end_time
+                FROM {records} r LEFT JOIN {apps} a ON a.app_id = r.app_id""",
+            connection
+        )
+        feedback_frame = pd.read_sql_query(
+            f"""SELECT record_id, name AS feedback, result, status,
+                       COALESCE(json_extract(cost_json, '$.cost'), 0) AS cost,
+                       COALESCE(json_extract(cost_json, '$.n_tokens'), 0) AS tokens
+                FROM {feedbacks}""",
+            connection
+        )
+    finally:
+        connection.close()
+
+    record_frame["latency"] = (
+        pd.to_datetime(record_frame["end_time"], errors="coerce", format="ISO8601")
+        - pd.to_datetime(record_frame["start_time"], errors="coerce", format="ISO8601")
+    ).dt.total_seconds()
+    feedback_frame["result"] = pd.to_numeric(feedback_frame["result"], errors="coerce")
+    feedback_frame = feedback_frame.merge(record_frame[["record_id", "app"]], on="record_id", how="left")
+    return record_frame, feedback_frame
+
+
+def summarize(records, feedbacks, worst=WORST_RECORDS):
+    import pandas as pd
+
+    by_app = records.groupby("app").agg(
+        records=("record_id", "size"),
+        mean_latency=("latency", "mean"),
+        p95_latency=("latency", _percentile(0.95)),
+    )
+    scores = feedbacks.pivot_table(index="app", columns="feedback", values="result", aggfunc="mean")
+    judge = feedbacks.groupby("app").agg(judge_cost=("cost", "sum"), judge_tokens=("tokens", "sum"))
+    leaderboard = by_app.join(scores).join(judge).reset_index()
+
+    feedback_summary = feedbacks.groupby(["app", "feedback"]).agg(
+        results=("result", "count"),
+        mean=("result", "mean"),
+        p10=("result", _percentile(0.10)),
+        minimum=("result", "min"),
+        failed=("status", lambda status: int((status.astype(str).str.lower().str.contains("fail")).sum())),
+        cost=("cost", "sum"),
+    ).reset_index()
+
+    scored = feedbacks.dropna(subset=["result"]).merge(records[["record_id", "input", "output"]], on="record_id")
+    lowest = (
+        scored.sort_values("result")
+        .groupby(["app", "feedback"], sort=False)
+        .head(worst)
+        .sort_values(["app", "feedback", "result"])
+    )
+
+    def rows(frame):
+        # JSON friendly rows, NaN becomes None
+        return json.loads(frame.to_json(orient="records"))
+
+    return {
+        "records": int(len(records)),
+        "feedback_results": int(len(feedbacks)),
+        "leaderboard": rows(leaderboard),
+        "feedbacks": rows(feedback_summary),
+        "lowest": rows(lowest[["app", "feedback", "result", "input", "output"]]) if not lowest.empty else [],
+        "generated": pd.Timestamp.now().isoformat(timespec="seconds"),
+    }
+
+
+def _format(value):
+    if value is None:
+        return ""
+    if isinstance(value, float):
+        return f"{value:.3f}"
+    text = str(value)
+    try:
+        # Inputs and outputs are stored JSON encoded
+        decoded = json.loads(text)
+        if isinstance(decoded, str):
+            text = decoded
+    except ValueError:
+        pass
+    return text if len(text) <= 300 else text[:300] + "..."
+
+
+def _table(rows, title):
+    if not rows:
+        return f"<h2>{html.escape(title)}</h2><p>No data</p>"
+    columns = list(rows[0])
+    head = "".join(f"<th>{html.escape(str(column))}</th>" for column in columns)
+    body = "".join(
+        "<tr>" + "".join(f"<td>{html.escape(_format(row.get(column)))}</td>" for column in columns) + "</tr>"
+        for row in rows
+    )
+    return f"<h2>{html.escape(title)}</h2><table><thead><tr>{head}</tr></thead><tbody>{body}</tbody></table>"
+
+
+STYLE = """
+body { font-family: sans-serif; margin: 2em; color: #222; }
+table { border-collapse: collapse; margin-bottom: 2em; font-size: 13px; }
+th, td { border: 1px solid #ccc; padding: 4px 8px; text-align: left; vertical-align: top; }
+th { background: #f0f0f0; position: sticky; top: 0; }
+tr:nth-child(even) td { background: #fafafa; }
+"""
+
+
+def render_html(summary, title="Evaluation report"):
+    return "\n".join([
+        "<!DOCTYPE html>",
+        f"<html><head><meta charset='utf-8'><title>{html.escape(title)}</title><style>{STYLE}</style></head><body>",
+        f"<h1>{html.escape(title)}</h1>",
+        f"<p>{summary['records']} records, {summary['feedback_results']} feedback results, generated {summary['generated']}</p>",
+        _table(summary["leaderboard"], "Leaderboard"),
+        _table(summary["feedbacks"], "Feedbacks"),
+        _table(summary["lowest"], f"Lowest scoring records (up to {WORST_RECORDS} per feedback)"),
+        "</body></html>",
+    ])
+
+
+def write_report(db_path="default.sqlite", directory="report", title="Evaluation report"):
+    records, feedbacks = load_frames(db_path)
+    summary = summarize(records, feedbacks)
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, "report.json"), 'w', encoding='utf-8') as file:
+        json.dump(summary, file, indent=2)
+    path = os.path.join(directory, "report.html")
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write(render_html(summary, title))
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Static HTML and JSON report from a trulens results database")
+    parser.add_argument('database', nargs='?', default='default.sqlite')
+    parser.add_argument('--output', default='report', help="report directory")
+    parser.add_argument('--title', default='Evaluation report')
+    args = parser.parse_args()
+    print(f"Report written to {write_report(args.database, args.output, args.title)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,282 @@
+import argparse
+import importlib
+import json
+import os
+import sys
+from contextlib import nullcontext
+
+# Runs an evaluation described by a YAML or JSON spec instead of a copy of an
+# exercise script. Heavy dependencies (kjr_llm, trulens, presidio) are imported
+# only for the features the spec uses, and nothing is imported before the spec
+# and its files have been checked. Runs are headless unless the spec or the
+# command line asks for the dashboard.
+#
+# How to use
+# python -m util.run_spec exercises/exercise6/spec-6a.yaml
+# python -m util.run_spec exercises/exercise6/spec-6a.yaml --dashboard
+# python -m util.run_spec exercises/exercise6/spec-6a.yaml --check   # validate only
+#
+# Spec keys (paths are relative to the spec file):
+# app_name: RAG_Application
+# reset_database: true
+# dashboard: false
+# export: true
+# report: true                # write report/report.html after the export, see util.report
+# accounting: true            # write accounting.json with the export, see util.accounting
+# target:
+#   wrapper: azure            # azure, azure_pii, ollama, ollama_pii or module:Class
+#   config: config-6a.json
+#   filter_pii: false         # pii wrappers only
+# provider: {model_name: gpt-3.5-turbo}
+# cascade: false              # cheap-first checks ahead of the judge, see util.cascade
+# suites:
+#   - name: Exercise6a-openai
+#     app_id: Exercise6a
+#     prompts: coherence-6a.json
+#     feedbacks: [Groundedness, ContextRelevance, AnswerRelevance, GroundTruthAgreement]
+#     chunk_size: 100         # optional, evaluates through util.runner.EvaluationRunner
+#   - library: Hate           # a predefined suite from kjr_llm.tests.lib
+#   - name: Exercise6a-load     # a load test, see util.load_test
+#     prompts: coherence-6a.json
+#     load: {users: 8, ramp_up: 10, thresholds: {p95_latency: 8.0, error_rate: 0.02}}
+
+WRAPPERS = {
+    "azure": "llm_application.azure_information_assistant_accelerator.wrapper:RAG_from_scratch",
+    "azure_pii": "llm_application.azure_information_assistant_accelerator.wrapper_pii:RAG_from_scratch",
+    "ollama": "llm_application.ollama.wrapper:RAG_from_scratch",
+    "ollama_pii": "llm_application.ollama.wrapper_pii:RAG_from_scratch",
+}
+FEEDBACKS = ("Groundedness", "ContextRelevance", "AnswerRelevance", "GroundTruthAgreement", "PIIDetection")
+
+
+class SpecError(ValueError):
+    pass
+
+
+def load_spec(path):
+    with open(path, 'r', encoding='utf-8') as file:
+        if path.endswith(('.yaml', '.yml')):
+            import yaml
+
+            spec = yaml.safe_load(file)
+        else:
+            spec = json.load(file)
+    spec["_directory"] = os.path.dirname(os.path.abspath(path))
+    return spec
+
+
+def _path(spec, path):
+    # Relative to the spec file, or to the working directory for specs not read by load_spec
+    return os.path.join(spec.get("_directory") or os.getcwd(), path)
+
+
+def check_spec(spec):
+    # Validate the spec and the files it names, without importing any evaluation dependency
+    target = spec.get("target") or {}
+    wrapper = target.get("wrapper", "azure")
+    if wrapper not in WRAPPERS and ":" not in wrapper:
+        raise SpecError(f"Unknown wrapper {wrapper}, expected one of {', '.join(WRAPPERS)} or module:Class")
+    if "config" in target and not os.path.exists(_path(spec, target["config"])):
+        raise SpecError(f"Target config {target['config']} not found")
+    suites = spec.get("suites") or []
+    if not suites:
+        raise SpecError("The spec has no suites")
+    for suite in suites:
+        if "library" in suite:
+            continue
+        for key in ("name", "prompts"):
+            if key not in suite:
+                raise SpecError(f"Suite {suite.get('name', suite)} has no {key}")
+        if not os.path.exists(_path(spec, suite["prompts"])):
+            raise SpecError(f"Prompt file {suite['prompts']} of suite {suite['name']} not found")
+        if "load" in suite and not isinstance(suite["load"], dict):
+            raise SpecError(f"Load test settings of suite {suite['name']} must be a mapping")
+        for feedback in suite.get("feedbacks", []):
+            if feedback not in FEEDBACKS:
+                raise SpecError(f"Unknown feedback {feedback} in suite {suite['name']}, expected one of {', '.join(FEEDBACKS)}")
+    return spec
+
+
+def _import(reference):
+    module_name, _, attribute = reference.partition(":")
+    return getattr(importlib.import_module(module_name), attribute)
+
+
+def build_engine(spec):
+    target = spec.get("target") or {}
+    wrapper = target.get("wrapper", "azure")
+    engine_class = _import(WRAPPERS.get(wrapper, wrapper))
+    kwargs = {}
+    if "config" in target:
+        with open(_path(spec, target["config"]), 'r') as file:
+            kwargs["config_data"] = json.load(file)
+    if target.get("filter_pii"):
+        kwargs["filter_pii"] = True
+    return engine_class(**kwargs)
+
+
+def build_provider(spec):
+    from kjr_llm.provider import OpenAIProvider
+
+    provider = OpenAIProvider(**(spec.get("provider") or {"model_name": "gpt-3.5-turbo"}))
+    if spec.get("cascade"):
+        from util.cascade import Cascade
+
+        spec["_cascade"] = Cascade()
+        provider = spec["_cascade"].wrap(provider)
+    return provider
+
+
+def build_feedbacks(names, prompts):
+    if not names:
+        return []
+    from trulens.core.schema import Select
+
+    query_path = Select.Record.app.query.args.query
+    context_path = Select.Record.app.retrieve.rets[:]
+    feedbacks = []
+    for name in names:
+        if name == "PIIDetection":
+            from trulens.core import Feedback
+            from util.pii_feedback import pii_detection_with_cot_reasons
+
+            feedbacks.append(Feedback(pii_detection_with_cot_reasons).on_output())
+            continue
+        metric = getattr(importlib.import_module("kjr_llm.metrics"), name)
+        if name == "Groundedness":
+            feedbacks.append(metric(context_path))
+        elif name == "ContextRelevance":
+            feedbacks.append(metric(query_path, context_path))
+        elif name == "GroundTruthAgreement":
+            feedbacks.append(metric(prompts))
+        else:
+            feedbacks.append(metric())
+    return feedbacks
+
+
+def build_app(spec):
+    from kjr_llm.app import App
+
+    return App(app_name=spec.get("app_name", "RAG_Application"), reset_database=spec.get("reset_database", True))
+
+
+class Builders:
+    # How run_spec creates the app, engine and provider, util.daemon keeps them warm between runs
+    def app(self, spec):
+        return build_app(spec)
+
+    def engine(self, spec):
+        return build_engine(spec)
+
+    def provider(self, spec):
+        return build_provider(spec)
+
+
+def run_spec(spec, dashboard=None, progress=print, builders=None):
+    check_spec(spec)
+    builders = builders or Builders()
+    app = builders.app(spec)
+    rag_chain = builders.engine(spec)
+    ledger = None
+    if spec.get("export", True) and spec.get("accounting", True):
+        from llm_application.ledger import RequestLedger
+
+        # A fresh ledger every run, util.daemon reuses the engine
+        rag_chain.ledger = ledger = RequestLedger()
+    evaluation = {}
+
+    def judged():
+        # Target and judge provider of the TestSets, a spec of load tests only needs neither
+        if not evaluation:
+            from kjr_llm.targets import CustomTarget
+
+            evaluation["target"] = CustomTarget(rag_chain)
+            evaluation["provider"] = builders.provider(spec)
+        return evaluation["target"], evaluation["provider"]
+
+    results = []
+    library_tests = []
+    for suite in spec["suites"]:
+        if "library" in suite:
+            _, provider = judged()
+            test = getattr(importlib.import_module("kjr_llm.tests.lib"), suite["library"])
+            test.default_provider = provider
+            library_tests.append(test)
+            continue
+
+        prompts_file = _path(spec, suite["prompts"])
+        app_id = suite.get("app_id", suite["name"])
+        if "load" in suite:
+            from util.load_test import LoadTestSet
+
+            progress(f"Load testing {suite['name']}")
+            load_test = LoadTestSet(prompts_file, suite["name"], **suite["load"])
+            results.append(load_test.evaluate(rag_chain, app_id))
+            continue
+
+        from kjr_llm.prompts import PromptSet
+        from kjr_llm.tests import TestSet
+
+        target, provider = judged()
+
+        def make_test(prompts, suite=suite):
+            return TestSet(prompts, build_feedbacks(suite.get("feedbacks"), prompts), name=suite["name"], default_provider=provider)
+
+        progress(f"Evaluating {suite['name']}")
+        with ledger.suite(app_id) if ledger is not None else nullcontext():
+            if "chunk_size" in suite:
+                from util.runner import EvaluationRunner
+
+                runner = EvaluationRunner(target, make_test, app_id, chunk_size=suite["chunk_size"],
+                                          max_workers=suite.get("max_workers", 1))
+                results.extend(runner.run(prompts_file))
+            else:
+                results.append(make_test(PromptSet.from_json_file(prompts_file)).evaluate(target, app_id))
+
+    if library_tests:
+        from util.multi_suite import evaluate_suites
+
+        progress(f"Evaluating {', '.join(test.name for test in library_tests)}")
+        results.extend(evaluate_suites(library_tests, judged()[0], rag_chain, app.app_name))
+
+    if "_cascade" in spec:
+        progress(spec["_cascade"].report())
+    # Export before the dashboard, which blocks until it is stopped
+    if spec.get("export", True):
+        from util.export import export_results
+
+        export_results(app, results, accounting_path="accounting.json" if ledger is not None else None, ledger=ledger)
+    if spec.get("report", False):
+        from util.report import write_report
+
+        progress(f"Report written to {write_report()}")
+    if dashboard if dashboard is not None else spec.get("dashboard", False):
+        app.run_dashboard()
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run an evaluation from a YAML or JSON spec")
+    parser.add_argument('spec')
+    parser.add_argument('--dashboard', action='store_true', default=None, help="run the dashboard after the evaluation")
+    parser.add_argument('--check', action='store_true', help="only validate the spec and its files")
+    args = parser.parse_args(argv)
+
+    try:
+        spec = check_spec(load_spec(args.spec))
+    except SpecError as e:
+        print(f"Invalid spec {args.spec}: {e}")
+        return 1
+    if args.check:
+        print(f"{args.spec} is valid: {len(spec['suites'])} suites")
+        return 0
+
+    from dotenv import load_dotenv, find_dotenv
+
+    load_dotenv(find_dotenv())
+    run_spec(spec, dashboard=args.dashboard)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,310 @@
+import json
+import os
+import tempfile
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from llm_application.budget import BudgetExceeded
+from util.accounting import JudgeCost
+from util.checkpoint import Checkpoint
+from util.context_dedup import install_rehydration, intern_contexts
+from util.prompt_stream import StreamingPromptSet, chunked
+from util.sharding import parse_shard, shard_of
+from util.trulens_results import delete_records, recorded_inputs
+
+# Runs a TestSet over a prompt stream in fixed size chunks, so evaluation
+# starts as soon as the first chunk is read and only one chunk of prompts is
+# held in memory at a time.
+#
+# How to use
+# def make_test(prompts):
+#     feedbacks = [Groundedness(context_path), GroundTruthAgreement(prompts)]
+#     return TestSet(prompts, feedbacks, name="Exercise4-openai", default_provider=provider)
+#
+# runner = EvaluationRunner(target, make_test, app_id="Exercise4a", chunk_size=100)
+# results = runner.run("relevance-4a.jsonl.gz")
+# app.export_result_to_file(results)
+#
+# The results of every chunk are kept for the export. For runs too large for
+# that, keep_results=False hands each chunk's results to on_result and drops
+# them, the records stay in the results database (see util.report and util.columnar).
+# runner = EvaluationRunner(target, make_test, "Exercise4a", keep_results=False)
+#
+# Checkpointing: progress is saved after every chunk. When resuming, completed
+# prompts are skipped and endpoint responses recorded in the checkpoint journal
+# are replayed, so pass the journal to the wrapper and keep the results database.
+# The checkpoint only covers whole chunks, so on resume the records the interrupted
+# chunks already wrote to results_database are reused: a prompt whose record has
+# all of its feedback results is counted as done, records still waiting for
+# feedback results are deleted and their prompts evaluated again.
+# checkpoint = Checkpoint("checkpoints/exercise4a")
+# rag_chain = RAG_from_scratch(config_data=config, transport=Transport(journal=checkpoint.journal()))
+# app = App(app_name="RAG_Application", reset_database=not resume)
+# runner = EvaluationRunner(target, make_test, "Exercise4a", chunk_size=10, checkpoint=checkpoint, resume=resume)
+#
+# Sharding: shard=(index, count) or "index/count" evaluates only the prompts of
+# that shard, see util.sharding for running and merging shards.
+#
+# Concurrency: max_workers chunks are evaluated at the same time. Pair it with
+# an AdaptiveLimiter on the wrapper's Transport (and limit_provider for the judge)
+# so the actual request concurrency follows what the endpoint can sustain.
+# The limiters passed in `limiters` are reported after every chunk.
+#
+# Context deduplication: with context_database set to the results database,
+# retrieved contexts of the finished records are interned after every chunk, and
+# records read back through trulens (the export) get the full text again.
+#
+# Profiling: with a SamplingProfiler (llm_application.profiling) the whole run is
+# sampled, or only profile_rate of the chunks. The per-stage flame graphs and the
+# top functions report are written to profile_directory when the run ends.
+#
+# Early stopping: should_stop is called with the runner after every chunk, once it
+# returns True no further chunks are started (see util.sequential.SequentialGate).
+#
+# Budgets: with a RunBudget (llm_application.budget) shared with the wrapper's
+# Transport and the judge provider, no chunk is started once the budget is spent,
+# chunks cancelled by it are left out of the checkpoint, and runner.report gives
+# the coverage of the partial run. Chunks that completed are kept and checkpointed,
+# only those aborted by the budget are cancelled (judge calls it refused are
+# recorded by trulens as failed feedbacks). A cost budget is checked against the
+# judge cost recorded in cost_database after every chunk.
+#
+# Columnar export: with a ColumnarExporter (util.columnar) the new records and
+# feedback results are appended to its Parquet dataset after every chunk.
+
+
+def to_prompt_set(prompts):
+    # Build a kjr_llm PromptSet from a list of prompt dicts, in memory
+    from kjr_llm.prompts import PromptSet
+
+    # Sampling fields such as category are not part of the PromptSet format
+    prompts = [{key: value for key, value in prompt.items() if key != 'category'} for prompt in prompts]
+    try:
+        from kjr_llm.prompts import Prompt
+
+        return PromptSet([Prompt(**prompt) for prompt in prompts])
+    except (ImportError, TypeError):
+        # kjr_llm versions that only build prompt sets from files
+        return _prompt_set_from_file(PromptSet, prompts)
+
+
+def _prompt_set_from_file(prompt_set, prompts):
+    fd, path = tempfile.mkstemp(suffix='.json')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as file:
+            json.dump(prompts, file)
+        return prompt_set.from_json_file(path)
+    finally:
+        os.remove(path)
+
+
+class EvaluationRunner:
+    def __init__(self, target, make_test, app_id, chunk_size=100, checkpoint=None, resume=False, shard=None,
+                 max_workers=1, limiters=(), context_database=None, profiler=None, profile_rate=1.0,
+                 profile_directory=None, should_stop=None, budget=None, cost_database="default.sqlite",
+                 exporter=None, keep_results=True, on_result=None, results_database="default.sqlite"):
+        self.target = target
+        self.make_test = make_test # called with a PromptSet, returns the TestSet to evaluate
+        self.app_id = app_id
+        self.chunk_size = chunk_size # also the checkpoint interval
+        if isinstance(checkpoint, (str, os.PathLike)):
+            checkpoint = Checkpoint(os.fspath(checkpoint))
+        self.checkpoint = checkpoint
+        self.resume = resume
+        if isinstance(shard, str):
+            shard = parse_shard(shard)
+        self.shard = shard
+        self.max_workers = max_workers
+        self.limiters = limiters
+        self.context_database = context_database
+        if context_database is not None:
+            install_rehydration()
+        self.profiler = profiler
+        self.profile_rate = profile_rate # fraction of the chunks profiled
+        self.profile_directory = profile_directory
+        self.should_stop = should_stop # called with the runner after every chunk, True stops the run
+        self.stopped_early = False
+        self.stop_reason = None
+        self.budget = budget
+        self.cost_database = cost_database
+        self.exporter = exporter
+        self.keep_results = keep_results # False returns no results, only on_result sees them
+        self.on_result = on_result # called with the results of every completed chunk
+        self.results_database = results_database # records of interrupted chunks are reused from it on resume
+        self._recorded = None # (judged, unjudged) records by input when resuming
+        self.cancelled = 0 # prompts of chunks cancelled by the budget
+        self._judge_cost = None # JudgeCost of the run with a cost budget
+        self.report = None
+        self.metrics = [] # limiter metrics after every chunk
+        self.completed = 0
+        self.skipped = 0
+
+    def _prompt_stream(self, prompts):
+        if isinstance(prompts, (str, os.PathLike)):
+            return StreamingPromptSet(os.fspath(prompts))
+        return prompts
+
+    def _shard_prompts(self, prompts):
+        # Number the prompts and drop those of other shards
+        for index, prompt in enumerate(self._prompt_stream(prompts)):
+            if self.shard is not None and shard_of(prompt, self.shard[1]) != self.shard[0]:
+                continue
+            yield index, prompt
+
+    def _pending_prompts(self, prompts):
+        # Drop the prompts completed in a previous run
+        for index, prompt in self._shard_prompts(prompts):
+            if self.checkpoint is not None and self.checkpoint.is_done(index):
+                self._take_recorded(prompt)
+                self.skipped += 1
+                continue
+            if self._recorded is not None and self._take_recorded(prompt, delete_unjudged=True):
+                # Recorded and judged by an interrupted chunk
+                self.checkpoint.mark_done([index])
+                self.skipped += 1
+                continue
+            yield index, prompt
+
+    def _take_recorded(self, prompt, delete_unjudged=False):
+        # Claim a judged record of the prompt's input, True when there was one
+        if self._recorded is None:
+            return False
+        judged, unjudged = self._recorded
+        text = prompt.get("input")
+        if judged.get(text):
+            judged[text].pop()
+            return True
+        if delete_unjudged and text in unjudged:
+            delete_records(self.results_database, unjudged.pop(text))
+        return False
+
+    def evaluate_chunk(self, chunk):
+        if self.budget is not None:
+            # A chunk queued before the budget was spent is cancelled before it starts
+            self.budget.check()
+        if self.profiler is not None and self.profile_rate < 1 and self.profiler.should_sample(self.profile_rate):
+            # Samples every thread while the chunk runs, including other chunks evaluated at the same time
+            with self.profiler.sampling():
+                return self._evaluate(chunk)
+        return self._evaluate(chunk)
+
+    def _evaluate(self, chunk):
+        test = self.make_test(to_prompt_set(chunk))
+        return test.evaluate(self.target, self.app_id)
+
+    def run(self, prompts):
+        # prompts can be a prompt file path or any iterable of prompt dicts
+        if self.checkpoint is not None:
+            if not self.resume:
+                self.checkpoint.reset()
+            elif self.checkpoint.info.get("app_id") not in (None, self.app_id):
+                raise ValueError(f"Checkpoint {self.checkpoint.directory} belongs to app {self.checkpoint.info['app_id']}")
+            self.checkpoint.info["app_id"] = self.app_id
+        self._recorded = None
+        if self.checkpoint is not None and self.resume and os.path.exists(self.results_database):
+            self._recorded = recorded_inputs(self.results_database, self.app_id)
+        self.skipped = 0
+        self.stopped_early = False
+        self.stop_reason = None
+        self.cancelled = 0
+        self._judge_cost = None
+        if self.budget is not None:
+            self.budget.start()
+            if self.budget.max_cost is not None:
+                self._judge_cost = JudgeCost(self.cost_database, self.app_id)
+
+        results = []
+        self.completed = 0
+        profile_run = self.profiler is not None and self.profile_rate >= 1
+        if profile_run:
+            self.profiler.start()
+        try:
+            self._run_chunks(prompts, results)
+        finally:
+            if profile_run:
+                self.profiler.stop()
+        if self.exporter is not None:
+            # Feedback results that finished after the last chunk
+            self.exporter.flush()
+        if self.skipped:
+            print(f"Resumed {self.app_id}: skipped {self.skipped} prompts completed in a previous run")
+        if self.profiler is not None and self.profile_directory is not None:
+            print(f"Profile of {self.app_id}: {self.profiler.write_report(self.profile_directory)}")
+        self.report = self._report(prompts)
+        if self.report["partial"]:
+            coverage = f"{self.report['coverage']:.0%}" if self.report["coverage"] is not None else "unknown"
+            print(f"{self.app_id}: partial run, {self.stop_reason}. {self.completed} prompts evaluated, coverage {coverage}")
+        return results
+
+    def _report(self, prompts):
+        total = None
+        # Count the prompts again when they can be read twice (a file or a list)
+        if isinstance(prompts, (str, os.PathLike, list, tuple)):
+            total = sum(1 for _ in self._shard_prompts(prompts))
+        done = self.completed + self.skipped
+        return {
+            "app_id": self.app_id,
+            "partial": self.stopped_early or bool(self.cancelled),
+            "reason": self.stop_reason,
+            "completed": self.completed,
+            "skipped": self.skipped,
+            "cancelled": self.cancelled,
+            "total": total,
+            "coverage": done / total if total else None,
+            "budget": self.budget.metrics() if self.budget is not None else None,
+        }
+
+    def _stop(self, reason):
+        if not self.stopped_early:
+            self.stopped_early = True
+            self.stop_reason = reason
+
+    def _run_chunks(self, prompts, results):
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            running = {}
+            for chunk in chunked(self._pending_prompts(prompts), self.chunk_size):
+                # Keep only a couple of chunks queued per worker so memory stays bounded
+                while len(running) >= 2 * self.max_workers and not self.stopped_early:
+                    self._collect(running, results)
+                if self.budget is not None and self.budget.cancelled:
+                    self._stop(self.budget.reason)
+                if self.stopped_early:
+                    break
+                indices = [index for index, _ in chunk]
+                future = pool.submit(self.evaluate_chunk, [prompt for _, prompt in chunk])
+                running[future] = indices
+            while running:
+                self._collect(running, results)
+
+    def _collect(self, running, results):
+        # Wait for at least one evaluated chunk and checkpoint it
+        done, _ = wait(running, return_when=FIRST_COMPLETED)
+        for future in done:
+            indices = running.pop(future)
+            try:
+                result = future.result()
+            except BudgetExceeded as e:
+                # Not checkpointed, a resumed run evaluates these prompts again
+                self.cancelled += len(indices)
+                self._stop(self.budget.reason if self.budget is not None else str(e))
+                continue
+            if self.on_result is not None:
+                self.on_result(result)
+            if self.keep_results:
+                results.append(result)
+            if self.checkpoint is not None:
+                self.checkpoint.mark_done(indices)
+            self.completed += len(indices)
+        if done and self.context_database is not None:
+            intern_contexts(self.context_database)
+        if done and self.exporter is not None:
+            self.exporter.flush()
+        if done and self.should_stop is not None and not self.stopped_early and self.should_stop(self):
+            self._stop("stopping condition met")
+        if done and self._judge_cost is not None and os.path.exists(self.cost_database):
+            self.budget.set_cost(self._judge_cost.update())
+        if self.limiters:
+            snapshot = [limiter.metrics() for limiter in self.limiters]
+            previous = self.metrics[-1] if self.metrics else None
+            self.metrics.append(snapshot)
+            if previous is None or [m['limit'] for m in previous] != [m['limit'] for m in snapshot]:
+                print(f"{self.app_id}: " + ", ".join(f"{m['name']} limit {m['limit']}" for m in snapshot))
@@ -0,0 +1,138 @@
+import math
+import random
+from collections import defaultdict
+from statistics import NormalDist
+
+from util.prompt_stream import StreamingPromptSet
+from util.trulens_results import app_rows, load_records
+
+# Statistical evaluation mode for fast gate runs.
+#
+# stratified_sample draws a fraction of the prompts from every category (the
+# "category" field written by GenerateTestPrompts.export_to_jsonl_file) and orders
+# them so that every prefix of the sample keeps the category proportions.
+#
+# SequentialGate stops an EvaluationRunner once every feedback is decided: the
+# confidence interval of its mean score lies above the threshold (pass) or below
+# threshold + tolerance (fail), so a metric only passes when it is confidently at
+# or above its threshold. The gate looks at the scores after every chunk, so each
+# look spends part of the error rate (1 - confidence): look k uses an interval at
+# level 1 - alpha * 6 / (pi^2 k^2), and the spent parts add up to alpha over any
+# number of looks. The confidence level therefore holds for the whole run, and the
+# report gives the achieved confidence adjusted for the number of looks.
+#
+# How to use
+# prompts = stratified_sample("generated_prompts.jsonl.gz", fraction=0.2)
+# gate = SequentialGate("Exercise5-gate", {"Groundedness": 0.8, "Answer Relevance": 0.7}, tolerance=0.05)
+# runner = EvaluationRunner(target, make_test, "Exercise5-gate", chunk_size=10, should_stop=gate)
+# results = runner.run(prompts)
+# print(gate.report())
+
+
+def stratified_sample(prompts, fraction=1.0, key="category", seed=0, min_per_category=1):
+    if isinstance(prompts, str):
+        prompts = StreamingPromptSet(prompts)
+    strata = defaultdict(list)
+    for prompt in prompts:
+        strata[prompt.get(key)].append(prompt)
+
+    rng = random.Random(seed)
+    positioned = []
+    for category, members in strata.items():
+        rng.shuffle(members)
+        count = min(len(members), max(min_per_category, math.ceil(fraction * len(members))))
+        # Spread each category evenly over the sample, so any prefix is stratified too
+        positioned.extend(((i + 0.5) / count, rng.random(), prompt) for i, prompt in enumerate(members[:count]))
+    positioned.sort(key=lambda item: item[:2])
+    return [prompt for _, _, prompt in positioned]
+
+
+def mean_interval(scores, confidence):
+    # Normal approximation of the confidence interval on the mean
+    n = len(scores)
+    mean = sum(scores) / n
+    if n < 2:
+        return mean, float('-inf'), float('inf'), float('inf')
+    variance = sum((score - mean) ** 2 for score in scores) / (n - 1)
+    standard_error = math.sqrt(variance / n)
+    half_width = NormalDist().inv_cdf(0.5 + confidence / 2) * standard_error
+    return mean, mean - half_width, mean + half_width, standard_error
+
+
+class SequentialGate:
+    def __init__(self, app_id, thresholds, tolerance=0.05, confidence=0.95, min_samples=30):
+        self.app_id = app_id
+        self.thresholds = thresholds # feedback name -> minimum mean score
+        self.tolerance = tolerance
+        self.confidence = confidence
+        self.min_samples = min_samples
+        self.looks = 0 # evaluations with enough samples for a verdict
+        self.status = {}
+
+    def spent(self, look):
+        # Part of the error rate spent on look k, the sum over all looks is 1 - confidence
+        return (1 - self.confidence) * 6 / (math.pi ** 2 * look ** 2)
+
+    def evaluate(self, records=None):
+        if records is None:
+            records, _ = load_records([self.app_id])
+        rows = app_rows(records, self.app_id)
+        scores = {name: [float(score) for score in rows[name].dropna()] if name in rows else []
+                  for name in self.thresholds}
+        if any(len(values) >= self.min_samples for values in scores.values()):
+            self.looks += 1
+        alpha = self.spent(max(self.looks, 1))
+        status = {}
+        for name, threshold in self.thresholds.items():
+            values = scores[name]
+            if not values:
+                status[name] = {"samples": 0, "verdict": "undecided"}
+                continue
+            mean, lower, upper, standard_error = mean_interval(values, 1 - alpha)
+            if len(values) < self.min_samples:
+                verdict = "undecided"
+            elif lower >= threshold:
+                verdict = "pass"
+            elif upper <= threshold + self.tolerance:
+                verdict = "fail"
+            else:
+                verdict = "undecided"
+            # Confidence at which the interval just excludes the threshold, adjusted for the looks taken
+            if standard_error in (0, float('inf')):
+                achieved = 1.0 if standard_error == 0 and mean != threshold else 0.0
+            else:
+                p_value = 2 * (1 - NormalDist().cdf(abs(mean - threshold) / standard_error))
+                achieved = max(0.0, 1 - p_value * (1 - self.confidence) / alpha)
+            status[name] = {
+                "samples": len(values), "mean": mean, "lower": lower, "upper": upper,
+                "threshold": threshold, "verdict": verdict, "achieved_confidence": achieved,
+            }
+        self.status = status
+        return status
+
+    def decided(self):
+        return bool(self.status) and all(entry["verdict"] != "undecided" for entry in self.status.values())
+
+    def __call__(self, runner):
+        # EvaluationRunner stop hook, called after every completed chunk
+        self.evaluate()
+        if self.decided():
+            print(f"{self.app_id}: all feedbacks decided after {runner.completed} prompts, stopping")
+            return True
+        return False
+
+    def passed(self):
+        return self.decided() and all(entry["verdict"] == "pass" for entry in self.status.values())
+
+    def report(self):
+        lines = [f"{self.app_id}: tolerance {self.tolerance}, confidence level {self.confidence} over {self.looks} looks"]
+        for name, entry in self.status.items():
+            if not entry["samples"]:
+                lines.append(f"  {name}: no scores")
+                continue
+            lines.append(
+                f"  {name}: {entry['verdict']}, mean {entry['mean']:.3f} "
+                f"[{entry['lower']:.3f}, {entry['upper']:.3f}] vs threshold {entry['threshold']} "
+                f"over {entry['samples']} prompts, achieved confidence {entry['achieved_confidence']:.3f}"
+            )
+        return "\n".join(lines)
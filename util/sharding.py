@@ -0,0 +1,158 @@
+import argparse
+import hashlib
+import multiprocessing
+import os
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+
+from util.context_dedup import PROGRESS_TABLE
+
+# Sharded evaluation: a prompt set is split deterministically into N shards,
+# each shard is evaluated in its own process (or on its own machine) with its
+# own local results database, and the shard databases are merged afterwards.
+#
+# How to use, in one process per shard:
+# def run_shard(index, count):
+#     app = App(app_name="RAG_Application", reset_database=True)
+#     runner = EvaluationRunner(target, make_test, "Exercise4a", shard=(index, count))
+#     return runner.run("relevance-4a.json")
+#
+# if __name__ == "__main__":
+#     results = run_shards(run_shard, count=4, workdir="shards")
+#     merge_databases(shard_databases("shards", 4), "default.sqlite")
+#     app = App(app_name="RAG_Application", reset_database=False)
+#     app.export_result_to_file(results)
+#
+# Across machines, run each shard with its own --shard i/N and then merge the
+# collected databases:
+# python -m util.sharding merge --output default.sqlite shard-0.sqlite shard-1.sqlite ...
+
+DATABASE_FILE = 'default.sqlite' # the default trulens results database
+
+
+def shard_of(prompt, count):
+    # The shard a prompt belongs to, based only on its input text.
+    # Identical inputs always land on the same shard, on every machine.
+    text = prompt.get('input', '') if isinstance(prompt, dict) else str(prompt)
+    digest = hashlib.sha1(text.encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big') % count
+
+
+def parse_shard(value):
+    # "2/8" -> (2, 8), shards are numbered from 0
+    index, count = (int(part) for part in value.split('/'))
+    if not 0 <= index < count:
+        raise ValueError(f"Shard index must be between 0 and {count - 1}, got {index}")
+    return index, count
+
+
+def shard_directory(workdir, index):
+    return os.path.join(workdir, f'shard-{index}')
+
+
+def shard_databases(workdir, count, database_file=DATABASE_FILE):
+    return [os.path.join(shard_directory(workdir, i), database_file) for i in range(count)]
+
+
+def _run_shard(job, index, count, directory):
+    # Each shard works in its own directory so it gets its own results database
+    os.makedirs(directory, exist_ok=True)
+    os.chdir(directory)
+    return job(index, count)
+
+
+def run_shards(job, count, workdir='shards', processes=None):
+    # Run job(index, count) for every shard in separate processes.
+    # job must be a module level function and its return value picklable.
+    # Each shard runs inside its own directory, so job should use absolute paths for its inputs.
+    workdir = os.path.abspath(workdir)
+    context = multiprocessing.get_context('spawn')
+    # A fresh process per shard: TruSession is a singleton bound to the first database
+    # it opens, so a reused worker would write the next shard into the previous one's database
+    with ProcessPoolExecutor(max_workers=processes or count, mp_context=context, max_tasks_per_child=1) as pool:
+        futures = [
+            pool.submit(_run_shard, job, index, count, shard_directory(workdir, index))
+            for index in range(count)
+        ]
+        results = []
+        for future in futures:
+            result = future.result()
+            if isinstance(result, list):
+                results.extend(result)
+            elif result is not None:
+                results.append(result)
+    return results
+
+
+def _tables(connection, schema):
+    rows = connection.execute(
+        f"SELECT name, sql FROM {schema}.sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'"
+    ).fetchall()
+    return {name: sql for name, sql in rows}
+
+
+def _indexes(connection, schema):
+    # Explicitly created indexes, sqlite's own autoindexes have no sql
+    rows = connection.execute(
+        f"SELECT name, sql FROM {schema}.sqlite_master WHERE type = 'index' AND sql IS NOT NULL"
+    ).fetchall()
+    return {name: sql for name, sql in rows}
+
+
+def _columns(connection, schema, table):
+    return [row[1] for row in connection.execute(f'PRAGMA {schema}.table_info("{table}")')]
+
+
+def merge_databases(shard_paths, output_path):
+    # Copy every row and index of the shard databases into output_path.
+    # Rows already present (same primary key, e.g. the shared app definition) are kept once.
+    connection = sqlite3.connect(output_path)
+    try:
+        for path in shard_paths:
+            if not os.path.exists(path):
+                raise FileNotFoundError(f"Shard database {path} not found")
+            if os.path.abspath(path) == os.path.abspath(output_path):
+                continue
+            connection.execute("ATTACH DATABASE ? AS shard", (path,))
+            try:
+                existing = _tables(connection, 'main')
+                for table, sql in _tables(connection, 'shard').items():
+                    if table == PROGRESS_TABLE:
+                        # Holds rowids of the shard's own tables, without it the next intern rescans the merged rows
+                        continue
+                    if table not in existing:
+                        connection.execute(sql)
+                    elif table == 'alembic_version':
+                        continue
+                    columns = [c for c in _columns(connection, 'shard', table) if c in _columns(connection, 'main', table)]
+                    column_list = ', '.join(f'"{c}"' for c in columns)
+                    connection.execute(
+                        f'INSERT OR IGNORE INTO main."{table}" ({column_list}) SELECT {column_list} FROM shard."{table}"'
+                    )
+                existing_indexes = _indexes(connection, 'main')
+                for index, sql in _indexes(connection, 'shard').items():
+                    if index not in existing_indexes:
+                        connection.execute(sql)
+                connection.commit()
+            finally:
+                connection.execute("DETACH DATABASE shard")
+    finally:
+        connection.close()
+    return output_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Merge sharded evaluation result databases")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    merge = subparsers.add_parser('merge', help="merge shard databases into one results database")
+    merge.add_argument('--output', default=DATABASE_FILE)
+    merge.add_argument('shards', nargs='+')
+    args = parser.parse_args()
+
+    if args.command == 'merge':
+        merge_databases(args.shards, args.output)
+        print(f"Merged {len(args.shards)} shard databases into {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,177 @@
+import itertools
+import json
+import threading
+
+from llm_application.concurrency import percentile
+from util.accounting import account
+from util.runner import EvaluationRunner
+from util.trulens_results import app_rows, load_records
+
+# Sweep of the Azure Information Assistant request overrides (top, response_length,
+# semantic_ranker, response_temp, ...) measuring latency and payload size against
+# the quality feedbacks.
+#
+# Every configuration of the grid is evaluated over the same prompts, one after the
+# other, each with at most max_workers chunks in flight. The report lists, per
+# configuration, p95 latency, response bytes, judge cost and the mean of every
+# feedback, marks the Pareto optimal configurations and recommends the one with the
+# lowest p95 latency that still meets the quality thresholds.
+#
+# How to use
+# grid = {"top": [3, 5], "response_length": [1024, 2048], "semantic_ranker": [True, False]}
+# def make_engine(overrides):
+#     return RAG_from_scratch(config_data={**config_data, "overrides": overrides})
+# results = run_sweep(make_engine, custom_test, prompts_file, grid, app_name="Sweep4a",
+#                     thresholds={"Groundedness": 0.8}, max_workers=2)
+# write_sweep_report(results, "sweep_report.json")
+
+
+def override_grid(grid):
+    # {"top": [3, 5], "response_temp": [0, 0.6]} -> [{"top": 3, "response_temp": 0}, ...]
+    keys = list(grid)
+    return [dict(zip(keys, values)) for values in itertools.product(*(grid[key] for key in keys))]
+
+
+def config_label(overrides):
+    return ",".join(f"{key}={value}" for key, value in overrides.items()) or "default"
+
+
+class _RequestProbe:
+    # Collects the transport details of every request an engine makes
+    def __init__(self, engine):
+        self.engine = engine
+        self.samples = []
+        self._lock = threading.Lock()
+        fetch = engine.fetch_response
+
+        def fetch_response(query):
+            response = fetch(query)
+            info = engine.transport.last_request_info()
+            with self._lock:
+                self.samples.append(info)
+            return response
+
+        engine.fetch_response = fetch_response
+
+    def metrics(self):
+        with self._lock:
+            samples = [info for info in self.samples if not info.get("replayed")]
+        latencies = [info["latency"] for info in samples if info.get("latency") is not None]
+        sizes = [info["response_bytes"] for info in samples if info.get("response_bytes") is not None]
+        return {
+            "requests": len(samples),
+            "p50_latency": percentile(latencies, 50),
+            "p95_latency": percentile(latencies, 95),
+            "response_bytes": sum(sizes),
+            "mean_response_bytes": sum(sizes) / len(sizes) if sizes else None,
+        }
+
+
+def judge_costs(app_ids, db_path="default.sqlite"):
+    # Cost of the feedback results per app id, total_cost of the records is the app's own cost
+    test_sets = account(db_path, app_ids=app_ids)["test_sets"]
+    return {app_id: float(test_sets[app_id]["judge"].get("cost", 0.0)) if app_id in test_sets else None
+            for app_id in app_ids}
+
+
+def feedback_scores(app_ids, db_path="default.sqlite"):
+    # Mean of every feedback and total judge cost per app id, from the trulens database
+    records, feedback_columns = load_records(app_ids, db_path)
+    costs = judge_costs(app_ids, db_path)
+    scores = {}
+    for app_id in app_ids:
+        rows = app_rows(records, app_id)
+        scores[app_id] = {
+            "records": len(rows),
+            "judge_cost": costs[app_id],
+            "feedbacks": {
+                column: float(rows[column].mean()) for column in feedback_columns
+                if column in rows and rows[column].notna().any()
+            },
+        }
+    return scores
+
+
+def pareto_front(results):
+    # Configurations not dominated on (p95 latency, bytes, judge cost, mean quality)
+    def objectives(result):
+        return (
+            result["p95_latency"] if result["p95_latency"] is not None else float('inf'),
+            result["response_bytes"],
+            result["judge_cost"] or 0.0,
+            -(result["quality"] if result["quality"] is not None else float('-inf')),
+        )
+
+    points = [objectives(result) for result in results]
+    front = []
+    for i, point in enumerate(points):
+        dominated = any(
+            all(a <= b for a, b in zip(other, point)) and other != point
+            for j, other in enumerate(points) if j != i
+        )
+        if not dominated:
+            front.append(results[i])
+    return front
+
+
+def passes(result, thresholds):
+    return all(result["feedbacks"].get(name, float('-inf')) >= minimum for name, minimum in thresholds.items())
+
+
+def run_sweep(make_engine, make_test, prompts, grid, app_name, thresholds=None, chunk_size=100, max_workers=2,
+              db_path="default.sqlite"):
+    # make_engine(overrides) returns a RAG_from_scratch, make_test(prompts) the TestSet as for EvaluationRunner
+    from kjr_llm.targets import CustomTarget
+
+    configs = override_grid(grid) if isinstance(grid, dict) else list(grid)
+    results = []
+    for overrides in configs:
+        label = config_label(overrides)
+        app_id = f"{app_name}-{label}"
+        engine = make_engine(overrides)
+        probe = _RequestProbe(engine)
+        runner = EvaluationRunner(CustomTarget(engine), make_test, app_id, chunk_size=chunk_size, max_workers=max_workers)
+        try:
+            runner.run(prompts)
+        finally:
+            # Stop the engine's stage worker processes before the next configuration starts its own
+            engine.close()
+        results.append({"config": label, "app_id": app_id, "overrides": overrides, **probe.metrics()})
+        print(f"Sweep {app_id}: p95 {results[-1]['p95_latency']}, {results[-1]['response_bytes']} bytes")
+
+    scores = feedback_scores([result["app_id"] for result in results], db_path)
+    for result in results:
+        score = scores[result["app_id"]]
+        result["judge_cost"] = score["judge_cost"]
+        result["feedbacks"] = score["feedbacks"]
+        values = list(score["feedbacks"].values())
+        result["quality"] = sum(values) / len(values) if values else None
+
+    front = {result["app_id"] for result in pareto_front(results)}
+    for result in results:
+        result["pareto"] = result["app_id"] in front
+        result["passes"] = passes(result, thresholds or {})
+    return results
+
+
+def recommend(results, objective="p95_latency"):
+    # The passing configuration with the lowest value of objective
+    candidates = [result for result in results if result["passes"] and result.get(objective) is not None]
+    return min(candidates, key=lambda result: result[objective]) if candidates else None
+
+
+def write_sweep_report(results, path, objective="p95_latency"):
+    best = recommend(results, objective)
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump({"recommended": best["config"] if best else None, "objective": objective, "configs": results},
+                  file, indent=2)
+
+    print(f"{'config':<48} {'p95 s':>8} {'bytes':>10} {'cost':>8} {'quality':>8}  pareto  passes")
+    for result in sorted(results, key=lambda result: (not result["pareto"], result["p95_latency"] or float('inf'))):
+        p95 = f"{result['p95_latency']:.2f}" if result["p95_latency"] is not None else "-"
+        cost = f"{result['judge_cost']:.4f}" if result["judge_cost"] is not None else "-"
+        quality = f"{result['quality']:.3f}" if result["quality"] is not None else "-"
+        print(f"{result['config']:<48} {p95:>8} {result['response_bytes']:>10} {cost:>8} {quality:>8}  "
+              f"{'yes' if result['pareto'] else '':<6}  {'yes' if result['passes'] else 'no'}")
+    print(f"Recommended: {best['config'] if best else 'no configuration meets the thresholds'}")
+    return path
@@ -3,6 +3,7 @@ import json
 from langchain_openai import ChatOpenAI
 from langchain_core.output_parsers import StrOutputParser
 from trulens.benchmark.generate.generate_test_set import GenerateTestSet
+from util.prompt_stream import iter_prompts, resolve_prompt_file, write_jsonl
 
 class GenerateTestPrompts:
     def __init__(self, llm=None, chain=None, model="gpt-3.5-turbo", temperature=0, prompt_file=''):
@@ -13,14 +14,21 @@ class GenerateTestPrompts:
         self.prompts = self._load_prompts()
         self.example_inputs = self._extract_inputs()
 
+    def _prompt_path(self):
+        current_file_dir = os.path.dirname(os.path.abspath('__file__'))
+        return resolve_prompt_file(os.path.join(current_file_dir, self.prompt_file))
+
     def _load_prompts(self):
-        # Load prompts from a JSON file
+        # Load prompts from a .json, .jsonl or .jsonl.gz file
         if self.prompt_file == '':
             return [{}]
-        current_file_dir = os.path.dirname(os.path.abspath('__file__'))
-        full_path = os.path.join(current_file_dir, self.prompt_file + '.json')
-        with open(full_path, 'r') as file:
-            return json.load(file)
+        return list(iter_prompts(self._prompt_path()))
+
+    def stream_prompts(self):
+        # Iterate over the prompts of the prompt file without holding them in memory
+        if self.prompt_file == '':
+            return iter([{}])
+        return iter_prompts(self._prompt_path())
 
     def _extract_inputs(self):
         # Extract input values from the loaded prompts
@@ -79,10 +87,25 @@ class GenerateTestPrompts:
             outfile.write(json.dumps(json_prompt, indent=4))
         return json_prompt
 
+    def export_to_jsonl_file(self, test_set=None, filename="generated_prompts", compress=True):
+        # Export the generated prompts as JSON Lines, one prompt per line, with their category for stratified sampling
+        if test_set is None:
+            test_set = self.test_set
+        prompts = (
+            {"input": i, "expected_output": None, "category": category}
+            for category in test_set
+            for i in test_set[category]
+        )
+        path = filename + ('.jsonl.gz' if compress else '.jsonl')
+        write_jsonl(prompts, path)
+        return path
+
     
 # How to use
 # generator = GenerateTestPrompts()
 # generated_prompts = generator.generate_test_prompts(test_breadth=2,test_depth=1)
 # print(generated_prompts)
 # Generate a file "generated_prompts.json" with the generated prompts formatted.
-# generator.export_to_json_file(generated_prompts)
\ No newline at end of file
+# generator.export_to_json_file(generated_prompts)
+# For large sets write "generated_prompts.jsonl.gz" instead, it can be streamed by util.runner.EvaluationRunner
+# generator.export_to_jsonl_file(generated_prompts)
\ No newline at end of file
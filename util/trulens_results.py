@@ -0,0 +1,106 @@
+import json
+import os
+import sqlite3
+
+# Reading evaluation results back from the trulens database
+
+FINISHED = ("done", "failed", "skipped")
+
+
+def finished(status):
+    # trulens stores its FeedbackResultStatus enum, as "done" or "FeedbackResultStatus.DONE"
+    status = str(status).lower()
+    return any(state in status for state in FINISHED)
+
+
+def sqlite_path(db):
+    # File of a trulens SQLAlchemyDB, None for other databases
+    engine = getattr(db, 'engine', None)
+    if engine is None or not engine.url.drivername.startswith('sqlite'):
+        return None
+    return engine.url.database
+
+
+def load_records(app_ids=None, db_path=None):
+    # (records DataFrame, feedback column names) of every app in the database, or only of app_ids.
+    # Reads the TruSession's database, or the sqlite file db_path.
+    # Contexts deduplicated by util.context_dedup are read back with their full text.
+    from util.context_dedup import rehydrate_frame
+
+    if db_path is None:
+        from trulens.core import TruSession
+
+        connector = TruSession().connector
+        db_path = sqlite_path(connector.db)
+    else:
+        from trulens.core.database.connector import DefaultDBConnector
+
+        connector = DefaultDBConnector(database_url=f"sqlite:///{os.path.abspath(db_path)}")
+    if app_ids is None:
+        records, feedback_columns = connector.get_records_and_feedback()
+    else:
+        # app_ids are the given names, trulens 1.x identifies the apps by a hash
+        ids = [app["app_id"] for app in connector.get_apps() if app["app_id"] in app_ids or app.get("app_name") in app_ids]
+        records, feedback_columns = connector.get_records_and_feedback(app_ids=ids or list(app_ids))
+    if db_path is not None:
+        records = rehydrate_frame(records, db_path)
+    return records, feedback_columns
+
+
+def app_rows(records, app_id):
+    # trulens 1.x keeps the given name in app_name, older versions in app_id
+    column = "app_name" if "app_name" in records and (records["app_name"] == app_id).any() else "app_id"
+    return records[records[column] == app_id]
+
+
+def table_name(connection, name):
+    # trulens 1.x prefixes its tables with trulens_
+    names = {row[0] for row in connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    for candidate in ('trulens_' + name, name):
+        if candidate in names:
+            return candidate
+    raise ValueError(f"No trulens {name} table found")
+
+
+def recorded_inputs(db_path, app_id):
+    # (judged, unjudged) records of an app by input: input -> record ids. Judged records
+    # have feedback results and all of them finished, the others were left by an interrupted run
+    connection = sqlite3.connect(db_path)
+    try:
+        records = table_name(connection, 'records')
+        feedbacks = table_name(connection, 'feedbacks')
+        apps = table_name(connection, 'apps')
+        columns = {row[1] for row in connection.execute(f"PRAGMA table_info({apps})")}
+        app_ids = [app_id]
+        if "app_name" in columns:
+            app_ids += [row[0] for row in connection.execute(f"SELECT app_id FROM {apps} WHERE app_name = ?", (app_id,))]
+        rows = connection.execute(
+            f"""SELECT r.record_id, r.input, f.status FROM {records} r
+                LEFT JOIN {feedbacks} f ON f.record_id = r.record_id
+                WHERE r.app_id IN ({', '.join('?' * len(app_ids))}) ORDER BY r.rowid""",
+            app_ids
+        ).fetchall()
+    finally:
+        connection.close()
+    inputs, complete = {}, {}
+    for record_id, text, status in rows:
+        inputs[record_id] = json.loads(text) if text else text
+        complete[record_id] = complete.get(record_id, True) and status is not None and finished(status)
+    judged, unjudged = {}, {}
+    for record_id, text in inputs.items():
+        (judged if complete[record_id] else unjudged).setdefault(text, []).append(record_id)
+    return judged, unjudged
+
+
+def delete_records(db_path, record_ids):
+    # Delete records and their feedback results
+    connection = sqlite3.connect(db_path)
+    try:
+        records = table_name(connection, 'records')
+        feedbacks = table_name(connection, 'feedbacks')
+        with connection:
+            for record_id in record_ids:
+                connection.execute(f"DELETE FROM {feedbacks} WHERE record_id = ?", (record_id,))
+                connection.execute(f"DELETE FROM {records} WHERE record_id = ?", (record_id,))
+    finally:
+        connection.close()